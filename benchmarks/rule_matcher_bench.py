@@ -0,0 +1,130 @@
+"""
+规则匹配基准：逐条匹配 vs RuleMatcher（多模式匹配器）
+
+在项目根目录运行：
+    python benchmarks/rule_matcher_bench.py
+    python benchmarks/rule_matcher_bench.py --sizes 10,100,1000,5000 --messages 2000
+"""
+import argparse
+import importlib.util
+import os
+import random
+import re
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _load_rule_matcher():
+    """按文件路径加载 plugins/rule_matcher（不经过 plugins/__init__，后者依赖应用的其它包）"""
+    path = os.path.join(ROOT, "plugins", "rule_matcher", "__init__.py")
+    spec = importlib.util.spec_from_file_location("rule_matcher", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+RuleMatcher = _load_rule_matcher().RuleMatcher
+
+
+class BenchRule:
+    __slots__ = ("name", "pattern", "rule_type", "priority", "compiled")
+
+    def __init__(self, name, pattern, rule_type="regex", priority=0):
+        self.name = name
+        self.pattern = pattern
+        self.rule_type = rule_type
+        self.priority = priority
+        self.compiled = re.compile(pattern) if rule_type != "keyword" else None
+
+
+def make_rules(n: int, rng: random.Random):
+    """按插件常见写法生成规则：命令式锚定正则为主，夹杂关键词、完全匹配与无字面量正则"""
+    rules = []
+    for i in range(n):
+        kind = rng.random()
+        priority = rng.randint(0, 5)
+        if kind < 0.45:
+            rules.append(BenchRule(f"cmd{i}", rf"^指令{i}(?:\s+(.*))?$", "regex", priority))
+        elif kind < 0.60:
+            rules.append(BenchRule(f"find{i}", rf"订单{i}号(\d+)", "regex", priority))
+        elif kind < 0.80:
+            rules.append(BenchRule(f"kw{i}", f"关键词{i}", "keyword", priority))
+        elif kind < 0.95:
+            rules.append(BenchRule(f"exact{i}", f"菜单{i}", "fullmatch", priority))
+        else:
+            rules.append(BenchRule(f"any{i}", rf"(?i)^hello{i}\b", "regex", priority))
+    return rules
+
+
+def make_messages(n: int, rule_count: int, rng: random.Random):
+    messages = []
+    for _ in range(n):
+        i = rng.randrange(max(rule_count, 1))
+        messages.append(rng.choice([
+            f"指令{i} 参数",
+            f"帮我查一下订单{i}号12345",
+            f"今天的关键词{i}是什么",
+            f"菜单{i}",
+            f"HELLO{i} world",
+            "普通聊天消息，什么规则都不命中",
+        ]))
+    return messages
+
+
+def naive_match(rules, text):
+    """逐条匹配：每条消息对全部规则运行一遍"""
+    matched = []
+    for rule in rules:
+        if rule.rule_type == "keyword":
+            ok = rule.pattern in text
+        elif rule.rule_type in RuleMatcher.EXACT_TYPES:
+            ok = rule.compiled.fullmatch(text) is not None
+        else:
+            ok = rule.compiled.search(text) is not None
+        if ok:
+            matched.append(rule)
+    return matched
+
+
+def run(sizes, message_count, seed):
+    print(f"{'规则数':>8} {'构建(ms)':>10} {'逐条(us/条)':>12} {'匹配器(us/条)':>14} {'加速':>8} {'候选正则/条':>12}")
+    for size in sizes:
+        rng = random.Random(seed)
+        rules = make_rules(size, rng)
+        messages = make_messages(message_count, size, rng)
+        ordered = sorted(rules, key=lambda r: -r.priority)
+
+        matcher = RuleMatcher()
+        started = time.perf_counter()
+        matcher.add_rules(rules)
+        matcher.match("")
+        build_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        expected = [naive_match(ordered, text) for text in messages]
+        naive_us = (time.perf_counter() - started) / message_count * 1e6
+
+        started = time.perf_counter()
+        actual = [matcher.match(text) for text in messages]
+        matcher_us = (time.perf_counter() - started) / message_count * 1e6
+
+        for text, want, got in zip(messages, expected, actual):
+            if [r.name for r in want] != [r.name for r in got]:
+                raise AssertionError(f"结果不一致: {text!r}\n逐条: {[r.name for r in want]}\n匹配器: {[r.name for r in got]}")
+
+        regex_runs = sum(1 for text in messages for idx in matcher.candidates(text) if idx in matcher._regexes)
+        print(f"{size:>8} {build_ms:>10.1f} {naive_us:>12.1f} {matcher_us:>14.1f} {naive_us / matcher_us:>7.1f}x {regex_runs / message_count:>12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10,100,500,1000,5000", help="规则数量，逗号分隔")
+    parser.add_argument("--messages", type=int, default=2000, help="每档测试的消息条数")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    run([int(x) for x in args.sizes.split(",") if x.strip()], args.messages, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -10,13 +10,22 @@ import inspect
 import re
 import json
 import ast
-from typing import Dict, Any, List
+import copy
+import hashlib
+from typing import Dict, Any, List, Callable
 from pathlib import Path
 import importlib
-from functools import partial
-import runpy
+from functools import partial, wraps
 from concurrent.futures import ThreadPoolExecutor
 import contextvars
+import threading
+import builtins
+import multiprocessing
+import pickle
+import queue
+import signal
+import atexit
+import time
 
 from storage.bucket import BucketManager
 from rule_engine.rule_engine import RuleEngine, Rule
@@ -53,6 +62,562 @@ class Plugin:
         self.rules = rules
         self.is_loaded = is_loaded
         self.file_path = file_path
+        # 热重载用：加载时的代码指纹与规则元数据常量
+        self.code_hash = None
+        self.rule_meta = {}
+
+class ScriptCodeCache:
+    """
+    ATM 兼容脚本的编译缓存。
+    以 (路径, mtime, size) 为键缓存编译后的 code 对象和 __main__ 命名空间模板，
+    每次调用只执行已编译的字节码，替代 runpy.run_path 的读文件 + 编译。
+    """
+    def __init__(self):
+        self._entries: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def _load(self, path: str, mtime_ns: int, size: int):
+        with open(path, "rb") as f:
+            source = f.read()
+        tree = ast.parse(source, filename=path)
+        code = compile(tree, path, "exec")
+        # 预导入脚本顶层 import 的模块，使执行时的 import 语句只需查 sys.modules
+        for node in tree.body:
+            names = []
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                names = [node.module]
+            for mod_name in names:
+                try:
+                    importlib.import_module(mod_name)
+                except Exception:
+                    pass
+        template = {
+            "__name__": "__main__",
+            "__file__": path,
+            "__cached__": None,
+            "__doc__": None,
+            "__loader__": None,
+            "__package__": None,
+            "__spec__": None,
+            "__builtins__": builtins,
+        }
+        entry = (mtime_ns, size, code, template)
+        with self._lock:
+            self._entries[path] = entry
+        return entry
+
+    def get(self, path: str):
+        """获取脚本的 (code, 命名空间模板)，文件变化时重新编译"""
+        st = os.stat(path)
+        entry = self._entries.get(path)
+        if entry is None or entry[0] != st.st_mtime_ns or entry[1] != st.st_size:
+            entry = self._load(path, st.st_mtime_ns, st.st_size)
+        return entry[2], entry[3]
+
+    def run(self, path: str) -> Dict[str, Any]:
+        """以 __main__ 身份执行脚本，返回脚本的全局命名空间（与 runpy.run_path 一致）"""
+        code, template = self.get(path)
+        namespace = dict(template)
+        exec(code, namespace)
+        return namespace
+
+    def invalidate(self, path: str = None):
+        """移除指定脚本（或全部）的缓存"""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(path, None)
+
+
+
+def parse_legacy_headers(content: str) -> Dict[str, Any]:
+    """解析插件源码中的兼容头注释 #[key: value]"""
+    result = {
+        "version": None,
+        "plugin_class": None,
+        "platform": None,
+        "description": None,
+        "rules": [],
+        "admin": None,
+        "priority": None,
+        "im_type": None,
+        "lazy": None,
+        "params": []
+    }
+
+    for m in re.finditer(r"^\s*#\s*\[(\w+)\s*:\s*(.*?)\]\s*$", content, re.MULTILINE):
+        key = str(m.group(1) or "").strip().lower()
+        raw = str(m.group(2) or "").strip()
+        if key == "version":
+            result["version"] = raw
+        elif key == "class":
+            result["plugin_class"] = raw
+        elif key == "platform":
+            result["platform"] = raw
+        elif key == "description":
+            result["description"] = raw
+        elif key == "rule":
+            if raw:
+                result["rules"].append(raw)
+        elif key == "admin":
+            result["admin"] = raw.lower() in ("1", "true", "yes", "on")
+        elif key == "priority":
+            try:
+                result["priority"] = int(raw)
+            except Exception:
+                result["priority"] = 0
+        elif key == "imtype":
+            result["im_type"] = raw
+        elif key == "lazy":
+            result["lazy"] = raw.lower() in ("1", "true", "yes", "on")
+        elif key == "param":
+            parsed = None
+            try:
+                parsed = json.loads(raw)
+            except Exception:
+                try:
+                    parsed = ast.literal_eval(raw)
+                except Exception:
+                    parsed = None
+            if isinstance(parsed, dict):
+                result["params"].append(parsed)
+
+    return result
+
+
+class PluginCatalog:
+    """
+    插件元数据目录。
+    从源码的模块级 __xxx__ 常量与兼容头注释静态解析元数据（不执行模块），
+    以 (路径, mtime, size) 为键缓存，文件未变化时列出插件只是内存读取。
+    指定 index_path 时目录持久化为 JSON 索引，重启后只重新解析有变化的文件。
+    """
+    _SYSTEM_RE = re.compile(r"^\s*__system__\s*=\s*True", re.MULTILINE)
+    INDEX_VERSION = 5
+    # 只影响自动生成规则的元数据，常量赋值不计入代码指纹（改这些时热重载无需重新执行模块）
+    RULE_META_KEYS = ("__pattern__", "__rule_type__", "__priority__", "__rule_name__", "__rule_description__")
+    # 声明了 __import_in_thread__ = True 的插件，模块顶层出现这些调用时仍在事件循环线程中导入
+    # （创建事件循环相关对象、asyncio 同步原语、aiohttp 会话等）
+    _LOOP_BOUND_CALLS = frozenset({
+        "get_event_loop", "get_running_loop", "new_event_loop", "set_event_loop",
+        "create_task", "ensure_future", "run_until_complete", "run", "signal",
+        "Lock", "Event", "Condition", "Semaphore", "BoundedSemaphore", "Queue", "Future",
+        "ClientSession", "TCPConnector",
+    })
+
+    def __init__(self, index_path: str = None):
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.index_path = index_path
+        self._dirty = False
+        if index_path:
+            self._load_index()
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if not isinstance(data, dict) or data.get("version") != self.INDEX_VERSION:
+            return
+        entries = data.get("entries")
+        if isinstance(entries, dict):
+            self._entries = {path: entry for path, entry in entries.items() if isinstance(entry, dict)}
+
+    def save(self):
+        """有变化时把目录写回索引文件（先写临时文件再替换）"""
+        if not self.index_path or not self._dirty:
+            return
+        with self._lock:
+            data = {"version": self.INDEX_VERSION, "entries": dict(self._entries)}
+            self._dirty = False
+        tmp_path = f"{self.index_path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.index_path)
+        except (OSError, TypeError, ValueError):
+            self._dirty = True
+
+    def prune(self, paths):
+        """移除不在 paths 中的条目（插件文件已删除）"""
+        keep = {os.path.abspath(str(p)) for p in paths}
+        with self._lock:
+            for path in [p for p in self._entries if p not in keep]:
+                del self._entries[path]
+                self._dirty = True
+
+    @staticmethod
+    def _jsonable(value: Any) -> bool:
+        try:
+            json.dumps(value)
+            return True
+        except (TypeError, ValueError):
+            return False
+
+    @classmethod
+    def parse_source(cls, source: str, path: str = "<plugin>") -> Dict[str, Any]:
+        """解析模块级 __xxx__ = 常量 赋值，返回 {"meta": {...}, "is_system": bool}"""
+        meta: Dict[str, Any] = {}
+        imports: List[str] = []
+        thread_safe = True
+        # 模块顶层是否定义 rules / register（决定规则能否只凭头信息注册），无法解析时为 None
+        has_rules = has_register = False
+        try:
+            tree = ast.parse(source, filename=path)
+        except SyntaxError:
+            tree = None
+            thread_safe = False
+            has_rules = has_register = None
+        if tree is not None:
+            for node in tree.body:
+                # 记录完整模块名；from x import y 同时记录 x.y（y 可能是子模块）
+                if isinstance(node, ast.Import):
+                    imports.extend(alias.name for alias in node.names)
+                elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                    imports.append(node.module)
+                    imports.extend(f"{node.module}.{alias.name}" for alias in node.names if alias.name != "*")
+                if thread_safe and not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                    for sub in ast.walk(node):
+                        if isinstance(sub, ast.Call):
+                            func = sub.func
+                            called = func.attr if isinstance(func, ast.Attribute) else getattr(func, "id", None)
+                            if called in cls._LOOP_BOUND_CALLS:
+                                thread_safe = False
+                                break
+                if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name == "register":
+                    has_register = True
+                if isinstance(node, ast.Assign):
+                    targets, value = node.targets, node.value
+                elif isinstance(node, ast.AnnAssign) and node.value is not None:
+                    targets, value = [node.target], node.value
+                else:
+                    continue
+                for target in targets:
+                    if isinstance(target, ast.Name) and target.id in ("rules", "register"):
+                        has_rules = has_rules or target.id == "rules"
+                        has_register = has_register or target.id == "register"
+                    if isinstance(target, ast.Name) and target.id.startswith("__") and target.id.endswith("__"):
+                        try:
+                            literal = ast.literal_eval(value)
+                        except (ValueError, TypeError, SyntaxError, MemoryError, RecursionError):
+                            continue
+                        # 只保留可写入索引的值
+                        if cls._jsonable(literal):
+                            meta[target.id] = literal
+        # 代码指纹：AST 去掉规则元数据常量后的哈希（注释与头信息本就不在 AST 中）
+        code_hash = None
+        if tree is not None:
+            body = [node for node in tree.body if not cls._is_rule_meta_literal(node)]
+            code_hash = hashlib.sha1(ast.dump(ast.Module(body=body, type_ignores=[])).encode("utf-8")).hexdigest()
+        if "__system__" in meta:
+            is_system = meta["__system__"] is True
+        else:
+            is_system = bool(cls._SYSTEM_RE.search(source))
+        # 线程导入需插件显式声明 __import_in_thread__ = True
+        if meta.get("__import_in_thread__") is not True:
+            thread_safe = False
+        return {"meta": meta, "is_system": is_system, "legacy": parse_legacy_headers(source),
+                "imports": sorted(set(imports)), "thread_safe": thread_safe,
+                "has_rules": has_rules, "has_register": has_register, "code_hash": code_hash}
+
+    @classmethod
+    def _is_rule_meta_literal(cls, node) -> bool:
+        if isinstance(node, ast.Assign):
+            targets, value = node.targets, node.value
+        elif isinstance(node, ast.AnnAssign) and node.value is not None:
+            targets, value = [node.target], node.value
+        else:
+            return False
+        if not all(isinstance(t, ast.Name) and t.id in cls.RULE_META_KEYS for t in targets):
+            return False
+        try:
+            ast.literal_eval(value)
+        except (ValueError, TypeError, SyntaxError, MemoryError, RecursionError):
+            return False
+        return True
+
+    def get(self, path: str) -> Dict[str, Any]:
+        """获取插件文件的元数据条目，文件变化时重新解析"""
+        path = os.path.abspath(str(path))
+        st = os.stat(path)
+        entry = self._entries.get(path)
+        if entry is not None and entry["mtime_ns"] == st.st_mtime_ns and entry["size"] == st.st_size:
+            return entry
+        with open(path, "r", encoding="utf-8") as f:
+            source = f.read()
+        entry = self.parse_source(source, path)
+        entry["mtime_ns"] = st.st_mtime_ns
+        entry["size"] = st.st_size
+        with self._lock:
+            self._entries[path] = entry
+            self._dirty = True
+        return entry
+
+    def invalidate(self, path: str = None):
+        """移除指定文件（或全部）的缓存"""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(os.path.abspath(str(path)), None)
+            self._dirty = True
+
+
+# ATM 进程池默认配置，可在 plugin_manager 桶的 atm_process_pool 键中覆盖
+# 等待空闲工作进程的最长时间（秒），超时抛出异常而不是让调用线程一直阻塞
+ATM_POOL_ACQUIRE_TIMEOUT = 120
+
+ATM_PROCESS_POOL_DEFAULTS = {
+    "enabled": False,
+    "workers": 4,          # 工作进程数
+    "time_limit": 60,      # 单次脚本执行的墙钟时间上限（秒），不含等待 ATM 接口调用（如 /input 等用户输入）的时间
+    "cpu_limit": 0,        # 单次脚本执行的 CPU 时间上限（秒），0 表示不限制
+    "preload": ["json", "re", "time", "requests"],  # 工作进程预导入的模块
+}
+
+# 插件目录热重载默认配置，可在 plugin_manager 桶的 hot_reload 键中覆盖
+HOT_RELOAD_DEFAULTS = {
+    "enabled": False,
+    "interval": 1.0,   # 轮询间隔（秒）
+    "debounce": 0.5,   # 文件最后一次变化后等待多久再重载（秒）
+}
+
+# lazy 插件激活后空闲多久（秒）卸载模块，可在 plugin_manager 桶的 lazy_idle_ttl 键中覆盖，0 表示不卸载
+LAZY_IDLE_TTL_DEFAULT = 600
+
+
+def _atm_worker_main(conn, preload: List[str]):
+    """
+    ATM 工作进程入口。
+    循环接收脚本执行任务，脚本内的 ATM 接口调用经管道转发回主进程处理。
+    """
+    for mod_name in preload:
+        try:
+            importlib.import_module(mod_name)
+        except Exception:
+            pass
+
+    atm_module = sys.modules[Middleware.__module__]
+
+    def _remote_dispatch(path, data):
+        conn.send(("call", path, data))
+        return conn.recv()
+
+    atm_module.set_atm_remote_dispatch(_remote_dispatch)
+
+    try:
+        import resource
+    except ImportError:
+        resource = None
+
+    def _on_cpu_limit(signum, frame):
+        raise TimeoutError("ATM 脚本超出 CPU 时间限制")
+
+    if resource is not None and hasattr(signal, "SIGXCPU"):
+        signal.signal(signal.SIGXCPU, _on_cpu_limit)
+
+    try:
+        from middleware.atm_context import set_current_context
+    except Exception:
+        set_current_context = None
+
+    code_cache = ScriptCodeCache()
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            break
+        if job[0] == "stop":
+            break
+
+        _, script_path, message, cpu_limit = job
+        if set_current_context:
+            try:
+                set_current_context(None, message)
+            except Exception:
+                pass
+
+        error = None
+        old_limit = None
+        try:
+            if resource is not None and cpu_limit:
+                usage = resource.getrusage(resource.RUSAGE_SELF)
+                old_limit = resource.getrlimit(resource.RLIMIT_CPU)
+                soft = int(usage.ru_utime + usage.ru_stime + cpu_limit) + 1
+                resource.setrlimit(resource.RLIMIT_CPU, (soft, old_limit[1]))
+            code_cache.run(script_path)
+        except SystemExit:
+            # ATM 插件里常见 exit()/sys.exit()
+            pass
+        except BaseException as e:
+            error = f"{type(e).__name__}: {e}"
+        finally:
+            if old_limit is not None:
+                resource.setrlimit(resource.RLIMIT_CPU, old_limit)
+
+        try:
+            conn.send(("done", error))
+        except (EOFError, OSError):
+            break
+
+
+class _AtmWorker:
+    __slots__ = ("process", "conn")
+
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+
+
+class AtmProcessPool:
+    """
+    ATM 兼容脚本的预热工作进程池。
+    工作进程由预导入了常用模块的 forkserver 派生（无 forkserver 的平台使用 spawn），
+    脚本在独立进程中运行，不再争抢主进程 GIL；脚本里的 ATM 接口调用
+    （/sendText、/bucketGet、/input ...）通过管道转发回主进程，由 _atm_framework_dispatch 处理。
+    """
+    def __init__(self, workers: int = 4, time_limit: float = 60, cpu_limit: float = 0, preload: List[str] = None):
+        self.size = max(1, int(workers))
+        self.time_limit = float(time_limit or 0)
+        self.cpu_limit = float(cpu_limit or 0)
+        self.preload = list(preload or [])
+        self.logger = get_logger("atm_process_pool")
+        methods = multiprocessing.get_all_start_methods()
+        self._ctx = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        self._idle: "queue.Queue[_AtmWorker]" = queue.Queue()
+        self._started = False
+        self._lock = threading.Lock()
+        # 应用退出时兜底停止工作进程（PluginManager.shutdown 会先主动停止）
+        atexit.register(self.shutdown)
+
+    def start(self):
+        """预先派生全部工作进程"""
+        with self._lock:
+            if self._started:
+                return
+            if self._ctx.get_start_method() == "forkserver":
+                self._ctx.set_forkserver_preload(self.preload + [__name__])
+            for _ in range(self.size):
+                self._idle.put(self._spawn())
+            self._started = True
+        self.logger.info(f"ATM 进程池已启动，工作进程数: {self.size}")
+
+    def _spawn(self) -> _AtmWorker:
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(
+            target=_atm_worker_main,
+            args=(child_conn, self.preload),
+            name="atm_worker",
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        return _AtmWorker(process, parent_conn)
+
+    def _discard(self, worker: _AtmWorker):
+        try:
+            worker.conn.close()
+        except Exception:
+            pass
+        if worker.process.is_alive():
+            worker.process.kill()
+        worker.process.join(timeout=1)
+
+    @staticmethod
+    def _portable_message(message: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            pickle.dumps(message)
+            return message
+        except Exception:
+            return json.loads(json.dumps(message, ensure_ascii=False, default=str))
+
+    def run(self, script_path: str, message: Dict[str, Any], dispatch: Callable):
+        """
+        在工作进程中执行脚本（阻塞，需在线程中调用）。
+        :param script_path: 脚本路径
+        :param message: 触发脚本的消息
+        :param dispatch: 处理脚本 ATM 接口调用的函数 (path, data) -> response
+        """
+        if not self._started:
+            self.start()
+
+        worker = self._acquire()
+        healthy = False
+        try:
+            worker.conn.send(("run", script_path, self._portable_message(message or {}), self.cpu_limit))
+            deadline = time.monotonic() + self.time_limit if self.time_limit > 0 else None
+            while True:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and (remaining <= 0 or not worker.conn.poll(remaining)):
+                    raise TimeoutError(f"ATM 脚本执行超时（{self.time_limit:g} 秒）: {script_path}")
+                kind, *payload = worker.conn.recv()
+                if kind == "call":
+                    path, data = payload
+                    call_started = time.monotonic()
+                    try:
+                        response = dispatch(path, data)
+                    except Exception as e:
+                        response = {"code": 500, "data": None, "message": str(e)}
+                    worker.conn.send(response)
+                    if deadline is not None:
+                        # 时间上限只计脚本自身的执行时间，主进程处理调用（例如 /input 等待用户）期间暂停计时
+                        deadline += time.monotonic() - call_started
+                elif kind == "done":
+                    healthy = True
+                    if payload[0]:
+                        raise RuntimeError(payload[0])
+                    return
+        except TimeoutError:
+            raise
+        except (EOFError, OSError) as e:
+            raise RuntimeError(f"ATM 工作进程异常退出: {script_path}, {e}") from e
+        finally:
+            if not healthy:
+                # 超时或进程崩溃的工作进程直接回收，补一个新的；派生失败时放回占位，下次取用时再派生
+                self._discard(worker)
+                try:
+                    worker = self._spawn()
+                except Exception as e:
+                    self.logger.error(f"ATM 工作进程派生失败，将在下次使用时重试: {e}")
+                    worker = None
+            self._idle.put(worker)
+
+    def _acquire(self) -> _AtmWorker:
+        """取一个空闲工作进程；取到的是占位（之前派生失败）时现在派生"""
+        try:
+            worker = self._idle.get(timeout=ATM_POOL_ACQUIRE_TIMEOUT)
+        except queue.Empty:
+            raise RuntimeError(f"等待 ATM 工作进程超过 {ATM_POOL_ACQUIRE_TIMEOUT} 秒") from None
+        if worker is None:
+            try:
+                worker = self._spawn()
+            except Exception:
+                self._idle.put(None)
+                raise
+        return worker
+
+    def shutdown(self):
+        """停止所有工作进程"""
+        with self._lock:
+            while True:
+                try:
+                    worker = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                if worker is None:
+                    continue
+                try:
+                    worker.conn.send(("stop",))
+                except Exception:
+                    pass
+                self._discard(worker)
+            self._started = False
+
 
 class PluginManager:
     """插件管理器"""
@@ -64,8 +629,43 @@ class PluginManager:
         self.scheduler = scheduler
         self.plugins: Dict[str, Plugin] = {}
         self.logger = get_logger("plugin_manager")
+        # ATM 兼容脚本的编译缓存
+        self.script_code_cache = ScriptCodeCache()
+        # 插件元数据目录，列出插件时不再执行插件/核心中间件源码
+        # 索引文件放在插件目录旁边，例如 plugins/ -> .plugins_catalog.json
+        plugins_root = os.path.abspath(self.plugins_dir)
+        catalog_index = os.path.join(os.path.dirname(plugins_root), f".{os.path.basename(plugins_root)}_catalog.json")
+        self.plugin_catalog = PluginCatalog(catalog_index)
+        self._core_plugin_cache = None
+        # 启动加载报告：{插件名: {"mode", "import_ms", "register_ms", "total_ms", "ok", "error"}}
+        self.load_report: Dict[str, Dict[str, Any]] = {}
+        self._deferred_load_task = None
+        # lazy 插件：规则按头信息以占位处理器注册，首次命中时才导入模块
+        # {插件名: {"rules": [规则名], "lock", "last_used", "inflight", "activations"}}
+        self.lazy_plugins: Dict[str, Dict[str, Any]] = {}
+        try:
+            self.lazy_idle_ttl = float(self.bucket_manager.get_sync('plugin_manager', 'lazy_idle_ttl', default=LAZY_IDLE_TTL_DEFAULT) or 0)
+        except (TypeError, ValueError):
+            self.lazy_idle_ttl = LAZY_IDLE_TTL_DEFAULT
+        self._lazy_sweep_task = None
+        self._watch_task = None
+        # 插件 -> 已注册到规则引擎的 Rule 对象，注销/热替换时不再扫描全部规则
+        self._plugin_rules: Dict[str, List[Rule]] = {}
+        # 可选的 ATM 进程池模式，配置见 ATM_PROCESS_POOL_DEFAULTS
+        pool_cfg = dict(ATM_PROCESS_POOL_DEFAULTS)
+        pool_cfg.update(self.bucket_manager.get_sync('plugin_manager', 'atm_process_pool', default={}) or {})
+        self.atm_process_pool = None
+        if pool_cfg.get("enabled"):
+            self.atm_process_pool = AtmProcessPool(
+                workers=pool_cfg.get("workers"),
+                time_limit=pool_cfg.get("time_limit"),
+                cpu_limit=pool_cfg.get("cpu_limit"),
+                preload=pool_cfg.get("preload"),
+            )
         # ATM 兼容脚本单独线程池，隔离 requests/time.sleep 对其它插件的影响
-        self.atm_legacy_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="atm_legacy")
+        # 进程池模式下，这些线程负责转发工作进程的 ATM 接口调用
+        atm_threads = max(8, self.atm_process_pool.size) if self.atm_process_pool else 8
+        self.atm_legacy_executor = ThreadPoolExecutor(max_workers=atm_threads, thread_name_prefix="atm_legacy")
 
         try:
             Path(self.plugins_dir).mkdir(parents=True, exist_ok=True)
@@ -134,96 +734,405 @@ class PluginManager:
         #[description: xxx]
         #[rule: ^test$]
         #[param: {...}]
+        结果来自插件元数据目录，文件未变化时不再重新读取源码。
         """
-        result = {
-            "version": None,
-            "plugin_class": None,
-            "platform": None,
-            "description": None,
-            "rules": [],
-            "admin": None,
-            "priority": None,
-            "im_type": None,
-            "params": []
-        }
         try:
-            with open(plugin_path, "r", encoding="utf-8") as f:
-                content = f.read()
+            return copy.deepcopy(self.plugin_catalog.get(plugin_path)["legacy"])
         except Exception:
-            return result
+            return parse_legacy_headers("")
 
-        for m in re.finditer(r"^\s*#\s*\[(\w+)\s*:\s*(.*?)\]\s*$", content, re.MULTILINE):
-            key = str(m.group(1) or "").strip().lower()
-            raw = str(m.group(2) or "").strip()
-            if key == "version":
-                result["version"] = raw
-            elif key == "class":
-                result["plugin_class"] = raw
-            elif key == "platform":
-                result["platform"] = raw
-            elif key == "description":
-                result["description"] = raw
-            elif key == "rule":
-                if raw:
-                    result["rules"].append(raw)
-            elif key == "admin":
-                result["admin"] = raw.lower() in ("1", "true", "yes", "on")
-            elif key == "priority":
-                try:
-                    result["priority"] = int(raw)
-                except Exception:
-                    result["priority"] = 0
-            elif key == "imtype":
-                result["im_type"] = raw
-            elif key == "param":
-                parsed = None
-                try:
-                    parsed = json.loads(raw)
-                except Exception:
-                    try:
-                        parsed = ast.literal_eval(raw)
-                    except Exception:
-                        parsed = None
-                if isinstance(parsed, dict):
-                    result["params"].append(parsed)
+    async def _run_atm_script(self, plugin_path: str, message: Dict[str, Any]):
+        """
+        以 __main__ 身份执行 ATM 兼容脚本。
+        默认在 atm_legacy_executor 线程中执行；启用进程池时交给工作进程，
+        线程只负责转发脚本的 ATM 接口调用。
+        """
+        loop = asyncio.get_running_loop()
+        ctx = contextvars.copy_context()
+
+        if self.atm_process_pool is not None:
+            atm_module = sys.modules[Middleware.__module__]
+            await loop.run_in_executor(
+                self.atm_legacy_executor,
+                lambda: ctx.run(self.atm_process_pool.run, plugin_path, message, atm_module._atm_framework_dispatch)
+            )
+            return
 
-        return result
+        def _run_script():
+            try:
+                return self.script_code_cache.run(plugin_path)
+            except SystemExit:
+                # ATM 插件里常见 exit()/sys.exit()，这里吞掉避免终止整个框架
+                return None
+
+        await loop.run_in_executor(
+            self.atm_legacy_executor,
+            lambda: ctx.run(_run_script)
+        )
 
     async def load_all_plugins(self):
         """加载所有未被禁用的插件"""
         self.logger.info("开始加载所有插件...")
+        if self.atm_process_pool is not None:
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self.atm_process_pool.start)
+            except Exception as e:
+                self.logger.error(f"ATM 进程池启动失败，回退到线程模式: {e}", exc_info=True)
+                self.atm_process_pool = None
         if not os.path.exists(self.plugins_dir):
             self.logger.warning(f"插件目录 {self.plugins_dir} 不存在，跳过加载外部插件。")
             return
 
-        tasks = []
+        names = []
         for filename in os.listdir(self.plugins_dir):
             if filename.endswith(".py") and not filename.startswith("__"):
                 plugin_name = filename[:-3]
                 if plugin_name in self.disabled_plugins_bucket:
                     self.logger.info(f"插件 {plugin_name} 已被禁用，跳过加载。")
                     continue
-                tasks.append(self.load_plugin(plugin_name))
-        await asyncio.gather(*tasks)
+                names.append(plugin_name)
+
+        # 1. 并行预解析所有插件头（已缓存的只是 stat）
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        paths = {name: os.path.join(self.plugins_dir, f"{name}.py") for name in names}
+        results = await asyncio.gather(
+            *(loop.run_in_executor(None, self.plugin_catalog.get, path) for path in paths.values()),
+            return_exceptions=True
+        )
+        entries = {name: entry for name, entry in zip(paths, results) if isinstance(entry, dict)}
+        self.logger.info(f"插件头解析完成，共 {len(names)} 个，耗时 {(time.perf_counter() - started) * 1000:.0f}ms")
+
+        # 2. 分组：标记 lazy 的插件延后；被其它插件导入或顶层依赖事件循环的插件在主线程按顺序导入；其余在线程中并行导入
+        imported_by_others = set()
+        for name, entry in entries.items():
+            imported_by_others.update(m for m in self._imported_plugin_names(entry.get("imports", ())) if m != name)
+        serial, threaded, deferred = [], [], []
+        for name in names:
+            entry = entries.get(name)
+            if entry is None:
+                serial.append(name)
+            elif self._wants_lazy(entry):
+                deferred.append(name)
+            elif name in imported_by_others or not entry.get("thread_safe", False):
+                serial.append(name)
+            else:
+                threaded.append(name)
+
+        for name in serial:
+            await self.load_plugin(name)
+        await asyncio.gather(*(self.load_plugin(name, import_in_thread=True) for name in threaded))
+        self.plugin_catalog.save()
+
+        # lazy 插件能从头信息得到规则的只注册占位规则，其余在启动完成后于后台加载
+        background = []
+        for name in deferred:
+            if not await self._register_lazy_plugin(name, entries[name]):
+                background.append(name)
+        if len(background) < len(deferred):
+            self.logger.info(f"以下插件按需激活，首次命中规则时导入: {', '.join(n for n in deferred if n not in background)}")
+        if background:
+            self.logger.info(f"以下插件标记为 lazy，将在启动完成后于后台加载: {', '.join(background)}")
+            self._deferred_load_task = loop.create_task(self._load_deferred_plugins(background))
+
+        hot_reload = dict(HOT_RELOAD_DEFAULTS)
+        hot_reload.update(self.bucket_manager.get_sync('plugin_manager', 'hot_reload', default={}) or {})
+        if hot_reload.get("enabled"):
+            self.start_plugin_watcher(hot_reload.get("interval"), hot_reload.get("debounce"))
+
+        slowest = sorted(self.load_report.items(), key=lambda kv: kv[1].get("total_ms", 0), reverse=True)[:5]
+        if slowest:
+            self.logger.info("启动最慢的插件: " + ", ".join(f"{n} {r.get('total_ms', 0):.0f}ms" for n, r in slowest))
         self.logger.info("所有插件加载完毕。")
 
-    async def load_plugin(self, name: str) -> bool:
-        """加载单个插件"""
-        if name in self.plugins and self.plugins[name].is_loaded:
+    async def _load_deferred_plugins(self, names: List[str]):
+        """启动完成后在后台逐个加载 lazy 插件"""
+        for name in names:
+            if name in self.plugins or name in self.disabled_plugins_bucket:
+                continue
+            await self.load_plugin(name, import_in_thread=self._thread_import_allowed(name), mode="deferred")
+        self.plugin_catalog.save()
+
+    @staticmethod
+    def _imported_plugin_names(imports) -> set:
+        """从完整模块名中取出可能是插件的名字：顶层模块名，以及 plugins.xxx 形式中的 xxx"""
+        names = set()
+        for module_name in imports:
+            parts = module_name.split(".")
+            names.add(parts[0])
+            if parts[0] == "plugins" and len(parts) > 1:
+                names.add(parts[1])
+        return names
+
+    def _thread_import_allowed(self, name: str) -> bool:
+        """插件是否声明了 __import_in_thread__ = True 且顶层代码不依赖事件循环"""
+        try:
+            entry = self.plugin_catalog.get(os.path.join(self.plugins_dir, f"{name}.py"))
+        except Exception:
+            return False
+        return bool(entry.get("thread_safe", False))
+
+    @staticmethod
+    def _wants_lazy(entry: Dict[str, Any]) -> bool:
+        """插件是否标记为 lazy（__lazy__ = True 或 #[lazy: true]，系统插件除外）"""
+        return not entry.get("is_system") and (entry["meta"].get("__lazy__") is True or bool(entry.get("legacy", {}).get("lazy")))
+
+    @staticmethod
+    def _auto_rule_specs(legacy: Dict[str, Any], get_meta: Callable[[str, Any], Any]):
+        """
+        插件未提供 rules 时自动生成的规则定义（不含 handler），load_plugin 与 lazy 占位规则共用。
+        优先使用 #[rule:] 头注释，其次 __pattern__ 等元数据；get_meta(key, default) 读取模块级元数据。
+        :return: (来源 "legacy" | "meta", 规则定义列表)，没有可生成的规则时为 (None, [])
+        """
+        if legacy.get("rules"):
+            default_priority = legacy.get("priority", 0)
+            rule_dicts = []
+            for i, pattern in enumerate(legacy["rules"], 1):
+                rule_item = {
+                    "name": f"legacy_rule_{i}",
+                    "pattern": pattern,
+                    "rule_type": "regex",
+                    "priority": default_priority if isinstance(default_priority, int) else 0,
+                    "description": legacy.get("description", "")
+                }
+                if legacy.get("admin") is not None:
+                    rule_item["__admin__"] = bool(legacy["admin"])
+                if legacy.get("im_type"):
+                    rule_item["__imType__"] = legacy["im_type"]
+                rule_dicts.append(rule_item)
+            return "legacy", rule_dicts
+
+        raw_patterns = get_meta("__pattern__", None)
+        if isinstance(raw_patterns, str):
+            patterns = [raw_patterns] if raw_patterns.strip() else []
+        elif isinstance(raw_patterns, (list, tuple)):
+            patterns = [str(x) for x in raw_patterns if str(x).strip()]
+        else:
+            patterns = []
+        if not patterns:
+            return None, []
+        try:
+            priority = int(get_meta("__priority__", 0) or 0)
+        except (TypeError, ValueError):
+            priority = 0
+        rule_type = str(get_meta("__rule_type__", "regex") or "regex")
+        rule_desc = str(get_meta("__rule_description__", get_meta("__description__", legacy.get("description", ""))) or "")
+        base_rule_name = str(get_meta("__rule_name__", "meta_rule") or "meta_rule")
+        return "meta", [{
+            "name": base_rule_name if len(patterns) == 1 else f"{base_rule_name}_{i}",
+            "pattern": pattern,
+            "rule_type": rule_type,
+            "priority": priority,
+            "description": rule_desc,
+        } for i, pattern in enumerate(patterns, 1)]
+
+    def _lazy_rule_dicts(self, entry: Dict[str, Any]):
+        """
+        根据元数据目录推导 lazy 插件的规则（与 load_plugin 的自动生成规则一致），不含 handler。
+        模块自行定义 rules/register 或没有可用的头规则时返回 None。
+        """
+        if entry.get("has_rules") is not False or entry.get("has_register") is not False:
+            return None
+        meta = entry.get("meta") or {}
+        _, rule_dicts = self._auto_rule_specs(entry.get("legacy") or {}, meta.get)
+        return rule_dicts or None
+
+    async def _register_lazy_plugin(self, name: str, entry: Dict[str, Any]) -> bool:
+        """以占位处理器注册 lazy 插件的规则，模块在首次命中时导入"""
+        rule_dicts = self._lazy_rule_dicts(entry)
+        if not rule_dicts:
+            return False
+        started = time.perf_counter()
+        meta = entry.get("meta") or {}
+        legacy = entry.get("legacy") or {}
+        plugin_admin = bool(meta.get("__admin__", legacy.get("admin") or False))
+        plugin_im_types = meta.get("__imType__", legacy.get("im_type"))
+
+        stub_rules = []
+        for rule_dict in rule_dicts:
+            async def _lazy_rule_handler(*args, _plugin=name, _rule=rule_dict["name"], **kwargs):
+                return await self._call_lazy_rule(_plugin, _rule, args, kwargs)
+            rule_dict["handler"] = _lazy_rule_handler
+            stub_rules.append(self._make_plugin_rule(name, rule_dict, plugin_admin, plugin_im_types))
+        await self._add_plugin_rules(name, stub_rules)
+
+        self.lazy_plugins[name] = {"rules": [r["name"] for r in rule_dicts], "lock": asyncio.Lock(),
+                                   "last_used": 0.0, "inflight": 0, "activations": 0}
+        elapsed = round((time.perf_counter() - started) * 1000, 2)
+        self.load_report[name] = {"mode": "lazy", "import_ms": 0.0, "register_ms": elapsed,
+                                  "total_ms": elapsed, "ok": True, "error": None}
+        self.logger.debug(f"为 lazy 插件 {name} 注册了 {len(rule_dicts)} 条占位规则。")
+        return True
+
+    async def _activate_lazy_plugin(self, name: str):
+        """导入 lazy 插件模块（已导入则直接返回），返回插件对象，失败返回 None"""
+        state = self.lazy_plugins.get(name)
+        if state is None or name in self.disabled_plugins_bucket:
+            return None
+        plugin = self.plugins.get(name)
+        if plugin is not None and plugin.is_loaded:
+            return plugin
+        async with state["lock"]:
+            if name in self.disabled_plugins_bucket:
+                return None
+            plugin = self.plugins.get(name)
+            if plugin is None or not plugin.is_loaded:
+                if not await self.load_plugin(name, import_in_thread=self._thread_import_allowed(name), mode="lazy"):
+                    return None
+                state["activations"] += 1
+                plugin = self.plugins[name]
+                self.logger.info(f"lazy 插件 {name} 已激活（第 {state['activations']} 次）。")
+        state["last_used"] = time.monotonic()
+        if self.lazy_idle_ttl > 0 and (self._lazy_sweep_task is None or self._lazy_sweep_task.done()):
+            self._lazy_sweep_task = asyncio.get_running_loop().create_task(self._lazy_sweep_loop())
+        return plugin
+
+    async def _call_lazy_rule(self, name: str, rule_name: str, args, kwargs):
+        """占位规则处理器：激活插件后转发给真实的规则处理器"""
+        state = self.lazy_plugins.get(name)
+        plugin = await self._activate_lazy_plugin(name)
+        if plugin is None:
+            return None
+        handler = next((r.get("handler") for r in plugin.rules if r.get("name") == rule_name), None)
+        if handler is None:
+            self.logger.warning(f"lazy 插件 {name} 导入后没有规则 {rule_name}，已忽略本次命中。")
+            return None
+        state["inflight"] += 1
+        try:
+            result = handler(*args, **kwargs)
+            if inspect.isawaitable(result):
+                result = await result
+            return result
+        finally:
+            state["inflight"] -= 1
+            state["last_used"] = time.monotonic()
+
+    async def _lazy_sweep_loop(self):
+        """定期卸载空闲超过 lazy_idle_ttl 的 lazy 插件模块（占位规则保留）"""
+        interval = max(1.0, min(60.0, self.lazy_idle_ttl / 2))
+        while self.lazy_idle_ttl > 0:
+            await asyncio.sleep(interval)
+            active = [n for n in self.lazy_plugins if n in self.plugins]
+            if not active:
+                return
+            now = time.monotonic()
+            for name in active:
+                state = self.lazy_plugins.get(name)
+                if state is None or state["inflight"] or now - state["last_used"] < self.lazy_idle_ttl:
+                    continue
+                async with state["lock"]:
+                    if state["inflight"] or name not in self.plugins:
+                        continue
+                    if await self.unload_plugin(name, keep_rules=True):
+                        self.logger.info(f"lazy 插件 {name} 空闲超过 {self.lazy_idle_ttl:.0f}s，已卸载模块。")
+
+    def get_load_report(self) -> List[Dict[str, Any]]:
+        """插件加载耗时报告（按总耗时降序），供面板展示"""
+        rows = [dict(report, name=name) for name, report in self.load_report.items()]
+        rows.sort(key=lambda r: r.get("total_ms", 0), reverse=True)
+        return rows
+
+    def _import_plugin_module(self, name: str, plugin_path: str, fresh: bool = False):
+        """
+        执行插件模块源码（可在工作线程中调用）
+        执行期间模块已在 sys.modules 中（dataclass、pickle 等按模块名查找），执行失败时恢复原来的条目。
+        :param fresh: 在新的模块对象中执行（热重载用，旧模块对象保持不变）；
+                      成功后 sys.modules 指向新模块，切换失败时由调用方恢复
+        """
+        spec = importlib.util.spec_from_file_location(name, plugin_path)
+        module = importlib.util.module_from_spec(spec)
+
+        if not fresh and name in sys.modules:
+            return importlib.reload(sys.modules[name])
+        previous = sys.modules.get(name)
+        sys.modules[name] = module
+        try:
+            spec.loader.exec_module(module)
+        except BaseException:
+            if previous is not None:
+                sys.modules[name] = previous
+            else:
+                sys.modules.pop(name, None)
+            raise
+        return module
+
+    def _build_auto_rules(self, name: str, module: Any, legacy_meta: Dict[str, Any], plugin_path: str):
+        """插件未提供 rules 时，根据 #[rule:] 头注释或 __pattern__ 自动生成 module.rules"""
+        if getattr(module, "rules", None):
+            return
+        source, rule_dicts = self._auto_rule_specs(legacy_meta, lambda key, default: getattr(module, key, default))
+        if source == "legacy":
+            # 兼容 #[rule:]：优先使用模块中的常见入口函数
+            candidate_handler = None
+            for fn_name in ("handle_message", "on_message", "handler", "main", "run"):
+                fn = getattr(module, fn_name, None)
+                if callable(fn):
+                    candidate_handler = fn
+                    break
+            if candidate_handler is None:
+                # 兼容 ATM 脚本风格（仅有 if __name__ == '__main__': 入口）
+                async def _legacy_script_handler(_msg, _mw, _plugin_path=plugin_path):
+                    try:
+                        await self._run_atm_script(_plugin_path, _msg)
+                    except BaseException as e:
+                        # 兼容脚本异常只记录，不影响框架主流程
+                        self.logger.error(f"ATM legacy script failed: {_plugin_path}, error: {e}", exc_info=True)
+                    return None
+                candidate_handler = _legacy_script_handler
+            for rule_item in rule_dicts:
+                rule_item["handler"] = candidate_handler
+            module.rules = rule_dicts
+        elif source == "meta":
+            # __pattern__ 元数据：命中时按 ATM 脚本方式执行插件
+            #   __pattern__ = r"..." / ["...", "..."]
+            #   __rule_type__ = "regex" | "keyword" | "exact"（默认 regex）
+            #   __priority__ / __rule_name__ / __rule_description__
+            async def _meta_pattern_script_handler(_msg, _mw, _plugin_path=plugin_path):
+                try:
+                    await self._run_atm_script(_plugin_path, _msg)
+                except BaseException as e:
+                    self.logger.error(f"Pattern script plugin failed: {_plugin_path}, error: {e}", exc_info=True)
+                return None
+            for rule_item in rule_dicts:
+                rule_item["handler"] = _meta_pattern_script_handler
+            module.rules = rule_dicts
+        elif hasattr(module, "__pattern__"):
+            self.logger.warning(f"插件 {name} 的 __pattern__ 没有可用的 pattern，未生成规则。")
+
+    async def load_plugin(self, name: str, import_in_thread: bool = False, mode: str = None, replace: bool = False) -> bool:
+        """
+        加载单个插件
+        :param import_in_thread: 在工作线程中执行模块导入（register 等仍在事件循环中执行）
+        :param replace: 替换已加载的同名插件（热重载）。新模块执行且 register 成功后，才调用旧模块的 unload 钩子
+                        并切换元数据、处理器与规则；失败时调用新模块的 unload 钩子，旧版本继续生效
+        """
+        old_plugin = self.plugins.get(name) if replace else None
+        if old_plugin is None and name in self.plugins and self.plugins[name].is_loaded:
             self.logger.warning(f"插件 {name} 已经加载。")
             return True
 
+        report = {"mode": mode or ("thread" if import_in_thread else "main"), "import_ms": 0.0,
+                  "register_ms": 0.0, "total_ms": 0.0, "ok": False, "error": None}
+        self.load_report[name] = report
+        started = time.perf_counter()
+        module = None
+        committed = False  # 热重载：新模块是否已切换上线
         try:
             plugin_path = os.path.join(self.plugins_dir, f"{name}.py")
             legacy_meta = self._parse_legacy_plugin_headers(plugin_path)
-            spec = importlib.util.spec_from_file_location(name, plugin_path)
-            module = importlib.util.module_from_spec(spec)
-
-            if name in sys.modules:
-                module = importlib.reload(sys.modules[name])
+            if import_in_thread:
+                try:
+                    module = await asyncio.get_running_loop().run_in_executor(
+                        None, self._import_plugin_module, name, plugin_path, replace)
+                except Exception as e:
+                    # 顶层代码可能依赖事件循环，退回主线程再导入一次
+                    self.logger.warning(f"插件 {name} 在线程中导入失败（{e}），改为在主线程中导入。")
+                    report["mode"] = "main"
+                    module = self._import_plugin_module(name, plugin_path, fresh=replace)
             else:
-                spec.loader.exec_module(module)
-                sys.modules[name] = module
+                module = self._import_plugin_module(name, plugin_path, fresh=replace)
+            imported = time.perf_counter()
+            report["import_ms"] = round((imported - started) * 1000, 2)
 
             # 注入 middleware 到插件模块
             module.middleware = self.middleware
@@ -244,132 +1153,48 @@ class PluginManager:
             if legacy_meta.get("params") and not hasattr(module, "__param__"):
                 module.__param__ = legacy_meta["params"]
 
-            # 兼容 #[rule:]：当插件未提供 rules 时自动生成规则
-            if legacy_meta.get("rules") and not getattr(module, "rules", None):
-                candidate_handler = None
-                for fn_name in ("handle_message", "on_message", "handler", "main", "run"):
-                    fn = getattr(module, fn_name, None)
-                    if callable(fn):
-                        candidate_handler = fn
-                        break
-                if candidate_handler is None:
-                    # 兼容 ATM 脚本风格（仅有 if __name__ == '__main__': 入口）
-                    async def _legacy_script_handler(_msg, _mw, _plugin_path=plugin_path):
-                        loop = asyncio.get_running_loop()
-                        def _run_legacy_script():
-                            try:
-                                return runpy.run_path(_plugin_path, None, "__main__")
-                            except SystemExit:
-                                # ATM 插件里常见 exit()/sys.exit()，这里吞掉避免终止整个框架
-                                return None
-                        try:
-                            ctx = contextvars.copy_context()
-                            await loop.run_in_executor(
-                                self.atm_legacy_executor,
-                                lambda: ctx.run(_run_legacy_script)
-                            )
-                        except BaseException as e:
-                            # 兼容脚本异常只记录，不影响框架主流程
-                            self.logger.error(f"ATM legacy script failed: {_plugin_path}, error: {e}", exc_info=True)
-                        return None
-                    candidate_handler = _legacy_script_handler
-                if candidate_handler:
-                    auto_rules = []
-                    default_priority = legacy_meta.get("priority", 0)
-                    for i, pattern in enumerate(legacy_meta["rules"], 1):
-                        rule_item = {
-                            "name": f"legacy_rule_{i}",
-                            "pattern": pattern,
-                            "handler": candidate_handler,
-                            "rule_type": "regex",
-                            "priority": default_priority if isinstance(default_priority, int) else 0,
-                            "description": legacy_meta.get("description", "")
-                        }
-                        if legacy_meta.get("admin") is not None:
-                            rule_item["__admin__"] = bool(legacy_meta["admin"])
-                        if legacy_meta.get("im_type"):
-                            rule_item["__imType__"] = legacy_meta["im_type"]
-                        auto_rules.append(rule_item)
-                    module.rules = auto_rules
-
-            # --- 读取插件元数据 ---
-            # ??????? __pattern__ ???????? rules?
-            # ??:
-            #   __pattern__ = r"..." / ["...", "..."]
-            #   __rule_type__ = "regex" | "keyword" | "exact" (?? regex)
-            #   __priority__ = 0
-            #   __rule_name__ = "xxx" (?????????)
-            #   __rule_description__ = "xxx"
-            #   __handler__ = callable (?????????????)
-            if not getattr(module, "rules", None) and hasattr(module, "__pattern__"):
-                raw_patterns = getattr(module, "__pattern__", None)
-                patterns = []
-                if isinstance(raw_patterns, str):
-                    if raw_patterns.strip():
-                        patterns = [raw_patterns]
-                elif isinstance(raw_patterns, (list, tuple)):
-                    patterns = [str(x) for x in raw_patterns if str(x).strip()]
-
-                if patterns:
-                    # __pattern__ ? ATM ?????????????????????
-                    async def _meta_pattern_script_handler(_msg, _mw, _plugin_path=plugin_path):
-                        loop = asyncio.get_running_loop()
-
-                        def _run_script():
-                            try:
-                                return runpy.run_path(_plugin_path, None, "__main__")
-                            except SystemExit:
-                                return None
-
-                        try:
-                            ctx = contextvars.copy_context()
-                            await loop.run_in_executor(
-                                self.atm_legacy_executor,
-                                lambda: ctx.run(_run_script)
-                            )
-                        except BaseException as e:
-                            self.logger.error(f"Pattern script plugin failed: {_plugin_path}, error: {e}", exc_info=True)
-                        return None
-
-                    rule_type = str(getattr(module, "__rule_type__", "regex") or "regex")
-                    try:
-                        priority = int(getattr(module, "__priority__", 0) or 0)
-                    except Exception:
-                        priority = 0
-                    rule_desc = str(getattr(module, "__rule_description__", getattr(module, "__description__", "")) or "")
-                    base_rule_name = str(getattr(module, "__rule_name__", "meta_rule") or "meta_rule")
-
-                    auto_rules = []
-                    for i, pattern in enumerate(patterns, 1):
-                        rule_name = base_rule_name if len(patterns) == 1 else f"{base_rule_name}_{i}"
-                        auto_rules.append({
-                            "name": rule_name,
-                            "pattern": pattern,
-                            "handler": _meta_pattern_script_handler,
-                            "rule_type": rule_type,
-                            "priority": priority,
-                            "description": rule_desc,
-                        })
-                    module.rules = auto_rules
-                else:
-                    self.logger.warning(f"?? {name} ??? __pattern__ ????? pattern??????????")
+            self._build_auto_rules(name, module, legacy_meta, plugin_path)
 
             is_admin = getattr(module, '__admin__', False)
             im_types = getattr(module, '__imType__', None)
             if isinstance(im_types, str):
                 im_types = [t.strip() for t in im_types.split(',')]
             
-            # 将元数据传递给 middleware
-            self.middleware.set_plugin_metadata(name, is_admin=is_admin, im_types=im_types)
+            # 并发分发模式使用的优先级与处理超时（__priority__ / __timeout__，兼容头注释 #[priority:]）
+            try:
+                priority = int(getattr(module, '__priority__', legacy_meta.get("priority", 0)) or 0)
+            except (TypeError, ValueError):
+                priority = 0
+            try:
+                handler_timeout = getattr(module, '__timeout__', None)
+                handler_timeout = float(handler_timeout) if handler_timeout else None
+            except (TypeError, ValueError):
+                handler_timeout = None
+
+            # 插件级限流声明，例如 __ratelimit__ = "3/60" 或 {"user": "3/60", "group": "20/60"}
+            ratelimit = getattr(module, '__ratelimit__', None)
+
+            # 将元数据传递给 middleware（热重载时在新模块 register 成功后再更新）
+            metadata = dict(is_admin=is_admin, im_types=im_types, priority=priority,
+                            timeout=handler_timeout, ratelimit=ratelimit)
+            if old_plugin is None:
+                self.middleware.set_plugin_metadata(name, **metadata)
             # -------------------
 
+            new_handlers = []
             if hasattr(module, 'register') and callable(getattr(module, 'register')):
                 register_func = getattr(module, 'register')
                 
                 # --- 关键修改：猴子补丁 middleware ---
                 original_register_handler = self.middleware.register_message_handler
-                # 使用 partial 创建一个预先填充了 plugin_name 参数的新函数
-                self.middleware.register_message_handler = partial(original_register_handler, plugin_name=name)
+                if old_plugin is not None:
+                    # 热重载：先收集新处理器，register 结束后一次性替换
+                    def _collect_handler(handler, plugin_name=None):
+                        new_handlers.append(handler)
+                    self.middleware.register_message_handler = _collect_handler
+                else:
+                    # 使用 partial 创建一个预先填充了 plugin_name 参数的新函数
+                    self.middleware.register_message_handler = partial(original_register_handler, plugin_name=name)
                 
                 try:
                     sig = inspect.signature(register_func)
@@ -388,21 +1213,65 @@ class PluginManager:
 
             rules = getattr(module, 'rules', [])
             is_system = getattr(module, '__system__', False)
-            self.plugins[name] = Plugin(name, module, rules, is_system=is_system, file_path=plugin_path)
-            await self._register_plugin_rules(name)
+            plugin = Plugin(name, module, rules, is_system=is_system, file_path=plugin_path)
+            try:
+                catalog_entry = self.plugin_catalog.get(plugin_path)
+            except Exception:
+                catalog_entry = {}
+            plugin.code_hash = catalog_entry.get("code_hash")
+            plugin.rule_meta = {k: v for k, v in (catalog_entry.get("meta") or {}).items() if k in PluginCatalog.RULE_META_KEYS}
+            if old_plugin is not None:
+                # 新模块执行与 register 都已成功：旧模块释放定时任务等资源后，
+                # 元数据、处理器、规则处理器依次切换，进行中的消息继续使用旧模块对象
+                committed = True
+                try:
+                    self._call_unload_hook(old_plugin.module)
+                except Exception as e:
+                    self.logger.error(f"调用插件 {name} 旧版本的 unload 钩子失败: {e}", exc_info=True)
+                self.plugins[name] = plugin
+                self.middleware.set_plugin_metadata(name, **metadata)
+                self.middleware.replace_message_handlers(name, new_handlers)
+                self.script_code_cache.invalidate(plugin_path)
+                await self._swap_plugin_rules(name, old_plugin)
+            else:
+                self.plugins[name] = plugin
+                # lazy 插件的占位规则已在规则引擎中，命中后转发到这里的真实处理器
+                if name not in self.lazy_plugins:
+                    await self._register_plugin_rules(name)
 
+            report["register_ms"] = round((time.perf_counter() - imported) * 1000, 2)
+            report["ok"] = True
             self.logger.info(f"插件 {name} 加载成功。")
             return True
         except Exception as e:
+            report["error"] = str(e)
             self.logger.error(f"加载插件 {name} 失败: {e}", exc_info=True)
+            if old_plugin is not None and not committed:
+                # 热重载失败：释放新模块已创建的资源，旧版本继续生效
+                if module is not None:
+                    try:
+                        self._call_unload_hook(module)
+                    except Exception as unload_error:
+                        self.logger.error(f"调用插件 {name} 新版本的 unload 钩子失败: {unload_error}", exc_info=True)
+                sys.modules[name] = old_plugin.module
             return False
+        finally:
+            report["total_ms"] = round((time.perf_counter() - started) * 1000, 2)
 
-    async def unload_plugin(self, name: str) -> bool:
-        """卸载单个插件"""
+    async def unload_plugin(self, name: str, keep_rules: bool = False) -> bool:
+        """
+        卸载单个插件
+        :param keep_rules: 保留规则引擎中的规则（lazy 插件空闲卸载时使用，占位规则继续生效）
+        """
         if name == CORE_MIDDLEWARE_NAME:
             self.logger.warning(f"核心中间件 {name} 不能被卸载。")
             return False
 
+        if not keep_rules and self.lazy_plugins.pop(name, None) is not None and name not in self.plugins:
+            await self._unregister_plugin_rules(name)
+            self.logger.info(f"lazy 插件 {name} 的占位规则已注销。")
+            return True
+
         plugin = self.get_plugin(name)
         if not plugin or not plugin.is_loaded:
             self.logger.warning(f"插件 {name} 未加载或已卸载。")
@@ -416,18 +1285,14 @@ class PluginManager:
             # --- 关键修改：注销消息处理器 ---
             self.middleware.unregister_message_handlers(name)
 
-            if hasattr(plugin.module, 'unload'):
-                unload_func = getattr(plugin.module, 'unload')
-                sig = inspect.signature(unload_func)
-                num_params = len(sig.parameters)
-                if num_params == 0:
-                    unload_func()
-                elif num_params == 1:
-                    unload_func(self.scheduler)
+            self._call_unload_hook(plugin.module)
 
-            await self._unregister_plugin_rules(name)
+            if not keep_rules:
+                await self._unregister_plugin_rules(name)
 
             self._deep_unload_module(plugin.module)
+            if plugin.file_path:
+                self.script_code_cache.invalidate(plugin.file_path)
 
             del self.plugins[name]
 
@@ -437,6 +1302,17 @@ class PluginManager:
             self.logger.error(f"卸载插件 {name} 失败: {e}", exc_info=True)
             return False
 
+    def _call_unload_hook(self, module):
+        """调用插件模块的 unload 钩子（如有）"""
+        if hasattr(module, 'unload'):
+            unload_func = getattr(module, 'unload')
+            sig = inspect.signature(unload_func)
+            num_params = len(sig.parameters)
+            if num_params == 0:
+                unload_func()
+            elif num_params == 1:
+                unload_func(self.scheduler)
+
     def _deep_unload_module(self, module):
         """
         递归卸载模块及其所有子模块
@@ -467,11 +1343,167 @@ class PluginManager:
 
         importlib.invalidate_caches()
 
-        if name in self.plugins:
+        was_lazy = name in self.lazy_plugins
+        if name in self.plugins or was_lazy:
             await self.unload_plugin(name)
 
+        if was_lazy:
+            plugin_path = os.path.join(self.plugins_dir, f"{name}.py")
+            try:
+                if await self._register_lazy_plugin(name, self.plugin_catalog.get(plugin_path)):
+                    return True
+            except OSError as e:
+                self.logger.error(f"读取插件 {name} 元数据失败: {e}")
+                return False
         return await self.load_plugin(name)
 
+    async def hot_reload_plugin(self, name: str) -> bool:
+        """
+        增量热重载单个插件（文件监视器调用，也可手动调用）
+        - 代码未变、只改了规则（#[rule:] 头注释或 __pattern__ 等常量）时不重新执行模块，只重建规则
+        - 否则在新模块对象中执行源码，成功后替换处理器与规则；执行失败时保留旧版本
+        进行中的消息继续在旧模块对象上执行完毕。
+        """
+        if name == CORE_MIDDLEWARE_NAME:
+            self.logger.warning(f"核心中间件 {name} 无法热重载，请重启应用。")
+            return False
+        if name in self.lazy_plugins:
+            # lazy 插件只需按新头信息重新注册占位规则，下次命中时导入新代码
+            return await self.reload_plugin(name)
+
+        plugin = self.plugins.get(name)
+        if plugin is None or not plugin.is_loaded:
+            return await self.load_plugin(name)
+        if plugin.is_system:
+            self.logger.warning(f"插件 {name} 是系统插件，不会热重载。")
+            return False
+
+        try:
+            entry = self.plugin_catalog.get(plugin.file_path)
+        except OSError as e:
+            self.logger.error(f"读取插件 {name} 元数据失败: {e}")
+            return False
+        if (plugin.code_hash and entry.get("code_hash") == plugin.code_hash
+                and entry.get("has_rules") is False and entry.get("has_register") is False):
+            return await self._refresh_plugin_rules(name, entry)
+        return await self.load_plugin(name, mode="hot", replace=True)
+
+    async def _refresh_plugin_rules(self, name: str, entry: Dict[str, Any]) -> bool:
+        """只有规则元数据变化时，在原模块对象上重建自动生成的规则"""
+        old_plugin = self.plugins[name]
+        module = old_plugin.module
+        meta = entry.get("meta") or {}
+        legacy_meta = copy.deepcopy(entry.get("legacy") or {})
+        for key in PluginCatalog.RULE_META_KEYS:
+            if key in meta:
+                setattr(module, key, meta[key])
+            elif key in old_plugin.rule_meta and hasattr(module, key):
+                delattr(module, key)
+        module.rules = []
+        self._build_auto_rules(name, module, legacy_meta, old_plugin.file_path)
+
+        plugin = Plugin(name, module, getattr(module, 'rules', []), is_system=old_plugin.is_system, file_path=old_plugin.file_path)
+        plugin.code_hash = entry.get("code_hash")
+        plugin.rule_meta = {k: v for k, v in meta.items() if k in PluginCatalog.RULE_META_KEYS}
+        self.plugins[name] = plugin
+        await self._swap_plugin_rules(name, old_plugin)
+
+        metadata = self.middleware.plugin_metadata.get(name)
+        try:
+            priority = int(getattr(module, '__priority__', legacy_meta.get("priority", 0)) or 0)
+        except (TypeError, ValueError):
+            priority = 0
+        if metadata is not None and metadata.get("priority") != priority:
+            self.middleware.set_plugin_metadata(name, **dict(metadata, priority=priority))
+        self.load_report[name] = {"mode": "rules", "import_ms": 0.0, "register_ms": 0.0,
+                                  "total_ms": 0.0, "ok": True, "error": None}
+        self.logger.info(f"插件 {name} 仅规则变化，已更新 {len(plugin.rules)} 条规则（未重新执行模块）。")
+        return True
+
+    def _scan_plugin_files(self) -> Dict[str, tuple]:
+        """插件目录下各插件文件的 (mtime_ns, size)"""
+        stamps = {}
+        try:
+            with os.scandir(self.plugins_dir) as entries:
+                for dirent in entries:
+                    if dirent.name.endswith(".py") and not dirent.name.startswith("__") and dirent.is_file():
+                        st = dirent.stat()
+                        stamps[dirent.name[:-3]] = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            pass
+        return stamps
+
+    def start_plugin_watcher(self, interval: float = None, debounce: float = None):
+        """
+        启动插件目录监视：轮询文件 mtime/size，文件停止变化 debounce 秒后只热重载该插件
+        新增的文件会被加载，删除的文件对应插件会被卸载。
+        """
+        if self._watch_task is not None and not self._watch_task.done():
+            return
+        interval = float(interval or HOT_RELOAD_DEFAULTS["interval"])
+        debounce = float(HOT_RELOAD_DEFAULTS["debounce"] if debounce is None else debounce)
+        self._watch_task = asyncio.get_running_loop().create_task(self._watch_plugins(interval, debounce))
+
+    def stop_plugin_watcher(self):
+        """停止插件目录监视"""
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            self._watch_task = None
+
+    async def shutdown(self):
+        """停止后台任务、ATM 进程池与线程池（应用退出时调用）"""
+        self.stop_plugin_watcher()
+        for task in (self._lazy_sweep_task, self._deferred_load_task):
+            if task is not None and not task.done():
+                task.cancel()
+        self._lazy_sweep_task = self._deferred_load_task = None
+        self.plugin_catalog.save()
+        if self.atm_process_pool is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self.atm_process_pool.shutdown)
+        self.atm_legacy_executor.shutdown(wait=False)
+
+    async def _watch_plugins(self, interval: float, debounce: float):
+        loop = asyncio.get_running_loop()
+        snapshot = await loop.run_in_executor(None, self._scan_plugin_files)
+        # {插件名: 最近一次检测到变化的时间}
+        pending: Dict[str, float] = {}
+        self.logger.info(f"插件热重载已启用：每 {interval}s 检查一次 {self.plugins_dir}")
+        while True:
+            await asyncio.sleep(interval)
+            current = await loop.run_in_executor(None, self._scan_plugin_files)
+            now = time.monotonic()
+            for name in snapshot.keys() | current.keys():
+                if snapshot.get(name) != current.get(name):
+                    pending[name] = now
+            snapshot = current
+            for name, changed_at in list(pending.items()):
+                if now - changed_at < debounce:
+                    continue
+                del pending[name]
+                try:
+                    await self._apply_plugin_change(name, name in current)
+                except Exception as e:
+                    self.logger.error(f"热重载插件 {name} 失败: {e}", exc_info=True)
+
+    async def _apply_plugin_change(self, name: str, exists: bool):
+        if name in self.disabled_plugins_bucket:
+            return
+        plugin_path = os.path.join(self.plugins_dir, f"{name}.py")
+        if not exists:
+            if name in self.plugins or name in self.lazy_plugins:
+                self.logger.info(f"插件文件 {name}.py 已删除，卸载插件。")
+                await self.unload_plugin(name)
+            self.plugin_catalog.invalidate(plugin_path)
+        elif name in self.plugins or name in self.lazy_plugins:
+            self.logger.info(f"检测到插件 {name} 变化，开始热重载。")
+            await self.hot_reload_plugin(name)
+        else:
+            self.logger.info(f"检测到新插件 {name}，开始加载。")
+            entry = self.plugin_catalog.get(plugin_path)
+            if not (self._wants_lazy(entry) and await self._register_lazy_plugin(name, entry)):
+                await self.load_plugin(name)
+        self.plugin_catalog.save()
+
     async def enable_plugin(self, name: str):
         """启用插件"""
         if name == CORE_MIDDLEWARE_NAME:
@@ -500,7 +1532,8 @@ class PluginManager:
             self.disabled_plugins_bucket.append(name)
             await self.bucket_manager.set('plugin_manager', 'disabled_plugins', self.disabled_plugins_bucket)
             self.logger.info(f"插件 {name} 已添加到禁用列表。")
-            if name in self.plugins:
+            # 尚未激活的 lazy 插件不在 self.plugins 中，同样需要注销其占位规则
+            if name in self.plugins or name in self.lazy_plugins:
                 return await self.unload_plugin(name)
             return True
         self.logger.warning(f"插件 {name} 已在禁用列表中。")
@@ -510,19 +1543,9 @@ class PluginManager:
         """获取所有已发现的插件，并确保is_system标志正确"""
         all_plugins_info = {}
 
-        # 加载核心中间件
+        # 核心中间件（元数据来自缓存目录）
         try:
-            if getattr(sys, 'frozen', False):
-                # 打包环境下，直接导入
-                import middleware.middleware as mw_module
-                core_plugin = Plugin(name=CORE_MIDDLEWARE_NAME, module=mw_module, rules=[], is_loaded=True, is_system=True, file_path="internal")
-            else:
-                # 开发环境下，从文件加载
-                spec = importlib.util.spec_from_file_location("middleware.middleware", CORE_MIDDLEWARE_PATH)
-                module = importlib.util.module_from_spec(spec)
-                spec.loader.exec_module(module)
-                core_plugin = Plugin(name=CORE_MIDDLEWARE_NAME, module=module, rules=[], is_loaded=True, is_system=True, file_path=str(CORE_MIDDLEWARE_PATH))
-            
+            core_plugin = self._get_core_plugin()
             core_plugin.enabled = True
             all_plugins_info[CORE_MIDDLEWARE_NAME] = core_plugin
         except Exception as e:
@@ -536,14 +1559,9 @@ class PluginManager:
                     if plugin_name in self.plugins:
                         plugin_obj = self.plugins[plugin_name]
                     else:
-                        is_system = False
                         plugin_path = os.path.join(self.plugins_dir, filename)
                         try:
-                            with open(plugin_path, 'r', encoding='utf-8') as f:
-                                content = f.read()
-                                if re.search(r"^\s*__system__\s*=\s*True", content, re.MULTILINE):
-                                    is_system = True
-                            plugin_obj = Plugin(name=plugin_name, module=None, rules=[], is_loaded=False, is_system=is_system, file_path=plugin_path)
+                            plugin_obj = self._catalog_plugin(plugin_name, plugin_path)
                         except Exception as e:
                             self.logger.error(f"扫描插件 {plugin_name} 元数据时出错: {e}")
                             plugin_obj = Plugin(name=plugin_name, module=None, rules=[], is_loaded=False, is_system=False, file_path=plugin_path)
@@ -552,20 +1570,18 @@ class PluginManager:
                     plugin_obj.enabled = self.is_plugin_enabled(plugin_name)
                     all_plugins_info[plugin_name] = plugin_obj
 
+            self.plugin_catalog.prune(
+                [CORE_MIDDLEWARE_PATH] + [p.file_path for n, p in all_plugins_info.items() if n != CORE_MIDDLEWARE_NAME]
+            )
+            self.plugin_catalog.save()
+
         return all_plugins_info
 
     def get_plugin(self, name: str) -> Plugin:
         """获取单个插件，无论是已加载还是仅在磁盘上"""
         if name == CORE_MIDDLEWARE_NAME:
             try:
-                if getattr(sys, 'frozen', False):
-                    import middleware.middleware as mw_module
-                    return Plugin(name=CORE_MIDDLEWARE_NAME, module=mw_module, rules=[], is_loaded=True, is_system=True, file_path="internal")
-                else:
-                    spec = importlib.util.spec_from_file_location("middleware.middleware", CORE_MIDDLEWARE_PATH)
-                    module = importlib.util.module_from_spec(spec)
-                    spec.loader.exec_module(module)
-                    return Plugin(name=CORE_MIDDLEWARE_NAME, module=module, rules=[], is_loaded=True, is_system=True, file_path=str(CORE_MIDDLEWARE_PATH))
+                return self._get_core_plugin()
             except Exception as e:
                 self.logger.error(f"获取核心中间件失败: {e}")
                 return None
@@ -575,68 +1591,177 @@ class PluginManager:
 
         plugin_path = os.path.join(self.plugins_dir, f"{name}.py")
         if os.path.exists(plugin_path):
-            is_system = False
             try:
-                with open(plugin_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                    if re.search(r"^\s*__system__\s*=\s*True", content, re.MULTILINE):
-                        is_system = True
-                return Plugin(name=name, module=None, rules=[], is_loaded=False, is_system=is_system, file_path=plugin_path)
+                return self._catalog_plugin(name, plugin_path)
             except Exception as e:
                 self.logger.error(f"获取插件 {name} 元数据时出错: {e}")
         return None
 
+    def _get_core_plugin(self) -> Plugin:
+        """
+        核心中间件的插件对象。
+        模块使用已导入的 middleware.middleware（不再重新执行源码），
+        描述/版本/作者取自源码元数据，源码文件变化时刷新。
+        """
+        import middleware.middleware as mw_module
+        if getattr(sys, 'frozen', False):
+            if self._core_plugin_cache is None:
+                self._core_plugin_cache = (None, Plugin(name=CORE_MIDDLEWARE_NAME, module=mw_module, rules=[], is_loaded=True, is_system=True, file_path="internal"))
+            return self._core_plugin_cache[1]
+
+        entry = self.plugin_catalog.get(CORE_MIDDLEWARE_PATH)
+        stamp = (entry["mtime_ns"], entry["size"])
+        if self._core_plugin_cache is None or self._core_plugin_cache[0] != stamp:
+            core_plugin = Plugin(name=CORE_MIDDLEWARE_NAME, module=mw_module, rules=[], is_loaded=True, is_system=True, file_path=str(CORE_MIDDLEWARE_PATH))
+            meta = entry["meta"]
+            core_plugin.description = meta.get("__description__", core_plugin.description)
+            core_plugin.version = meta.get("__version__", core_plugin.version)
+            core_plugin.author = meta.get("__author__", core_plugin.author)
+            self._core_plugin_cache = (stamp, core_plugin)
+        return self._core_plugin_cache[1]
+
+    def _catalog_plugin(self, name: str, plugin_path: str) -> Plugin:
+        """根据元数据目录构造未加载插件的插件对象"""
+        entry = self.plugin_catalog.get(plugin_path)
+        plugin_obj = Plugin(name=name, module=None, rules=[], is_loaded=False, is_system=entry["is_system"], file_path=plugin_path)
+        meta = entry["meta"]
+        legacy = entry.get("legacy") or {}
+        if "__description__" in meta:
+            plugin_obj.description = meta["__description__"]
+        elif legacy.get("description"):
+            plugin_obj.description = legacy["description"]
+        if "__version__" in meta:
+            plugin_obj.version = meta["__version__"]
+        elif legacy.get("version"):
+            plugin_obj.version = legacy["version"]
+        if "__author__" in meta:
+            plugin_obj.author = meta["__author__"]
+        return plugin_obj
+
     def is_plugin_enabled(self, name: str) -> bool:
         if name == CORE_MIDDLEWARE_NAME:
             return True
         return name not in self.disabled_plugins_bucket
 
+    def _make_plugin_rule(self, plugin_name: str, rule_dict: Dict[str, Any], plugin_admin: bool, plugin_im_types) -> Rule:
+        rule_name = f"{plugin_name}.{rule_dict['name']}"
+        
+        extra_kwargs = {}
+        
+        # --- 优先级逻辑：规则级配置 > 插件级配置 ---
+        
+        # 1. 管理员权限
+        if "__admin__" in rule_dict:
+            extra_kwargs["is_admin"] = rule_dict["__admin__"]
+        elif plugin_admin:
+            extra_kwargs["is_admin"] = True
+        
+        # 2. IM 平台白名单
+        im_types_val = None
+        if "__imType__" in rule_dict:
+            im_types_val = rule_dict["__imType__"]
+        elif plugin_im_types:
+            im_types_val = plugin_im_types
+        
+        if im_types_val:
+            if isinstance(im_types_val, str):
+                extra_kwargs["im_types"] = [t.strip() for t in im_types_val.split(',')]
+            else:
+                extra_kwargs["im_types"] = im_types_val
+        
+        return Rule(
+            name=rule_name, 
+            pattern=rule_dict["pattern"], 
+            handler=self._limited_rule_handler(plugin_name, rule_dict["handler"]), 
+            rule_type=rule_dict.get("rule_type", "regex"), 
+            priority=rule_dict.get("priority", 0), 
+            description=rule_dict.get("description", ""), 
+            source='plugin',
+            **extra_kwargs # 传递额外参数
+        )
+
+    def _limited_rule_handler(self, plugin_name: str, handler: Callable) -> Callable:
+        """包装规则处理器：调用前按插件的 __ratelimit__ 检查并扣减令牌，超限时不调用"""
+        admit = self.middleware.admit_rule_call
+
+        if inspect.iscoroutinefunction(handler):
+            @wraps(handler)
+            async def _limited(*args, **kwargs):
+                if not admit(plugin_name, args[0] if args else kwargs.get("message")):
+                    return None
+                return await handler(*args, **kwargs)
+        else:
+            @wraps(handler)
+            def _limited(*args, **kwargs):
+                if not admit(plugin_name, args[0] if args else kwargs.get("message")):
+                    return None
+                return handler(*args, **kwargs)
+        return _limited
+
+    @staticmethod
+    def _rule_signature(plugin: Plugin) -> tuple:
+        """插件规则定义（不含处理器），用于判断热重载后能否原地替换处理器"""
+        return (bool(plugin.is_admin), repr(plugin.im_types), tuple(
+            (r.get("name"), r.get("pattern"), r.get("rule_type", "regex"), r.get("priority", 0),
+             r.get("description", ""), r.get("__admin__"), repr(r.get("__imType__")))
+            for r in plugin.rules
+        ))
+
+    async def _swap_plugin_rules(self, plugin_name: str, old_plugin: Plugin):
+        """热重载后更新规则：规则定义不变时原地替换处理器（不会出现规则缺失的间隙），否则重新注册"""
+        plugin = self.plugins[plugin_name]
+        if self._rule_signature(old_plugin) == self._rule_signature(plugin):
+            handlers = {f"{plugin_name}.{r['name']}": self._limited_rule_handler(plugin_name, r["handler"])
+                        for r in plugin.rules}
+            # 规则引擎中实际生效的规则对象为准；索引中的对象（供匹配器使用）若不是同一个也一并替换
+            rules = {id(rule): rule for rule in self._engine_plugin_rules(plugin_name)}
+            rules.update((id(rule), rule) for rule in self._plugin_rules.get(plugin_name, ()))
+            for rule in rules.values():
+                if rule.name in handlers:
+                    rule.handler = handlers[rule.name]
+            return
+        await self._unregister_plugin_rules(plugin_name)
+        await self._register_plugin_rules(plugin_name)
+
+    async def _add_plugin_rules(self, plugin_name: str, rules: List[Rule]):
+        """
+        把一批规则加入规则引擎并记入插件索引。
+        规则引擎提供 add_rules 时整批添加（匹配结构只重建一次），否则逐条 add_rule。
+        """
+        if not rules:
+            return
+        add_rules = getattr(self.rule_engine, "add_rules", None)
+        if callable(add_rules):
+            await add_rules(rules)
+        else:
+            for rule in rules:
+                await self.rule_engine.add_rule(rule)
+        self._plugin_rules.setdefault(plugin_name, []).extend(rules)
+
     async def _register_plugin_rules(self, plugin_name: str):
         plugin = self.plugins.get(plugin_name)
         if not plugin or not plugin.is_loaded: return
-        for rule_dict in plugin.rules:
-            rule_name = f"{plugin_name}.{rule_dict['name']}"
-            
-            extra_kwargs = {}
-            
-            # --- 优先级逻辑：规则级配置 > 插件级配置 ---
-            
-            # 1. 管理员权限
-            if "__admin__" in rule_dict:
-                extra_kwargs["is_admin"] = rule_dict["__admin__"]
-            elif plugin.is_admin:
-                extra_kwargs["is_admin"] = True
-            
-            # 2. IM 平台白名单
-            im_types_val = None
-            if "__imType__" in rule_dict:
-                im_types_val = rule_dict["__imType__"]
-            elif plugin.im_types:
-                im_types_val = plugin.im_types
-            
-            if im_types_val:
-                if isinstance(im_types_val, str):
-                    extra_kwargs["im_types"] = [t.strip() for t in im_types_val.split(',')]
-                else:
-                    extra_kwargs["im_types"] = im_types_val
-            
-            rule = Rule(
-                name=rule_name, 
-                pattern=rule_dict["pattern"], 
-                handler=rule_dict["handler"], 
-                rule_type=rule_dict.get("rule_type", "regex"), 
-                priority=rule_dict.get("priority", 0), 
-                description=rule_dict.get("description", ""), 
-                source='plugin',
-                **extra_kwargs # 传递额外参数
-            )
-            await self.rule_engine.add_rule(rule)
+        rules = [self._make_plugin_rule(plugin_name, rule_dict, plugin.is_admin, plugin.im_types) for rule_dict in plugin.rules]
+        await self._add_plugin_rules(plugin_name, rules)
         self.logger.debug(f"为插件 {plugin_name} 注册了 {len(plugin.rules)} 条规则。")
 
+    def _engine_plugin_rules(self, plugin_name: str) -> List[Rule]:
+        """按名称前缀从规则引擎中找出插件的规则"""
+        prefix = f"{plugin_name}."
+        return [rule for rule in self.rule_engine.rules if rule.name.startswith(prefix)]
+
     async def _unregister_plugin_rules(self, plugin_name: str):
-        rules_to_remove = [rule for rule in self.rule_engine.rules if rule.name.startswith(f"{plugin_name}.")]
-        tasks = [self.rule_engine.remove_rule(rule.name) for rule in rules_to_remove]
-        await asyncio.gather(*tasks)
+        rules_to_remove = self._plugin_rules.pop(plugin_name, None)
+        if not rules_to_remove:
+            # 索引中没有记录（例如规则不是经 _add_plugin_rules 加入的），退回按前缀扫描规则引擎
+            rules_to_remove = self._engine_plugin_rules(plugin_name)
+        names = [rule.name for rule in rules_to_remove]
+        remove_rules = getattr(self.rule_engine, "remove_rules", None)
+        if names and callable(remove_rules):
+            # 整批移除，规则引擎只重建一次匹配结构
+            await remove_rules(names)
+        elif names:
+            await asyncio.gather(*(self.rule_engine.remove_rule(name) for name in names))
         self.logger.debug(f"为插件 {plugin_name} 注销了 {len(rules_to_remove)} 条规则。")
 
     async def execute_plugin_function(self, plugin_name: str, function_name: str, *args, **kwargs):
@@ -654,6 +1779,9 @@ class PluginManager:
             self.logger.error(f"插件 {plugin_name} 不存在")
             return None
             
+        if not plugin.is_loaded and plugin_name in self.lazy_plugins:
+            plugin = await self._activate_lazy_plugin(plugin_name) or plugin
+
         if not plugin.is_loaded:
              self.logger.error(f"插件 {plugin_name} 未加载")
              return None
@@ -8,11 +8,18 @@ import hashlib
 import platform
 import socket
 import contextvars
+import heapq
+import itertools
+import time
+import bisect
+from collections import deque, OrderedDict
+from types import MappingProxyType
 from datetime import datetime
 import subprocess
 from pathlib import Path
 
 import aiohttp
+import psutil
 from functools import partial
 from typing import Dict, Any, Optional, List, Callable, Tuple
 
@@ -32,6 +39,1322 @@ CONTAINER_TYPE_MAP = {
     "qinglong": QinglongContainer,
 }
 
+
+# 内置的超级管理员账号，始终视为管理员
+BUILTIN_ADMIN_ID = "bot666666"
+
+# 快照覆盖的 system 桶键，写入这些键时快照失效
+SYSTEM_SETTINGS_KEYS = frozenset({
+    "group_reply_enabled",
+    "group_blacklist",
+    "private_reply_enabled",
+    "admin_list",
+    "auto_recall_enabled",
+    "auto_recall_delay",
+    "indexed_buckets",
+    "concurrent_handlers",
+    "handler_timeout",
+    "ingress_max_concurrency",
+    "ingress_max_queue",
+    "ingress_overload_policy",
+    "ingress_shed_platforms",
+    "rate_limits",
+    "outbound",
+})
+
+# 快照最长有效期（秒），兜底绕过 middleware 直接写桶的情况（如 Web 面板）
+SYSTEM_SETTINGS_TTL = 30
+
+
+# 入口队列过载策略：丢弃最长会话队列中最早的消息 / 拒绝新消息 / 优先丢弃低优先级平台的消息
+INGRESS_OVERLOAD_POLICIES = ("drop_oldest", "reject", "shed_platforms")
+
+
+# 限流维度：按用户 / 群 / 平台分别计数
+RATE_LIMIT_SCOPES = ("user", "group", "platform")
+# 令牌桶闲置超过该秒数后被惰性回收
+RATE_LIMIT_IDLE_TTL = 600
+
+
+def parse_rate_limit(spec: Any) -> Optional[Tuple[float, float]]:
+    """
+    解析单条限流配置，返回 (每秒补充令牌数, 桶容量)。
+    支持 "5/60"（60 秒内 5 次）、数字（每秒次数）或 {"rate": 每秒次数, "burst": 容量}。
+    """
+    try:
+        if isinstance(spec, dict):
+            rate = float(spec.get("rate", 0))
+            burst = float(spec.get("burst", max(1.0, rate)))
+        elif isinstance(spec, str) and "/" in spec:
+            count, seconds = spec.split("/", 1)
+            burst = float(count)
+            rate = burst / float(seconds)
+        elif spec is None or isinstance(spec, bool):
+            return None
+        else:
+            rate = float(spec)
+            burst = max(1.0, rate)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+    if rate <= 0 or burst < 1:
+        return None
+    return rate, burst
+
+
+def parse_rate_limits(spec: Any) -> Dict[str, Tuple[float, float]]:
+    """
+    解析按维度的限流配置，返回 {scope: (rate, burst)}。
+    非字典配置视为按用户限流。
+    """
+    if not spec:
+        return {}
+    if not isinstance(spec, dict) or "rate" in spec:
+        spec = {"user": spec}
+    limits = {}
+    for scope in RATE_LIMIT_SCOPES:
+        parsed = parse_rate_limit(spec.get(scope))
+        if parsed:
+            limits[scope] = parsed
+    return limits
+
+
+# 出站发送队列默认配置：
+#   rate: 每个适配器每秒最多发送条数，可按适配器配置 {"qq": 1, "default": 0}，0 表示不限
+#   coalesce: 是否合并排队中发往同一目标的短消息；coalesce_max_len 为可合并的最大长度
+#   retries / backoff: 发送失败的重试次数与首个退避秒数（之后翻倍）；
+#     默认不重试，失败的发送可能已经送达，重试会造成重复消息，需要时显式开启
+OUTBOUND_DEFAULTS = {
+    "rate": {"default": 0},
+    "coalesce": False,
+    "coalesce_max_len": 200,
+    "retries": 0,
+    "backoff": 1.0,
+}
+
+
+# 广播进度所在的桶，以及每送达多少个目标保存一次进度。
+# 键 job_id 存任务头 {"platform", "chunks", "finished", "updated_at"}，
+# 键 "{job_id}:{n}" 存第 n 段新送达的目标，每次只写增量
+BROADCAST_PROGRESS_BUCKET = "broadcast_progress"
+BROADCAST_PROGRESS_EVERY = 50
+
+
+# 值索引的最长有效期（秒），兜底绕过 middleware 直接写桶的情况
+BUCKET_INDEX_TTL = 300
+# 分页遍历桶时 key 快照的有效期（秒），同一轮遍历的各页共用一份排好序的 key 列表
+BUCKET_PAGE_SNAPSHOT_TTL = 60
+
+
+class BucketValueIndex:
+    """
+    存储桶的 值 -> 键集合 二级索引。
+    由 middleware 的 bucket_set/bucket_delete 维护，使按值反查键不再需要全桶扫描。
+    """
+    def __init__(self, bucket_name: str, all_items: Dict[str, Any]):
+        self.bucket_name = bucket_name
+        self.built_at = time.monotonic()
+        self._keys_by_value: Dict[str, Any] = {}
+        self._value_of: Dict[str, str] = {}
+        for key, value in all_items.items():
+            self.set(key, value)
+
+    @classmethod
+    def _normalize(cls, value: Any) -> Any:
+        # 与 == 保持一致：True == 1 == 1.0 视为同一个值
+        if isinstance(value, bool):
+            return int(value)
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+        if isinstance(value, dict):
+            return {k: cls._normalize(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [cls._normalize(v) for v in value]
+        return value
+
+    @classmethod
+    def _token(cls, value: Any) -> str:
+        value = cls._normalize(value)
+        try:
+            return json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+        except (TypeError, ValueError):
+            return repr(value)
+
+    def set(self, key: str, value: Any):
+        self.delete(key)
+        token = self._token(value)
+        self._value_of[key] = token
+        keys = self._keys_by_value.get(token)
+        if keys is None:
+            # 注意：本模块的 ATM 兼容层定义了同名函数 set，这里不能调用内置 set()
+            self._keys_by_value[token] = {key}
+        else:
+            keys.add(key)
+
+    def delete(self, key: str):
+        token = self._value_of.pop(key, None)
+        if token is None:
+            return
+        keys = self._keys_by_value.get(token)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_value[token]
+
+    def keys_for(self, value: Any) -> List[str]:
+        return list(self._keys_by_value.get(self._token(value), ()))
+
+    def is_expired(self) -> bool:
+        return time.monotonic() - self.built_at > BUCKET_INDEX_TTL
+
+
+class SystemSettings:
+    """
+    system 桶中热路径开关的只读快照。
+    一条消息的处理过程只读取内存中的快照，不再访问存储。
+    """
+    __slots__ = ("version", "loaded_at", "group_reply_enabled", "group_blacklist",
+                 "private_reply_enabled", "admins", "auto_recall_enabled", "auto_recall_delay",
+                 "indexed_buckets", "concurrent_handlers", "handler_timeout",
+                 "ingress_max_concurrency", "ingress_max_queue", "ingress_overload_policy", "ingress_shed_platforms",
+                 "rate_limits", "outbound")
+
+    def __init__(self, version: int, values: Dict[str, Any]):
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.group_reply_enabled = bool(values.get("group_reply_enabled", True))
+        self.group_blacklist = frozenset(str(g) for g in (values.get("group_blacklist") or []))
+        self.private_reply_enabled = bool(values.get("private_reply_enabled", True))
+        admins = {str(a) for a in (values.get("admin_list") or [])}
+        admins.add(BUILTIN_ADMIN_ID)
+        self.admins = frozenset(admins)
+        self.auto_recall_enabled = bool(values.get("auto_recall_enabled", False))
+        try:
+            self.auto_recall_delay = int(values.get("auto_recall_delay", 60))
+        except (TypeError, ValueError):
+            self.auto_recall_delay = 60
+        self.indexed_buckets = frozenset(str(b) for b in (values.get("indexed_buckets") or []))
+        # 并发分发模式：同一优先级的处理器并发执行，先返回有效结果者胜出
+        self.concurrent_handlers = bool(values.get("concurrent_handlers", False))
+        # 处理器默认超时（秒），0 表示不限制；插件可用 __timeout__ 单独指定
+        try:
+            self.handler_timeout = max(0.0, float(values.get("handler_timeout", 0) or 0))
+        except (TypeError, ValueError):
+            self.handler_timeout = 0.0
+        # 入口调度：全局并发上限、队列总长度上限与过载策略
+        try:
+            self.ingress_max_concurrency = max(1, int(values.get("ingress_max_concurrency", 64)))
+        except (TypeError, ValueError):
+            self.ingress_max_concurrency = 64
+        try:
+            self.ingress_max_queue = max(1, int(values.get("ingress_max_queue", 2000)))
+        except (TypeError, ValueError):
+            self.ingress_max_queue = 2000
+        policy = str(values.get("ingress_overload_policy", "drop_oldest") or "drop_oldest")
+        self.ingress_overload_policy = policy if policy in INGRESS_OVERLOAD_POLICIES else "drop_oldest"
+        self.ingress_shed_platforms = frozenset(str(p) for p in (values.get("ingress_shed_platforms") or []))
+        # 入口限流：{"user": "5/10", "group": {"rate": 2, "burst": 20}, "platform": ...}
+        self.rate_limits = parse_rate_limits(values.get("rate_limits"))
+        # 出站发送队列配置，见 OUTBOUND_DEFAULTS
+        outbound = dict(OUTBOUND_DEFAULTS)
+        if isinstance(values.get("outbound"), dict):
+            outbound.update(values["outbound"])
+        self.outbound = outbound
+
+    def is_admin(self, user_id: Any) -> bool:
+        return user_id is not None and str(user_id) in self.admins
+
+    def is_expired(self) -> bool:
+        return time.monotonic() - self.loaded_at > SYSTEM_SETTINGS_TTL
+
+
+class CommandMatch:
+    """一次命令路由的命中结果"""
+    __slots__ = ("name", "owner", "kind", "handler", "admin", "auth_exempt", "text", "arg", "match")
+
+    def __init__(self, route: "_CommandRoute", text: str, arg: str, match=None, auth_exempt: bool = False):
+        self.name = route.name
+        self.owner = route.owner
+        self.kind = route.kind
+        self.handler = route.handler
+        self.admin = route.admin
+        self.auth_exempt = route.auth_exempt or auth_exempt
+        self.text = text
+        self.arg = arg
+        self.match = match
+
+
+# 当前消息在前门命中的命令，供系统插件的处理器直接取用，避免重复路由
+_current_command: contextvars.ContextVar = contextvars.ContextVar("current_command", default=None)
+
+
+class _CommandRoute:
+    __slots__ = ("name", "owner", "kind", "key", "handler", "admin", "auth_exempt", "ignore_case", "flags")
+
+    def __init__(self, name: str, owner: str, kind: str, key: str, handler: Optional[Callable],
+                 admin: bool, auth_exempt: bool, ignore_case: bool, flags: int = 0):
+        self.name = name
+        self.owner = owner
+        self.kind = kind
+        self.key = key
+        self.handler = handler
+        self.admin = admin
+        self.auth_exempt = auth_exempt
+        self.ignore_case = ignore_case
+        self.flags = flags
+
+
+class CommandRouter:
+    """
+    内置命令路由器。
+    精确/前缀命令存放在字符 Trie 中，正则命令合并成一条交替正则，
+    一次 match 即可确定命中的内置命令。middleware 与系统插件都向这里注册。
+    """
+    # Trie 节点的键是单个字符的小写形式，终结标记使用带尖括号的键避免冲突
+    _TERMINAL_EXACT = "<exact>"
+    _TERMINAL_PREFIX = "<prefix>"
+
+    def __init__(self):
+        # (所有者, 类型, 触发词) -> 路由；不同所有者注册同一触发词时互不覆盖
+        self._routes: Dict[Tuple[str, str, str], _CommandRoute] = {}
+        self._trie: Dict[str, Any] = {}
+        self._pattern: Optional[re.Pattern] = None
+        self._pattern_groups: Dict[int, _CommandRoute] = {}
+        # 任一所有者声明为授权豁免的 (类型, 触发词)
+        self._auth_exempt_keys = frozenset()
+        self._dirty = False
+        self.hits: Dict[str, int] = {}
+
+    def add_exact(self, name: str, text: str, handler: Optional[Callable] = None, owner: str = "middleware",
+                  admin: bool = False, auth_exempt: bool = False, ignore_case: bool = False):
+        """注册精确命令，同名命令可注册多个触发词"""
+        self._add(_CommandRoute(name, owner, "exact", text, handler, admin, auth_exempt, ignore_case))
+
+    def add_prefix(self, name: str, prefix: str, handler: Optional[Callable] = None, owner: str = "middleware",
+                   admin: bool = False, auth_exempt: bool = False, ignore_case: bool = False):
+        """注册前缀命令，CommandMatch.arg 为前缀之后的文本"""
+        self._add(_CommandRoute(name, owner, "prefix", prefix, handler, admin, auth_exempt, ignore_case))
+
+    def add_pattern(self, name: str, pattern: str, handler: Optional[Callable] = None, owner: str = "middleware",
+                    admin: bool = False, auth_exempt: bool = False, flags: int = 0):
+        """注册正则命令（从文本开头匹配），CommandMatch.arg 为匹配部分之后的文本"""
+        re.compile(pattern, flags)  # 提前暴露无效正则
+        self._add(_CommandRoute(name, owner, "pattern", pattern, handler, admin, auth_exempt, False, flags))
+
+    def _add(self, route: _CommandRoute):
+        self._routes[(route.owner, route.kind, route.key)] = route
+        self._dirty = True
+
+    def unregister_owner(self, owner: str):
+        """移除某个所有者注册的全部命令"""
+        keys = [k for k, r in self._routes.items() if r.owner == owner]
+        for k in keys:
+            del self._routes[k]
+        if keys:
+            self._dirty = True
+
+    def _compile(self):
+        trie: Dict[str, Any] = {}
+        alternatives = []
+        groups: Dict[int, _CommandRoute] = {}
+        # 同一触发词有多个路由时，带处理函数的排在仅作声明的前面
+        routes = sorted(self._routes.values(), key=lambda r: r.handler is None)
+        for route in routes:
+            if route.kind == "pattern":
+                alternatives.append(route)
+                continue
+            node = trie
+            for ch in route.key:
+                node = node.setdefault(ch.lower(), {})
+            terminal = self._TERMINAL_EXACT if route.kind == "exact" else self._TERMINAL_PREFIX
+            node.setdefault(terminal, []).append(route)
+
+        pattern = None
+        if alternatives:
+            parts = []
+            for i, route in enumerate(alternatives):
+                inline = "i" if route.flags & re.IGNORECASE else ""
+                inline += "s" if route.flags & re.DOTALL else ""
+                inline += "m" if route.flags & re.MULTILINE else ""
+                body = f"(?{inline}:{route.key})" if inline else f"(?:{route.key})"
+                parts.append(f"(?P<_cmd{i}>{body})")
+            pattern = re.compile("|".join(parts))
+            for i, route in enumerate(alternatives):
+                groups[pattern.groupindex[f"_cmd{i}"]] = route
+
+        self._trie = trie
+        self._pattern = pattern
+        self._pattern_groups = groups
+        self._auth_exempt_keys = frozenset((r.kind, r.key) for r in routes if r.auth_exempt)
+        self._dirty = False
+
+    @staticmethod
+    def _accept(routes: List[_CommandRoute], text: str, end: int) -> Optional[_CommandRoute]:
+        # Trie 以逐字符小写建索引，大小写敏感的路由需要再核对原文
+        for route in routes:
+            if route.ignore_case or text[:end] == route.key:
+                return route
+        return None
+
+    def match(self, text: str) -> Optional[CommandMatch]:
+        """
+        查找命中的命令：精确命令优先，其次最长前缀，最后正则。
+        :param text: 已规范化的消息文本
+        :return: CommandMatch 或 None
+        """
+        if self._dirty:
+            self._compile()
+        if not text:
+            return None
+
+        node = self._trie
+        prefix_hit = None
+        # 逐个原文字符取小写查 Trie（整体 lower() 可能改变非 ASCII 文本的长度，下标会错位）
+        for i, ch in enumerate(text):
+            node = node.get(ch.lower())
+            if node is None:
+                break
+            routes = node.get(self._TERMINAL_PREFIX)
+            if routes:
+                route = self._accept(routes, text, i + 1)
+                if route:
+                    prefix_hit = (route, i + 1)
+        else:
+            routes = node.get(self._TERMINAL_EXACT)
+            if routes:
+                route = self._accept(routes, text, len(text))
+                if route:
+                    return CommandMatch(route, text, "", auth_exempt=self._is_auth_exempt(route))
+
+        if prefix_hit:
+            route, end = prefix_hit
+            return CommandMatch(route, text, text[end:].strip(), auth_exempt=self._is_auth_exempt(route))
+
+        if self._pattern is not None:
+            m = self._pattern.match(text)
+            if m:
+                route = self._pattern_groups[m.lastindex]
+                return CommandMatch(route, text, text[m.end(m.lastindex):].strip(), m,
+                                    auth_exempt=self._is_auth_exempt(route))
+        return None
+
+    def _is_auth_exempt(self, route: _CommandRoute) -> bool:
+        return (route.kind, route.key) in self._auth_exempt_keys
+
+    def record(self, command: CommandMatch):
+        """记录命令命中次数，用于统计"""
+        self.hits[command.name] = self.hits.get(command.name, 0) + 1
+
+
+class _HandlerEntry:
+    """
+    预编译的消息处理器条目，注册时一次性解析签名与同步/异步类型，
+    避免每条消息都调用 inspect.signature。
+    """
+    __slots__ = ("handler", "wants_middleware", "is_async")
+
+    def __init__(self, handler: Callable):
+        self.handler = handler
+        try:
+            num_params = len(inspect.signature(handler).parameters)
+        except (TypeError, ValueError):
+            num_params = 1
+        # 如果处理函数需要超过1个参数，我们假定第二个是 middleware 实例
+        self.wants_middleware = num_params > 1
+        self.is_async = asyncio.iscoroutinefunction(handler)
+
+
+class _PluginDispatch:
+    """单个插件的分发表项：插件级权限/平台门槛 + 已编译的处理器列表"""
+    __slots__ = ("plugin_name", "admin_only", "im_types", "priority", "timeout", "rate_limits", "entries")
+
+    def __init__(self, plugin_name: str, metadata: Dict[str, Any], handlers: List[Callable]):
+        self.plugin_name = plugin_name
+        self.admin_only = bool(metadata.get("is_admin", False))
+        im_types = metadata.get("im_types")
+        self.im_types = frozenset(im_types) if im_types else None
+        self.priority = int(metadata.get("priority", 0) or 0)
+        self.timeout = metadata.get("timeout")
+        self.rate_limits = parse_rate_limits(metadata.get("ratelimit"))
+        self.entries = [_HandlerEntry(h) for h in handlers]
+
+
+# 待撤回消息持久化所在的桶：每条待撤回消息一个键 "到期秒:platform:message_id"，值为 [platform, message_id]。
+# 旧版本按到期秒一个键、值为 [[platform, message_id], ...]，restore 时迁移为逐项存储
+RECALL_PENDING_BUCKET = "recall_pending"
+# 适配器暂不可用（例如重启后尚未注册）时的重试间隔与最多重试次数
+RECALL_RETRY_DELAY = 5
+RECALL_MAX_RETRIES = 60
+
+
+class RecallScheduler:
+    """
+    自动撤回调度器：以秒为刻度的时间轮，替代“每条消息一个 sleep 任务”。
+    - schedule 只是往对应刻度的槽里追加一项，O(1)；
+    - 单个后台任务逐刻推进，同一刻到期的撤回按适配器分批执行；
+    - 每个待撤回项单独写入 recall_pending 桶（键为 "刻度:平台:消息ID"），只写有变化的项，
+      重启后由 restore 恢复。
+    """
+
+    def __init__(self, middleware):
+        self.middleware = middleware
+        # 槽内每项为 [平台, 消息ID, 已重试次数, 桶中的键]
+        self._slots: Dict[int, List[list]] = {}
+        self._cursor: Optional[int] = None
+        # 待写回的变化：{桶中的键: [平台, 消息ID] 或 None（删除）}
+        self._dirty: Dict[str, Optional[list]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._restored = False
+        self.recalled = 0
+        self.failed = 0
+
+    def __len__(self):
+        return sum(len(items) for items in self._slots.values())
+
+    def schedule(self, platform: str, message_id: Any, delay: float, _retries: int = 0):
+        """登记一条待撤回消息，delay 秒后撤回"""
+        tick = int(time.time() + max(0, delay))
+        key = f"{tick}:{platform}:{message_id}"
+        self._slots.setdefault(tick, []).append([platform, message_id, _retries, key])
+        self._dirty[key] = [platform, message_id]
+        if self._cursor is None or tick < self._cursor:
+            self._cursor = tick
+        self._ensure_running()
+
+    async def restore(self):
+        """从 recall_pending 桶恢复重启前未完成的撤回"""
+        if self._restored:
+            return
+        self._restored = True
+        try:
+            pending = await self.middleware.bucket_manager.get_all(RECALL_PENDING_BUCKET) or {}
+        except Exception as e:
+            self.middleware.logger.error(f"恢复待撤回消息失败: {e}")
+            return
+        count = 0
+        for key, value in pending.items():
+            try:
+                tick = int(str(key).split(":", 1)[0])
+            except (TypeError, ValueError):
+                continue
+            if ":" in str(key):
+                items, entry_key = [value], key
+            else:
+                # 旧格式：一个刻度一个键，值为该刻度全部待撤回项，迁移为逐项存储
+                items, entry_key = value or [], None
+                self._dirty[key] = None
+            slot = self._slots.setdefault(tick, [])
+            for item in items:
+                if isinstance(item, (list, tuple)) and len(item) >= 2:
+                    item_key = entry_key or f"{tick}:{item[0]}:{item[1]}"
+                    slot.append([item[0], item[1], 0, item_key])
+                    if entry_key is None:
+                        self._dirty[item_key] = [item[0], item[1]]
+                    count += 1
+            if not slot:
+                del self._slots[tick]
+            elif self._cursor is None or tick < self._cursor:
+                self._cursor = tick
+        if count:
+            self.middleware.logger.info(f"已恢复 {count} 条待撤回消息")
+            self._ensure_running()
+
+    def _ensure_running(self):
+        if self._task is not None and not self._task.done():
+            if self._wakeup is not None:
+                self._wakeup.set()
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # 不在事件循环中时等待下一次 schedule/restore 再启动
+            return
+        self._wakeup = asyncio.Event()
+        self._task = loop.create_task(self._run())
+
+    async def stop(self):
+        """停止后台任务并把未完成的撤回写回桶"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+        await self._flush()
+
+    async def _run(self):
+        while True:
+            if not self._slots:
+                # 先清除唤醒标记再写桶，写桶期间登记的撤回会重新置位
+                self._wakeup.clear()
+                await self._flush()
+                await self._wakeup.wait()
+                continue
+            now = int(time.time())
+            due = self._collect_due(now)
+            if due:
+                await self._recall_batch(due)
+            await self._flush()
+            # 睡到下一整秒
+            await asyncio.sleep(max(0.0, now + 1 - time.time()))
+
+    def _collect_due(self, now: int) -> List[list]:
+        if self._cursor is None or self._cursor > now:
+            return []
+        due_ticks = []
+        if now - self._cursor <= 3600:
+            for tick in range(self._cursor, now + 1):
+                if tick in self._slots:
+                    due_ticks.append(tick)
+        else:
+            # 长时间停机后恢复时，槽位稀疏，直接扫描
+            due_ticks = [tick for tick in self._slots if tick <= now]
+        due = []
+        for tick in due_ticks:
+            items = self._slots.pop(tick)
+            for item in items:
+                self._dirty[item[3]] = None
+            due.extend(items)
+        self._cursor = min(self._slots) if self._slots else None
+        return due
+
+    async def _recall_batch(self, due: List[list]):
+        by_platform: Dict[str, List[list]] = {}
+        for item in due:
+            by_platform.setdefault(item[0], []).append(item)
+        await asyncio.gather(*(self._recall_platform(platform, items) for platform, items in by_platform.items()))
+
+    async def _recall_platform(self, platform: str, items: List[list]):
+        logger = self.middleware.logger
+        adapter = self.middleware.adapters.get(platform)
+        if not adapter or not hasattr(adapter, "recall_message"):
+            for _, message_id, retries, _ in items:
+                if retries < RECALL_MAX_RETRIES:
+                    self.schedule(platform, message_id, RECALL_RETRY_DELAY, retries + 1)
+                else:
+                    self.failed += 1
+                    logger.error(f"执行撤回失败：找不到平台 {platform} 的适配器")
+            return
+
+        message_ids = [item[1] for item in items]
+        logger.info(f"执行撤回消息: {platform} x{len(message_ids)}")
+        batch = getattr(adapter, "recall_messages", None)
+        if callable(batch):
+            try:
+                await batch(message_ids)
+                self.recalled += len(message_ids)
+                return
+            except Exception as e:
+                logger.error(f"批量撤回失败，改为逐条撤回: {e}")
+        results = await asyncio.gather(*(adapter.recall_message(mid) for mid in message_ids), return_exceptions=True)
+        for message_id, result in zip(message_ids, results):
+            if isinstance(result, Exception):
+                self.failed += 1
+                logger.error(f"撤回消息 {message_id} 失败: {result}")
+            else:
+                self.recalled += 1
+
+    async def _flush(self):
+        """把有变化的待撤回项写回 recall_pending 桶"""
+        if not self._dirty:
+            return
+        changes, self._dirty = self._dirty, {}
+        bm = self.middleware.bucket_manager
+        for key, value in changes.items():
+            try:
+                if value is not None:
+                    await bm.set(RECALL_PENDING_BUCKET, key, value)
+                else:
+                    await bm.delete(RECALL_PENDING_BUCKET, key)
+            except Exception as e:
+                self.middleware.logger.error(f"保存待撤回消息失败: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {"pending": len(self), "slots": len(self._slots), "recalled": self.recalled, "failed": self.failed}
+
+
+# 资源采样间隔（秒）与环形缓冲保留的样本数（默认 15 分钟）
+RESOURCE_SAMPLE_INTERVAL = 5
+RESOURCE_SAMPLE_HISTORY = 180
+
+
+class ResourceSampler:
+    """
+    后台资源采样器：定时记录 CPU、内存、磁盘、事件循环延迟与各插件处理计数，
+    样本保存在环形缓冲中，系统状态指令和面板直接读取，不再阻塞事件循环。
+    """
+
+    def __init__(self, middleware, interval: float = RESOURCE_SAMPLE_INTERVAL,
+                 history: int = RESOURCE_SAMPLE_HISTORY, disk_path: str = "/"):
+        self.middleware = middleware
+        self.interval = interval
+        self.disk_path = disk_path
+        self.samples = deque(maxlen=history)
+        self._task: Optional[asyncio.Task] = None
+        self._last_plugin_calls: Dict[str, int] = {}
+
+    def ensure_started(self):
+        """在事件循环中启动采样任务（已启动时直接返回）"""
+        if self._task is not None and not self._task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        # 首次调用 cpu_percent(None) 只建立基线
+        psutil.cpu_percent(interval=None)
+        self._task = loop.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag_ms = max(0.0, (loop.time() - expected) * 1000)
+            try:
+                sample = await loop.run_in_executor(None, self._collect_system)
+            except Exception as e:
+                self.middleware.logger.error(f"资源采样失败: {e}")
+                continue
+            sample["loop_lag_ms"] = round(lag_ms, 2)
+            sample["plugins"] = self._plugin_deltas()
+            sample["queue_depth"] = self.middleware.ingress.depth
+            self.samples.append(sample)
+
+    def _collect_system(self, cpu: bool = True) -> Dict[str, Any]:
+        memory_info = psutil.virtual_memory()
+        disk_info = psutil.disk_usage(self.disk_path)
+        return {
+            "ts": time.time(),
+            # cpu_percent(None) 返回距上次调用的平均值，只在采样周期内调用，否则读数没有意义
+            "cpu": psutil.cpu_percent(interval=None) if cpu else None,
+            "memory": memory_info.percent,
+            "memory_used": memory_info.used,
+            "memory_total": memory_info.total,
+            "disk": disk_info.percent,
+            "disk_used": disk_info.used,
+            "disk_total": disk_info.total,
+        }
+
+    def _plugin_deltas(self) -> Dict[str, int]:
+        """本次采样周期内各插件处理器的调用次数（只记录有变化的插件）"""
+        deltas = {}
+        for plugin_name, stats in self.middleware.plugin_stats.items():
+            calls = stats[0]
+            delta = calls - self._last_plugin_calls.get(plugin_name, 0)
+            if delta:
+                deltas[plugin_name] = delta
+            self._last_plugin_calls[plugin_name] = calls
+        return deltas
+
+    def latest(self) -> Dict[str, Any]:
+        """最近一次样本；尚无样本时即时采集内存与磁盘，CPU 为 None（第一个采样周期结束前没有数据）"""
+        if self.samples:
+            return self.samples[-1]
+        sample = self._collect_system(cpu=False)
+        sample["loop_lag_ms"] = 0.0
+        sample["plugins"] = {}
+        sample["queue_depth"] = self.middleware.ingress.depth
+        return sample
+
+    def averages(self, field: str, windows=(60, 300, 900)) -> List[Optional[float]]:
+        """按时间窗口（秒）计算某项指标的平均值，样本不足时为 None"""
+        now = time.time()
+        result = []
+        for window in windows:
+            values = [sample[field] for sample in self.samples if now - sample["ts"] <= window]
+            result.append(round(sum(values) / len(values), 1) if values else None)
+        return result
+
+    def snapshot(self) -> Dict[str, Any]:
+        """供面板使用的完整快照"""
+        plugins = {
+            name: {"calls": stats[0], "errors": stats[1], "avg_ms": round(stats[2] * 1000 / stats[0], 2) if stats[0] else 0.0}
+            for name, stats in self.middleware.plugin_stats.items()
+        }
+        return {
+            "latest": self.latest(),
+            "cpu_avg": self.averages("cpu"),
+            "memory_avg": self.averages("memory"),
+            "loop_lag_avg": self.averages("loop_lag_ms"),
+            "ingress": self.middleware.ingress.stats(),
+            "history": list(self.samples),
+            "plugins": plugins,
+        }
+
+
+class RateLimiter:
+    """
+    内存令牌桶限流器。
+    每个键一个 [令牌数, 上次更新时间]，检查为 O(1)；
+    桶按最近使用顺序排列，每次检查顺带回收队首闲置过久的桶。
+    """
+
+    def __init__(self, idle_ttl: float = RATE_LIMIT_IDLE_TTL):
+        self.idle_ttl = idle_ttl
+        self._buckets: "OrderedDict[Any, list]" = OrderedDict()
+        self.limited = 0
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def _tokens(self, key, rate: float, burst: float, now: float) -> list:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [burst, now]
+        else:
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def _evict(self, now: float):
+        # 惰性回收：最多检查两个最久未用的桶，摊还 O(1)
+        for _ in range(2):
+            if not self._buckets:
+                return
+            key, bucket = next(iter(self._buckets.items()))
+            if now - bucket[1] <= self.idle_ttl:
+                return
+            del self._buckets[key]
+
+    def check(self, checks: List[Tuple[Any, float, float]], consume: bool = True) -> bool:
+        """
+        检查一组 (key, rate, burst) 是否都还有令牌；全部通过时才统一扣减。
+        :param consume: False 时只检查不扣减
+        """
+        now = time.monotonic()
+        self._evict(now)
+        buckets = [self._tokens(key, rate, burst, now) for key, rate, burst in checks]
+        if any(bucket[0] < 1 for bucket in buckets):
+            self.limited += 1
+            return False
+        if consume:
+            for bucket in buckets:
+                bucket[0] -= 1
+        return True
+
+    def consume(self, checks: List[Tuple[Any, float, float]]):
+        """无条件扣减一组令牌，最低扣到 0"""
+        now = time.monotonic()
+        for key, rate, burst in checks:
+            bucket = self._tokens(key, rate, burst, now)
+            bucket[0] = max(0.0, bucket[0] - 1)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"buckets": len(self._buckets), "limited": self.limited}
+
+
+def rate_limit_checks(prefix: str, limits: Dict[str, Tuple[float, float]], message: Dict[str, Any]) -> List[Tuple[Any, float, float]]:
+    """根据消息生成各维度的令牌桶键"""
+    checks = []
+    for scope, (rate, burst) in limits.items():
+        if scope == "user":
+            ident = message.get("user_id")
+        elif scope == "group":
+            ident = message.get("group_id")
+            if ident in (None, "", 0, "0"):
+                continue
+        else:
+            ident = message.get("platform")
+        if ident is None:
+            continue
+        checks.append(((prefix, scope, message.get("platform"), str(ident)), rate, burst))
+    return checks
+
+
+# 当前插件处理器是否主动发送过消息（[bool]），用于插件级限流扣减
+_handler_sent: contextvars.ContextVar = contextvars.ContextVar("handler_sent", default=None)
+
+
+class _IngressSlot:
+    """正在处理的消息占用的会话槽位，held=False 表示已提前释放"""
+    __slots__ = ("key", "held")
+
+    def __init__(self, key):
+        self.key = key
+        self.held = True
+
+
+# 当前处理任务占用的会话槽位，等待用户输入时据此释放
+_ingress_slot: contextvars.ContextVar = contextvars.ContextVar("ingress_slot", default=None)
+
+
+class IngressScheduler:
+    """
+    消息入口调度器：按 _get_session_key 为每个会话维护 FIFO 队列，
+    同一会话的消息按到达顺序逐条处理，不同会话轮转执行，总并发受上限约束。
+    队列总长度超过上限时按过载策略丢弃消息。
+    处理器等待用户输入（wait_for_input / conversation）时调用 detach 释放会话槽位，
+    等待条件不接收的消息不必排在该处理器后面。
+    """
+
+    def __init__(self, middleware):
+        self.middleware = middleware
+        self.max_concurrency = 64
+        self.max_queue = 2000
+        self.policy = "drop_oldest"
+        self.shed_platforms = frozenset()
+        self._queues: Dict[Any, deque] = {}
+        self._ready: deque = deque()   # 有待处理消息且当前未在处理的会话，轮转顺序
+        self._active: Dict[Any, bool] = {}
+        self._running = 0
+        self._depth = 0
+        self._anon_seq = 0
+        self.max_depth = 0
+        self.processed = 0
+        self.dropped = 0
+        self.rejected = 0
+
+    def configure(self, settings: "SystemSettings"):
+        self.max_concurrency = settings.ingress_max_concurrency
+        self.max_queue = settings.ingress_max_queue
+        self.policy = settings.ingress_overload_policy
+        self.shed_platforms = settings.ingress_shed_platforms
+
+    @property
+    def depth(self) -> int:
+        return self._depth
+
+    def submit(self, message: Dict[str, Any], session_key: Optional[Tuple[str, Optional[str]]]) -> bool:
+        """
+        将消息放入所属会话的队列。
+        :return: 被过载策略拒绝时返回 False
+        """
+        if session_key is None:
+            # 无法识别会话的消息各自成队，不参与顺序约束
+            self._anon_seq += 1
+            session_key = ("#anon", self._anon_seq)
+
+        if self._depth >= self.max_queue and not self._make_room(message):
+            self.rejected += 1
+            self.middleware.logger.warning(f"消息入口队列已满（{self._depth}），拒绝来自 {session_key} 的消息")
+            return False
+
+        queue = self._queues.get(session_key)
+        if queue is None:
+            queue = self._queues[session_key] = deque()
+        if not queue and session_key not in self._active:
+            self._ready.append(session_key)
+        queue.append(message)
+        self._depth += 1
+        if self._depth > self.max_depth:
+            self.max_depth = self._depth
+        self._pump()
+        return True
+
+    def _make_room(self, message: Dict[str, Any]) -> bool:
+        """按过载策略腾出一个位置，返回 False 表示应拒绝新消息"""
+        if self.policy == "reject":
+            return False
+        if self.policy == "shed_platforms" and self.shed_platforms:
+            if message.get("platform") in self.shed_platforms:
+                return False
+            victim = self._longest_queue(lambda m: m.get("platform") in self.shed_platforms)
+            if victim is not None:
+                return self._drop_from(victim, lambda m: m.get("platform") in self.shed_platforms)
+        victim = self._longest_queue()
+        if victim is None:
+            return False
+        return self._drop_from(victim)
+
+    def _longest_queue(self, predicate: Optional[Callable] = None):
+        best, best_len = None, 0
+        for key, queue in self._queues.items():
+            if len(queue) > best_len and (predicate is None or any(predicate(m) for m in queue)):
+                best, best_len = key, len(queue)
+        return best
+
+    def _drop_from(self, key, predicate: Optional[Callable] = None) -> bool:
+        queue = self._queues[key]
+        for i, queued in enumerate(queue):
+            if predicate is None or predicate(queued):
+                del queue[i]
+                self._depth -= 1
+                self.dropped += 1
+                self.middleware.logger.warning(f"消息入口队列过载，丢弃会话 {key} 的一条排队消息")
+                return True
+        return False
+
+    def _pump(self):
+        while self._running < self.max_concurrency and self._ready:
+            key = self._ready.popleft()
+            queue = self._queues.get(key)
+            if not queue:
+                # 队列被过载策略清空
+                self._queues.pop(key, None)
+                continue
+            message = queue.popleft()
+            self._depth -= 1
+            self._active[key] = True
+            self._running += 1
+            asyncio.create_task(self._process(key, message))
+
+    async def _process(self, key, message: Dict[str, Any]):
+        slot = _IngressSlot(key)
+        _ingress_slot.set(slot)
+        try:
+            await self.middleware._run_handlers(message)
+        except Exception as e:
+            self.middleware.logger.error(f"处理会话 {key} 的消息时发生错误: {e}", exc_info=True)
+        finally:
+            self.processed += 1
+            if slot.held:
+                slot.held = False
+                self._release(key)
+
+    def _release(self, key):
+        self._running -= 1
+        self._active.pop(key, None)
+        if self._queues.get(key):
+            # 放到轮转队尾，保证会话间公平
+            self._ready.append(key)
+        else:
+            self._queues.pop(key, None)
+        self._pump()
+
+    def detach(self):
+        """
+        当前处理任务释放所占的会话槽位（之后该会话的消息不再等它结束）。
+        在处理任务之外调用时无效果。
+        """
+        slot = _ingress_slot.get()
+        if slot is None or not slot.held:
+            return
+        slot.held = False
+        self.middleware.logger.debug(f"会话 {slot.key} 的处理器开始等待输入，释放会话槽位")
+        self._release(slot.key)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "depth": self._depth,
+            "max_depth": self.max_depth,
+            "sessions": len(self._queues),
+            "running": self._running,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "rejected": self.rejected,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "policy": self.policy,
+        }
+
+
+class _OutboundLane:
+    """单个适配器的发送节流：按 rate 预约发送时间片"""
+    __slots__ = ("next_at",)
+
+    def __init__(self):
+        self.next_at = 0.0
+
+    def reserve(self, rate: float) -> float:
+        """预约下一个发送时间片，返回需要等待的秒数"""
+        if rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        slot = max(now, self.next_at)
+        self.next_at = slot + 1.0 / rate
+        return slot - now
+
+
+class OutboundDispatcher:
+    """
+    出站发送队列：按 (平台, 发送方式, 目标) 排队，同一目标按顺序发送，
+    同一适配器按配置的每秒条数节流；排队中发往同一目标的短消息可合并，
+    发送失败按指数退避重试。enqueue 返回 Future，调用方可以不等待回执。
+    """
+
+    def __init__(self, middleware):
+        self.middleware = middleware
+        self.config: Dict[str, Any] = dict(OUTBOUND_DEFAULTS)
+        self._queues: Dict[Tuple[str, str, str], deque] = {}
+        self._lanes: Dict[str, _OutboundLane] = {}
+        self.sent = 0
+        self.merged = 0
+        self.retried = 0
+        self.failed = 0
+
+    def configure(self, settings: "SystemSettings"):
+        self.config = settings.outbound
+
+    def _rate(self, platform: str) -> float:
+        rate = self.config.get("rate", 0)
+        if isinstance(rate, dict):
+            rate = rate.get(platform, rate.get("default", 0))
+        try:
+            return max(0.0, float(rate or 0))
+        except (TypeError, ValueError):
+            return 0.0
+
+    def _mergeable(self, content: Any) -> bool:
+        return (bool(self.config.get("coalesce")) and isinstance(content, str)
+                and len(content) <= int(self.config.get("coalesce_max_len", 200) or 0))
+
+    def enqueue(self, platform: str, kind: str, target_id: Any, content: Any,
+                send: Callable[[Any], Any]) -> asyncio.Future:
+        """
+        将一次发送放入队列。
+        :param kind: 发送方式，例如 "group" / "private" / "push_group"，与目标一起决定队列
+        :param send: send(content) -> awaitable，实际调用适配器的发送方法
+        :return: 完成时结果为适配器回执的 Future；重试用尽后 Future 携带最后一次的异常
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        key = (platform, kind, str(target_id))
+        queue = self._queues.get(key)
+        mergeable = self._mergeable(content)
+        if queue:
+            tail = queue[-1]
+            limit = int(self.config.get("coalesce_max_len", 200) or 0)
+            if mergeable and tail[3] and len(tail[0]) + len(content) + 1 <= limit:
+                # 合并到队尾尚未发送的短消息，共享同一个回执
+                tail[0] = f"{tail[0]}\n{content}"
+                tail[1].append(future)
+                self.merged += 1
+                return future
+            queue.append([content, [future], send, mergeable])
+            return future
+        self._queues[key] = deque([[content, [future], send, mergeable]])
+        loop.create_task(self._drain(key))
+        return future
+
+    async def _drain(self, key: Tuple[str, str, str]):
+        platform = key[0]
+        lane = self._lanes.get(platform)
+        if lane is None:
+            lane = self._lanes[platform] = _OutboundLane()
+        queue = self._queues[key]
+        try:
+            while queue:
+                content, futures, send, _ = queue[0]
+                # 取出后不再参与合并
+                queue[0][3] = False
+                delay = lane.reserve(self._rate(platform))
+                if delay:
+                    await asyncio.sleep(delay)
+                try:
+                    receipt = await self._send_with_retry(key, send, content)
+                except Exception as e:
+                    queue.popleft()
+                    for future in futures:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                queue.popleft()
+                for future in futures:
+                    if not future.done():
+                        future.set_result(receipt)
+        finally:
+            self._queues.pop(key, None)
+            for item in queue:
+                for future in item[1]:
+                    if not future.done():
+                        future.set_result(None)
+
+    async def _send_with_retry(self, key, send: Callable[[Any], Any], content: Any):
+        retries = max(0, int(self.config.get("retries", 0) or 0))
+        backoff = max(0.0, float(self.config.get("backoff", 1.0) or 0))
+        for attempt in range(retries + 1):
+            try:
+                receipt = await send(content)
+                self.sent += 1
+                return receipt
+            except Exception as e:
+                if attempt >= retries:
+                    self.failed += 1
+                    raise
+                self.retried += 1
+                self.middleware.logger.warning(f"发送消息到 {key} 失败，{backoff * 2 ** attempt:.1f} 秒后重试: {e}")
+                await asyncio.sleep(backoff * 2 ** attempt)
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": sum(len(q) for q in self._queues.values()),
+            "targets": len(self._queues),
+            "sent": self.sent,
+            "merged": self.merged,
+            "retried": self.retried,
+            "failed": self.failed,
+        }
+
+
+class _Waiter:
+    """一个等待中的会话输入：单次等待用 future，多轮会话用 queue"""
+    __slots__ = ("key", "predicate", "future", "queue", "timeout", "deadline", "done", "seq")
+
+    def __init__(self, key, predicate: Optional[Callable], timeout: float, seq: int, stream: bool):
+        loop = asyncio.get_running_loop()
+        self.key = key
+        self.predicate = predicate
+        self.future = None if stream else loop.create_future()
+        self.queue: Optional[asyncio.Queue] = asyncio.Queue() if stream else None
+        self.timeout = timeout
+        self.deadline = loop.time() + timeout
+        self.done = False
+        self.seq = seq
+
+
+class ConversationWaiters:
+    """
+    会话输入等待登记表。
+    - 按会话键 (user_id, group_id) 或群键 ("#group", group_id) 分片，process_message 只做两次字典查找；
+    - 等待可带过滤条件（正则或函数），不满足条件的消息照常交给插件处理；
+    - 支持多轮会话迭代，每收到一条消息重新计时；
+    - 所有超时由一个共享的最小堆和单个后台任务驱动，不再每个等待一个 wait_for。
+    """
+
+    def __init__(self, middleware):
+        self.middleware = middleware
+        self._by_key: Dict[Any, List[_Waiter]] = {}
+        self._heap: List[Tuple[float, int, _Waiter]] = []
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stale = 0  # 堆中已失效（完成或续期）的条目数
+
+    def __len__(self):
+        return sum(len(waiters) for waiters in self._by_key.values())
+
+    @staticmethod
+    def group_key(group_id: Any) -> Tuple[str, str]:
+        return ("#group", str(group_id))
+
+    def add(self, key, timeout: float, predicate: Optional[Callable] = None, stream: bool = False,
+            replace: bool = False) -> _Waiter:
+        """
+        登记一个等待。
+        :param replace: True 时取消同一键上已有的无条件单次等待（wait_for_input 的原有语义）
+        """
+        waiters = self._by_key.get(key)
+        if waiters is None:
+            waiters = self._by_key[key] = []
+        elif replace:
+            for old in [w for w in waiters if w.predicate is None and w.future is not None]:
+                self._finish(old, cancel=True)
+        waiter = _Waiter(key, predicate, timeout, next(self._seq), stream)
+        waiters.append(waiter)
+        self._push_deadline(waiter)
+        return waiter
+
+    def remove(self, waiter: _Waiter):
+        self._finish(waiter, cancel=True)
+
+    def pending_futures(self) -> Dict[Any, asyncio.Future]:
+        """各会话键上最近登记、尚未完成的无条件单次等待的 future"""
+        result = {}
+        for key, waiters in self._by_key.items():
+            for waiter in reversed(waiters):
+                if not waiter.done and waiter.future is not None and waiter.predicate is None:
+                    result[key] = waiter.future
+                    break
+        return result
+
+    def dispatch(self, message: Dict[str, Any], session_key) -> bool:
+        """把消息交给匹配的等待者，被消费时返回 True"""
+        if not self._by_key:
+            return False
+        candidates = []
+        if session_key is not None:
+            candidates.append(session_key)
+            if session_key[1] is not None:
+                candidates.append(self.group_key(session_key[1]))
+        for key in candidates:
+            waiters = self._by_key.get(key)
+            if not waiters:
+                continue
+            for waiter in waiters:
+                if waiter.done:
+                    continue
+                if waiter.predicate is not None:
+                    try:
+                        if not waiter.predicate(message):
+                            continue
+                    except Exception as e:
+                        self.middleware.logger.error(f"会话等待条件判断失败: {e}")
+                        continue
+                self.middleware.logger.debug(f"捕获到会话 {key} 正在等待的输入")
+                if waiter.queue is not None:
+                    waiter.queue.put_nowait(message)
+                    # 多轮会话：收到消息后重新计时
+                    waiter.deadline = asyncio.get_running_loop().time() + waiter.timeout
+                    self._stale += 1
+                    self._push_deadline(waiter)
+                else:
+                    self._finish(waiter, result=message)
+                return True
+        return False
+
+    def _push_deadline(self, waiter: _Waiter):
+        if self._stale > 64 and self._stale * 2 > len(self._heap):
+            # 失效条目过半时整理一次，避免提前完成的等待长期占用堆
+            self._heap = [entry for entry in self._heap if not entry[2].done and entry[0] == entry[2].deadline]
+            heapq.heapify(self._heap)
+            self._stale = 0
+        heapq.heappush(self._heap, (waiter.deadline, waiter.seq, waiter))
+        if self._timer is None or self._timer.done():
+            self._wakeup = asyncio.Event()
+            self._timer = asyncio.get_running_loop().create_task(self._run_timer())
+        elif self._heap[0][2] is waiter:
+            # 新的最早到期时间，唤醒计时任务重新计算
+            self._wakeup.set()
+
+    def _finish(self, waiter: _Waiter, result: Any = None, cancel: bool = False):
+        if waiter.done:
+            return
+        waiter.done = True
+        self._stale += 1
+        waiters = self._by_key.get(waiter.key)
+        if waiters is not None:
+            try:
+                waiters.remove(waiter)
+            except ValueError:
+                pass
+            if not waiters:
+                del self._by_key[waiter.key]
+        if waiter.queue is not None:
+            waiter.queue.put_nowait(None)
+        elif not waiter.future.done():
+            if cancel:
+                waiter.future.cancel()
+            else:
+                waiter.future.set_result(result)
+
+    async def _run_timer(self):
+        loop = asyncio.get_running_loop()
+        while self._heap:
+            deadline, _, waiter = self._heap[0]
+            if waiter.done or deadline != waiter.deadline:
+                # 已完成或已续期的旧条目，惰性丢弃
+                heapq.heappop(self._heap)
+                self._stale = max(0, self._stale - 1)
+                continue
+            delay = deadline - loop.time()
+            if delay <= 0:
+                heapq.heappop(self._heap)
+                self._finish(waiter, result=None)
+                self._stale = max(0, self._stale - 1)
+                continue
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"waiters": len(self), "keys": len(self._by_key), "timers": len(self._heap)}
+
+
 class Middleware:
     """
     中间件类，提供给插件调用的各种功能接口
@@ -46,10 +1369,35 @@ class Middleware:
         self.adapters = {}  # 存储不同平台的适配器
         self.message_handlers: Dict[str, List[Callable]] = {} # 按插件名存储消息处理器
         self.plugin_metadata: Dict[str, Dict[str, Any]] = {} # 存储插件元数据
+        # 预编译的分发表，在注册/注销处理器或更新插件元数据时重建
+        self._dispatch_table: Tuple[_PluginDispatch, ...] = ()
+        # 并发模式使用的分层分发表：按优先级从高到低分组
+        self._dispatch_tiers: Tuple[Tuple[_PluginDispatch, ...], ...] = ()
+        # system 桶设置快照，bucket_set/bucket_delete 写 system 桶时失效
+        self._system_settings: Optional[SystemSettings] = None
+        self._system_settings_version = 0
+        # 按值反查键的二级索引，仅对 system.indexed_buckets 中的桶生效
+        self._bucket_indexes: Dict[str, BucketValueIndex] = {}
+        # 分页遍历用的 key 快照：{桶名: (创建时间, 排好序的 key 列表)}
+        self._bucket_page_snapshots: Dict[str, Tuple[float, List[str]]] = {}
+        # 内置命令路由器，系统插件也向其注册命令
+        self.command_router = CommandRouter()
+        self._register_builtin_commands()
         self.logger = get_logger("middleware")
+        # 自动撤回时间轮，取代每条消息一个延迟任务
+        self.recall_scheduler = RecallScheduler(self)
+        # 各插件处理器计数 [调用次数, 异常次数, 累计耗时秒]，由资源采样器汇总
+        self.plugin_stats: Dict[str, List[float]] = {}
+        self.resource_sampler = ResourceSampler(self)
+        # 消息入口调度器：会话内有序、全局限流
+        self.ingress = IngressScheduler(self)
+        # 入口与插件级限流
+        self.rate_limiter = RateLimiter()
+        # 出站发送队列：按适配器节流、合并短消息、失败重试
+        self.outbound = OutboundDispatcher(self)
         self.containers: Dict[str, BaseContainer] = {} # 存储容器实例
-        # 使用 (user_id, group_id) 元组作为键，确保等待的上下文精确
-        self.waiting_for_input: Dict[Tuple[str, Optional[str]], asyncio.Future] = {}
+        # 会话输入等待：使用 (user_id, group_id) 元组作为键，确保等待的上下文精确；群级等待使用群键
+        self.waiters = ConversationWaiters(self)
         
         # 适配器状态缓存
         self.adapter_status_cache = {}
@@ -68,16 +1416,126 @@ class Middleware:
             self.main_loop = None
             self.logger.warning("Middleware initialized without a running event loop. Some features may not work.")
 
+    def current_command(self) -> Optional[CommandMatch]:
+        """当前消息在前门命中的内置命令（在消息处理器中调用）"""
+        return _current_command.get()
+
     def set_auth_checker(self, checker: Callable[[], bool]):
         """设置授权检查器"""
         self.auth_checker = checker
 
-    def set_plugin_metadata(self, plugin_name: str, is_admin: bool = False, im_types: Optional[List[str]] = None):
-        """设置插件元数据"""
+    def set_plugin_metadata(self, plugin_name: str, is_admin: bool = False, im_types: Optional[List[str]] = None,
+                            priority: int = 0, timeout: Optional[float] = None, ratelimit: Any = None):
+        """
+        设置插件元数据
+        :param priority: 并发分发模式下的优先级，数字越大越优先
+        :param timeout: 单次处理的超时秒数，None 时使用 system.handler_timeout
+        :param ratelimit: 插件的 __ratelimit__ 声明，格式同 system.rate_limits
+        """
         self.plugin_metadata[plugin_name] = {
             "is_admin": is_admin,
-            "im_types": im_types
+            "im_types": im_types,
+            "priority": priority,
+            "timeout": timeout,
+            "ratelimit": ratelimit
         }
+        if plugin_name in self.message_handlers:
+            self._rebuild_dispatch_table()
+
+    def admit_rule_call(self, plugin_name: str, message: Any) -> bool:
+        """
+        规则处理器的插件级限流：规则命中即算一次触发，按 __ratelimit__ 检查并扣减令牌。
+        令牌不足时返回 False；管理员与内部消息不受限。
+        """
+        metadata = self.plugin_metadata.get(plugin_name)
+        if not metadata or not metadata.get("ratelimit") or not isinstance(message, dict):
+            return True
+        if message.get("internal_source", False):
+            return True
+        settings = self._system_settings
+        if settings is not None and settings.is_admin(message.get("user_id")):
+            return True
+        checks = rate_limit_checks(plugin_name, parse_rate_limits(metadata["ratelimit"]), message)
+        if checks and not self.rate_limiter.check(checks):
+            self.logger.debug(f"用户 {message.get('user_id')} 触发插件 {plugin_name} 的限流，跳过规则处理")
+            return False
+        return True
+
+    def _rebuild_dispatch_table(self):
+        """根据 message_handlers 与 plugin_metadata 重建预编译分发表"""
+        self._dispatch_table = tuple(
+            _PluginDispatch(plugin_name, self.plugin_metadata.get(plugin_name, {}), handlers)
+            for plugin_name, handlers in self.message_handlers.items()
+        )
+        tiers: Dict[int, List[_PluginDispatch]] = {}
+        for dispatch in self._dispatch_table:
+            tiers.setdefault(dispatch.priority, []).append(dispatch)
+        self._dispatch_tiers = tuple(tuple(tiers[p]) for p in sorted(tiers, reverse=True))
+
+    def _register_builtin_commands(self):
+        """注册 middleware 前门处理的内置命令"""
+        router = self.command_router
+        for text in ("\u673a\u5668\u7801", "\u53d1\u9001\u673a\u5668\u7801"):
+            router.add_exact("machine_code", text, self._cmd_machine_code)
+        router.add_pattern("coze", r"coze\s+", self._cmd_coze, flags=re.IGNORECASE)
+        for text in ("\u66f4\u65b0", "\u5347\u7ea7"):
+            router.add_exact("update", text, self._cmd_update)
+        # 授权相关命令由系统插件处理，这里仅声明其在未授权时也可通过
+        router.add_exact("license_query", "授权码", auth_exempt=True)
+        router.add_pattern("license_upload", r"bot[a-zA-Z0-9]+$", auth_exempt=True)
+
+    async def _cmd_machine_code(self, message: Dict[str, Any], command: CommandMatch):
+        machine_code = await self.get_machine_code()
+        await self.send_response(message, {"content": f"\u673a\u5668\u7801: {machine_code}"})
+
+    async def _cmd_coze(self, message: Dict[str, Any], command: CommandMatch):
+        if not await self.is_adapter_enabled("coze"):
+            await self.send_response(message, {"content": "Coze 适配器已禁用"})
+            return
+        prompt = command.arg
+        if not prompt:
+            await self.send_response(message, {"content": "用法: coze 你的问题"})
+            return
+        try:
+            result = await self._coze_chat(message, prompt)
+            await self.send_response(message, {"content": result})
+        except Exception as e:
+            self.logger.error(f"Coze 调用失败: {e}", exc_info=True)
+            await self.send_response(message, {"content": f"Coze 调用失败: {e}"})
+
+    async def _cmd_update(self, message: Dict[str, Any], command: CommandMatch):
+        user_id = message.get("user_id")
+        if not await self.is_admin(user_id):
+            await self.send_response(message, {"content": "仅管理员可执行更新。"})
+            return
+        await self.send_response(message, {"content": "正在检查远程版本更新，请稍候..."})
+        update_msg = await self._auto_update_from_docker_hub()
+        await self.send_response(message, {"content": update_msg})
+
+    async def get_system_settings(self) -> SystemSettings:
+        """
+        获取 system 桶热路径开关的快照。
+        快照在写入相关键时失效，并按 SYSTEM_SETTINGS_TTL 定期刷新。
+        """
+        settings = self._system_settings
+        if settings is not None and settings.version == self._system_settings_version and not settings.is_expired():
+            return settings
+
+        version = self._system_settings_version
+        values = {}
+        for key in SYSTEM_SETTINGS_KEYS:
+            values[key] = await self.bucket_manager.get("system", key, None)
+        values = {k: v for k, v in values.items() if v is not None}
+        settings = SystemSettings(version, values)
+        # 加载期间如有写入则不缓存，下一次调用重新加载
+        if version == self._system_settings_version:
+            self._system_settings = settings
+        return settings
+
+    def invalidate_system_settings(self):
+        """使 system 设置快照失效"""
+        self._system_settings_version += 1
+        self._system_settings = None
 
     async def _ensure_adapter_status_loaded(self):
         """确保适配器状态已加载"""
@@ -101,6 +1559,9 @@ class Middleware:
         """
         从数据库加载并初始化所有容器。
         """
+        # 启动阶段顺便恢复重启前未完成的自动撤回，并启动资源采样
+        await self.recall_scheduler.restore()
+        self.resource_sampler.ensure_started()
         self.logger.info("正在加载外部容器...")
         container_configs = await self.bucket_manager.get("system", "containers", [])
         normalized_configs = []
@@ -159,6 +1620,8 @@ class Middleware:
         停止中间件及其资源（包括容器和HTTP会话）
         """
         await self.stop_containers()
+        await self.recall_scheduler.stop()
+        await self.resource_sampler.stop()
         if self._http_session and not self._http_session.closed:
             await self._http_session.close()
             self.logger.info("HTTP会话已关闭")
@@ -208,8 +1671,23 @@ class Middleware:
         if plugin_name not in self.message_handlers:
             self.message_handlers[plugin_name] = []
         self.message_handlers[plugin_name].append(handler)
+        self._rebuild_dispatch_table()
         self.logger.info(f"插件 '{plugin_name}' 的消息处理器 {handler.__name__} 已注册")
 
+    def replace_message_handlers(self, plugin_name: str, handlers: List[Callable]):
+        """
+        一次性替换插件的全部消息处理器（热重载用）
+        分发表只重建一次，不会出现插件没有处理器的中间状态
+        :param plugin_name: 插件名称
+        :param handlers: 新的处理器列表
+        """
+        if handlers:
+            self.message_handlers[plugin_name] = list(handlers)
+        else:
+            self.message_handlers.pop(plugin_name, None)
+        self._rebuild_dispatch_table()
+        self.logger.info(f"插件 '{plugin_name}' 的消息处理器已替换为 {len(handlers)} 个。")
+
     def unregister_message_handlers(self, plugin_name: str):
         """
         注销属于特定插件的所有消息处理器
@@ -218,6 +1696,7 @@ class Middleware:
         if plugin_name in self.message_handlers:
             count = len(self.message_handlers[plugin_name])
             del self.message_handlers[plugin_name]
+            self._rebuild_dispatch_table()
             self.logger.info(f"已注销插件 '{plugin_name}' 的 {count} 个消息处理器。")
 
     async def _run_handlers(self, message: Dict[str, Any]):
@@ -230,40 +1709,17 @@ class Middleware:
         """
         在后台任务中运行消息处理器和拦截逻辑。
         """
-        # --- 授权检查 ---
-        # Built-in command: machine code
+        # --- 内置命令（一次路由查找） ---
         content = self._normalize_message_content(message.get("content", ""))
-        if re.fullmatch(r"(?:\u53d1\u9001)?\u673a\u5668\u7801", content):
-            machine_code = await self.get_machine_code()
-            await self.send_response(message, {"content": f"\u673a\u5668\u7801: {machine_code}"})
-            return
-        # Built-in command: Coze chat proxy
-        if re.match(r"^coze\s+", content, re.IGNORECASE):
-            if not await self.is_adapter_enabled("coze"):
-                await self.send_response(message, {"content": "Coze 适配器已禁用"})
-                return
-            prompt = re.sub(r"^coze\s+", "", content, flags=re.IGNORECASE).strip()
-            if not prompt:
-                await self.send_response(message, {"content": "用法: coze 你的问题"})
-                return
-            try:
-                result = await self._coze_chat(message, prompt)
-                await self.send_response(message, {"content": result})
-            except Exception as e:
-                self.logger.error(f"Coze 调用失败: {e}", exc_info=True)
-                await self.send_response(message, {"content": f"Coze 调用失败: {e}"})
-            return
-        if re.fullmatch(r"(?:\u66f4\u65b0|\u5347\u7ea7)", content):
-            user_id = message.get("user_id")
-            if not await self.is_admin(user_id):
-                await self.send_response(message, {"content": "仅管理员可执行更新。"})
-                return
-            await self.send_response(message, {"content": "正在检查远程版本更新，请稍候..."})
-            update_msg = await self._auto_update_from_docker_hub()
-            await self.send_response(message, {"content": update_msg})
+        command = self.command_router.match(content)
+        _current_command.set(command)
+        if command and command.owner == "middleware" and command.handler:
+            self.command_router.record(command)
+            await command.handler(message, command)
             return
 
-        if self.auth_checker and not self.auth_checker() and not re.search('^bot[a-zA-Z0-9]+$', content) and not re.search('^授权码$', content):
+        # --- 授权检查 ---
+        if self.auth_checker and not self.auth_checker() and not (command and command.auth_exempt):
             self.logger.warning("系统未授权或授权已过期，拒绝处理消息。")
             # 可以选择发送一条提示消息，或者直接忽略
             # await self.send_response(message, {"content": "系统未授权或授权已过期。"})
@@ -278,79 +1734,144 @@ class Middleware:
 
         user_id = message.get("user_id")
         group_id = message.get("group_id")
-        is_admin_user = await self.is_admin(user_id)
+        settings = await self.get_system_settings()
+        is_admin_user = settings.is_admin(user_id)
         is_internal_message = message.get("internal_source", False)
 
         # --- 拦截逻辑 ---
         if not is_internal_message:
             if group_id:  # 群聊消息
-                group_reply_enabled = await self.bucket_get("system", "group_reply_enabled", True)
-                if not group_reply_enabled:
+                if not settings.group_reply_enabled:
                     self.logger.debug(f"群聊回复已禁用，忽略来自群 {group_id} 的消息")
                     return
-                group_blacklist = await self.bucket_get("system", "group_blacklist", [])
-                if str(group_id) in group_blacklist:
+                if str(group_id) in settings.group_blacklist:
                     self.logger.debug(f"群 {group_id} 在黑名单中，忽略消息")
                     return
             else:  # 私聊消息
-                private_reply_enabled = await self.bucket_get("system", "private_reply_enabled", True)
-                if not private_reply_enabled and not is_admin_user:
+                if not settings.private_reply_enabled and not is_admin_user:
                     self.logger.debug(f"私聊回复已对普通用户禁用，忽略来自用户 {user_id} 的消息")
                     return
 
+            # --- 入口限流（管理员不受限） ---
+            if settings.rate_limits and not is_admin_user:
+                checks = rate_limit_checks("*", settings.rate_limits, message)
+                if checks and not self.rate_limiter.check(checks):
+                    self.logger.debug(f"用户 {user_id} 触发限流，忽略消息")
+                    return
+
         self.logger.info(f"后台处理消息: {content}")
+        if command and command.handler:
+            self.command_router.record(command)
 
-        # 获取当前事件循环
-        loop = asyncio.get_running_loop()
+        # 调用所有注册的消息处理器（使用预编译分发表）
+        platform = message.get("platform")
 
-        # 调用所有注册的消息处理器
-        handled = False
-        for plugin_name, handlers in self.message_handlers.items():
+        def _allowed(dispatch: _PluginDispatch) -> bool:
             # --- 插件级权限检查 (跳过内部消息) ---
-            if not is_internal_message:
-                metadata = self.plugin_metadata.get(plugin_name, {})
-                
-                if metadata.get("is_admin", False):
-                    if not is_admin_user:
-                        # self.logger.debug(f"插件 {plugin_name} 需要管理员权限，用户 {user_id} 权限不足。")
-                        continue
-                
-                allowed_im_types = metadata.get("im_types")
-                if allowed_im_types:
-                    platform = message.get("platform")
-                    if platform not in allowed_im_types:
-                        # self.logger.debug(f"插件 {plugin_name} 不支持平台 {platform}，仅支持 {allowed_im_types}。")
-                        continue
-            # ---------------------
+            if is_internal_message:
+                return True
+            if dispatch.admin_only and not is_admin_user:
+                return False
+            if dispatch.im_types is not None and platform not in dispatch.im_types:
+                return False
+            # --- 插件级限流：令牌不足时跳过该插件，产生回复后才扣减 ---
+            if dispatch.rate_limits and charge_rate:
+                checks = rate_limit_checks(dispatch.plugin_name, dispatch.rate_limits, message)
+                if checks and not self.rate_limiter.check(checks, consume=False):
+                    return False
+            return True
 
-            for handler in handlers:
-                try:
-                    # 使用 inspect 模块检查函数签名，以决定如何调用
-                    sig = inspect.signature(handler)
-                    num_params = len(sig.parameters)
-
-                    args = [message]
-                    # 如果处理函数需要超过1个参数，我们假定第二个是 middleware 实例
-                    if num_params > 1:
-                        args.append(self)
-
-                    if asyncio.iscoroutinefunction(handler):
-                        result = await handler(*args)
-                    else:
-                        # 将同步处理函数放入线程池运行，防止阻塞主循环
-                        ctx = contextvars.copy_context()
-                        result = await loop.run_in_executor(None, lambda: ctx.run(handler, *args))
+        charge_rate = not is_admin_user and not is_internal_message
+        default_timeout = settings.handler_timeout or None
+        if settings.concurrent_handlers:
+            for tier in self._dispatch_tiers:
+                calls = [(dispatch, entry) for dispatch in tier if _allowed(dispatch) for entry in dispatch.entries]
+                result = await self._run_handler_tier(message, calls, default_timeout, charge_rate)
+                if result:
+                    await self.send_response(message, result)
+                    return
+            return
 
+        for dispatch in self._dispatch_table:
+            if not _allowed(dispatch):
+                continue
+            for entry in dispatch.entries:
+                result = await self._call_handler(message, dispatch, entry, default_timeout, charge_rate)
+                if result:
+                    await self.send_response(message, result)
+                    return
+
+    async def _call_handler(self, message: Dict[str, Any], dispatch: _PluginDispatch, entry: _HandlerEntry,
+                            default_timeout: Optional[float] = None, charge_rate: bool = False):
+        """
+        执行单个处理器，统计耗时并吞掉异常；超时视为无结果
+        :param charge_rate: 产生回复（返回结果或主动发送消息）时是否扣减插件级限流令牌
+        """
+        stats = self.plugin_stats.get(dispatch.plugin_name)
+        if stats is None:
+            stats = self.plugin_stats[dispatch.plugin_name] = [0, 0, 0.0]
+        handler = entry.handler
+        timeout = dispatch.timeout if dispatch.timeout is not None else default_timeout
+        started = time.perf_counter()
+        result = None
+        sent = [False]
+        _handler_sent.set(sent)
+        try:
+            args = (message, self) if entry.wants_middleware else (message,)
+
+            if entry.is_async:
+                call = handler(*args)
+            else:
+                # 将同步处理函数放入线程池运行，防止阻塞主循环
+                ctx = contextvars.copy_context()
+                call = asyncio.get_running_loop().run_in_executor(None, lambda: ctx.run(handler, *args))
+            result = await asyncio.wait_for(call, timeout) if timeout else await call
+
+            stats[0] += 1
+            stats[2] += time.perf_counter() - started
+            return result
+        except asyncio.TimeoutError:
+            stats[0] += 1
+            stats[1] += 1
+            stats[2] += time.perf_counter() - started
+            self.logger.warning(f"插件 {dispatch.plugin_name} 的处理器 {getattr(handler, '__name__', 'unknown')} 超时（{timeout} 秒），已跳过")
+        except Exception as e:
+            stats[0] += 1
+            stats[1] += 1
+            stats[2] += time.perf_counter() - started
+            self.logger.error(f"处理消息时插件 {getattr(handler, '__module__', 'unknown')} 的处理器 {getattr(handler, '__name__', 'unknown')} 发生错误: {e}",
+                              exc_info=True)
+        finally:
+            # 返回了回复或在处理中主动发送过消息才算一次触发；不回复的处理器（多数是内容不匹配）不扣减
+            if charge_rate and dispatch.rate_limits and (result or sent[0]):
+                self.rate_limiter.consume(rate_limit_checks(dispatch.plugin_name, dispatch.rate_limits, message))
+        return None
+
+    async def _run_handler_tier(self, message: Dict[str, Any], calls: List[Tuple[_PluginDispatch, _HandlerEntry]],
+                                default_timeout: Optional[float] = None, charge_rate: bool = False):
+        """
+        并发执行同一优先级的处理器，返回最先得到的有效结果，并取消其余处理器。
+        线程池中的同步处理器无法中断，只是不再等待其结果。
+        """
+        if not calls:
+            return None
+        if len(calls) == 1:
+            dispatch, entry = calls[0]
+            return await self._call_handler(message, dispatch, entry, default_timeout, charge_rate)
+
+        pending = {asyncio.ensure_future(self._call_handler(message, dispatch, entry, default_timeout, charge_rate))
+                   for dispatch, entry in calls}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result = task.result()
                     if result:
-                        await self.send_response(message, result)
-                        handled = True
-                        break
-                except Exception as e:
-                    self.logger.error(f"处理消息时插件 {getattr(handler, '__module__', 'unknown')} 的处理器 {getattr(handler, '__name__', 'unknown')} 发生错误: {e}",
-                                      exc_info=True)
-            
-            if handled:
-                break
+                        return result
+            return None
+        finally:
+            for task in pending:
+                task.cancel()
 
     def _normalize_message_content(self, raw: Any) -> str:
         """Convert message content to plain text for command/rule matching."""
@@ -410,21 +1931,23 @@ class Middleware:
 
         # --- 检查是否是等待的输入 ---
         session_key = self._get_session_key(message)
-        if session_key:
-            waiter = self.waiting_for_input.get(session_key)
-            if waiter and not waiter.done():
-                self.logger.debug(f"捕获到会话 {session_key} 正在等待的输入")
-                waiter.set_result(message)
-                return
+        if self.waiters.dispatch(message, session_key):
+            return
 
-        # --- 如果不是等待的输入，则在后台任务中处理 ---
-        asyncio.create_task(self._run_handlers(message))
+        # --- 如果不是等待的输入，则交给入口调度器排队处理 ---
+        self.ingress.configure(await self.get_system_settings())
+        self.ingress.submit(message, session_key)
 
-    async def _send_and_handle_recall(self, platform: str, target_id: str, content: str, is_group: bool):
+    async def _send_and_handle_recall(self, platform: str, target_id: str, content: str, is_group: bool,
+                                      wait: bool = True):
         """
         【核心发送逻辑】发送消息并统一处理自动撤回。
+        :param wait: False 时只放入发送队列即返回，回执与撤回在后台处理
         :return: 返回消息回执 (receipt) 或 None
         """
+        sent = _handler_sent.get()
+        if sent is not None:
+            sent[0] = True
         if not await self.is_adapter_enabled(platform):
             self.logger.warning(f"适配器 {platform} 已禁用，无法发送消息")
             return None
@@ -435,24 +1958,40 @@ class Middleware:
             return None
 
         try:
-            receipt = None
+            settings = await self.get_system_settings()
+            self.outbound.configure(settings)
             if is_group:
-                receipt = await adapter.send_group_message(target_id, content)
+                future = self.outbound.enqueue(platform, "group", target_id, content,
+                                               partial(adapter.send_group_message, target_id))
             else:
-                receipt = await adapter.send_private_message(target_id, content)
+                future = self.outbound.enqueue(platform, "private", target_id, content,
+                                               partial(adapter.send_private_message, target_id))
+            if not wait:
+                asyncio.create_task(self._after_send(platform, target_id, content, is_group, future))
+                return None
+            return await self._after_send(platform, target_id, content, is_group, future)
+
+        except Exception as e:
+            self.logger.error(f"发送响应或处理撤回时失败: {e}", exc_info=True)
+            return None
 
+    async def _after_send(self, platform: str, target_id: str, content: str, is_group: bool, future: asyncio.Future):
+        """等待发送队列回执，并按设置登记自动撤回"""
+        try:
+            receipt = await future
             self.logger.info(f"响应已发送到 {platform} -> {'群' if is_group else '私聊'}:{target_id}: {content}")
 
             # --- 统一的自动撤回逻辑 ---
-            auto_recall_enabled = await self.bucket_get("system", "auto_recall_enabled", False)
-            if auto_recall_enabled and receipt and receipt.get('data', {}).get('message_id'):
+            settings = await self.get_system_settings()
+            if settings.auto_recall_enabled and receipt and receipt.get('data', {}).get('message_id'):
                 message_id_to_recall = receipt['data']['message_id']
-                delay = await self.bucket_get("system", "auto_recall_delay", 60)
+                delay = settings.auto_recall_delay
                 
                 self.logger.info(f"计划在 {delay} 秒后撤回消息: {message_id_to_recall}")
                 
-                # 创建一个延迟撤回的后台任务
-                asyncio.create_task(self._delayed_recall(platform, message_id_to_recall, delay))
+                # 登记到撤回时间轮，由调度器统一到期撤回
+                await self.recall_scheduler.restore()
+                self.recall_scheduler.schedule(platform, message_id_to_recall, delay)
             
             return receipt
 
@@ -477,15 +2016,10 @@ class Middleware:
 
     async def _delayed_recall(self, platform: str, message_id: Any, delay: int):
         """
-        延迟指定秒数后执行撤回操作。
+        延迟指定秒数后执行撤回操作（交给撤回时间轮，不再单独挂起任务）。
         """
-        await asyncio.sleep(delay)
-        adapter = self.adapters.get(platform)
-        if adapter:
-            self.logger.info(f"执行撤回消息: {message_id}")
-            await adapter.recall_message(message_id)
-        else:
-            self.logger.error(f"执行撤回失败：找不到平台 {platform} 的适配器")
+        await self.recall_scheduler.restore()
+        self.recall_scheduler.schedule(platform, message_id, delay)
 
 
 
@@ -505,44 +2039,97 @@ class Middleware:
         return None
 
     # ————————从这里开始可自定义调用
-    async def wait_for_input(self, msg: Dict[str, Any], timeout: int) -> Optional[Dict[str, Any]]:
+    def _waiter_key_and_predicate(self, msg: Dict[str, Any], for_group: bool, pattern: Any,
+                                  predicate: Optional[Callable]):
+        session_key = self._get_session_key(msg)
+        if not session_key:
+            return None, None
+        key = session_key
+        if for_group and session_key[1] is not None:
+            key = ConversationWaiters.group_key(session_key[1])
+        if pattern is not None:
+            regex = re.compile(pattern) if isinstance(pattern, str) else pattern
+            normalize = self._normalize_message_content
+            if predicate is None:
+                predicate = lambda m: regex.search(normalize(m.get("content", ""))) is not None
+            else:
+                extra = predicate
+                predicate = lambda m: regex.search(normalize(m.get("content", ""))) is not None and extra(m)
+        return key, predicate
+
+    async def wait_for_input(self, msg: Dict[str, Any], timeout: int, for_group: bool = False,
+                             pattern: Any = None, predicate: Optional[Callable] = None,
+                             return_message: bool = False) -> Any:
         """
         在当前会话（群聊或私聊）中等待用户的下一次输入。
         :param msg: 原始消息对象，用于确定等待哪个用户和会话。
         :param timeout: 等待的超时时间（毫秒）。
-        :return: 用户输入的完整消息对象 (dict)，如果超时或发生错误则返回 None。
+        :param for_group: True 时接收该群内任意成员的输入（私聊时忽略）
+        :param pattern: 只接收匹配该正则的消息，其余消息照常交给插件处理
+        :param predicate: 只接收 predicate(message) 为真的消息
+        :param return_message: True 时返回完整消息对象，否则返回消息内容
+        :return: 用户输入的内容（或完整消息对象），如果超时或发生错误则返回 None。
         """
-
-        session_key = self._get_session_key(msg)
-
-        if not session_key:
+        key, predicate = self._waiter_key_and_predicate(msg, for_group, pattern, predicate)
+        if not key:
             self.logger.error("wait_for_input: 无法从消息中确定会话。")
             return None
 
-        if session_key in self.waiting_for_input:
-            old_future = self.waiting_for_input.pop(session_key)
-            if not old_future.done():
-                old_future.cancel()
-
-        loop = asyncio.get_running_loop()
-        future = loop.create_future()
-        self.waiting_for_input[session_key] = future
-
-        self.logger.debug(f"开始在会话 {session_key} 中等待输入，超时时间 {timeout}ms")
+        # 同一会话上新的无条件等待会取消旧的
+        waiter = self.waiters.add(key, timeout / 1000.0, predicate, replace=predicate is None)
+        # 等待期间不再占用会话槽位，等待条件不接收的消息照常处理
+        self.ingress.detach()
+        self.logger.debug(f"开始在会话 {key} 中等待输入，超时时间 {timeout}ms")
 
         try:
-            result = await asyncio.wait_for(future, timeout / 1000.0)
-            return result.get("content", None)
-        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
-            self.logger.debug(f"在会话 {session_key} 中等待输入时发生: {type(e).__name__}")
+            result = await waiter.future
+            if result is None:
+                self.logger.debug(f"在会话 {key} 中等待输入时发生: TimeoutError")
+                return None
+            return result if return_message else result.get("content", None)
+        except asyncio.CancelledError:
+            self.logger.debug(f"在会话 {key} 中等待输入时发生: CancelledError")
             return None
         finally:
-            if self.waiting_for_input.get(session_key) is future:
-                del self.waiting_for_input[session_key]
+            self.waiters.remove(waiter)
+
+    async def conversation(self, msg: Dict[str, Any], timeout: int, for_group: bool = False,
+                           pattern: Any = None, predicate: Optional[Callable] = None):
+        """
+        多轮会话：异步迭代当前会话后续的每一条输入消息（完整消息对象）。
+        每收到一条消息重新计时，超过 timeout 毫秒没有新消息时迭代结束；调用方 break 即可提前结束。
+        用法：
+            async for reply in middleware.conversation(message, 60000):
+                if reply["content"] == "q":
+                    break
+        """
+        key, predicate = self._waiter_key_and_predicate(msg, for_group, pattern, predicate)
+        if not key:
+            self.logger.error("conversation: 无法从消息中确定会话。")
+            return
+        waiter = self.waiters.add(key, timeout / 1000.0, predicate, stream=True)
+        self.ingress.detach()
+        try:
+            while True:
+                message = await waiter.queue.get()
+                if message is None:
+                    return
+                yield message
+        finally:
+            self.waiters.remove(waiter)
+
+    @property
+    def waiting_for_input(self):
+        """
+        兼容旧版的只读视图：会话键 -> 正在等待输入的 future。
+        只包含无条件的单次等待；登记和取消等待请使用 wait_for_input / waiters。
+        """
+        return MappingProxyType(self.waiters.pending_futures())
 
     # 以下是提供给插件调用的功能接口
 
-    async def send_message(self, platform: str, target_id: str, content: str,msg: Optional[Dict[str, Any]] = None):
+    async def send_message(self, platform: str, target_id: str, content: str,msg: Optional[Dict[str, Any]] = None,
+                           wait: bool = True):
         """
         【异步】主动发送消息。此方法现在也会触发统一的自动撤回逻辑。
         可以提供原始消息 `msg` 对象来获得更智能的上下文判断。
@@ -550,6 +2137,7 @@ class Middleware:
         :param target_id: 发送目标id
         :param content: 要发送的内容
         :param msg: 原始消息
+        :param wait: False 时只放入发送队列立即返回 None，不等待回执
         :return: 返回消息回执 (receipt) 或 None
         """
         # 智能判断是群聊还是私聊
@@ -566,7 +2154,7 @@ class Middleware:
         if not is_group: # 如果没有上下文或上下文不足以判断，则使用基本规则
              is_group = "group" in str(target_id).lower() or str(target_id).startswith('@@')
 
-        return await self._send_and_handle_recall(platform, target_id, content, is_group)
+        return await self._send_and_handle_recall(platform, target_id, content, is_group, wait=wait)
 
     def send_message_sync(self, platform: str, target_id: str, content: str, *,
                           msg: Optional[Dict[str, Any]] = None):
@@ -698,41 +2286,179 @@ class Middleware:
         if not adapter: return None
         return {"group_id": group_id, "group_name": f"群组{group_id}", "platform": platform}
 
-    async def notify_admin(self, message: str, platforms: str = "qq"):
+    async def fan_out(self, jobs: List[Tuple[Any, Callable[[], Any]]], concurrency: int = 8) -> List[Dict[str, Any]]:
+        """
+        并发执行一组发送任务，最多同时进行 concurrency 个，单个失败不影响其它任务。
+        :param jobs: [(目标标识, 无参协程函数), ...]，协程返回 False 视为失败
+        :return: 按 jobs 顺序的结果 [{"target", "ok", "result", "error"}, ...]
+        """
+        semaphore = asyncio.Semaphore(max(1, int(concurrency or 1)))
+
+        async def _one(target, factory):
+            async with semaphore:
+                try:
+                    result = await factory()
+                    return {"target": target, "ok": result is not False, "result": result, "error": None}
+                except Exception as e:
+                    return {"target": target, "ok": False, "result": None, "error": str(e)}
+
+        return list(await asyncio.gather(*(_one(target, factory) for target, factory in jobs)))
+
+    async def notify_admin(self, message: str, platforms: str = "qq", concurrency: int = 8) -> List[Dict[str, Any]]:
         """
         向所有管理员发送私聊消息。此消息【不会】被自动撤回。
+        各平台、各管理员并发发送，某个平台不可用时跳过该平台继续发送其它平台。
         :param message:
         :param platforms: 默认qq,多个用,
-        :return:
+        :param concurrency: 最大并发发送数
+        :return: 每个接收者的发送结果 [{"target": (platform, admin_id), "ok", "result", "error"}, ...]
         """
         admin_list = await self.bucket_get("system", "admin_list", [])
         if not admin_list:
             self.logger.warning("通知管理员失败：未设置任何管理员。")
-            return
+            return []
+
+        self.outbound.configure(await self.get_system_settings())
+        jobs = []
         for platform in platforms.split(","):
-            if not await self.is_adapter_enabled(platform):
+            platform = platform.strip()
+            if not platform or not await self.is_adapter_enabled(platform):
                 continue
 
             adapter = self.adapters.get(platform)
             if not adapter or not hasattr(adapter, 'send_message'):
                 self.logger.error(f"通知管理员失败：未找到平台 {platform} 的适配器或适配器不支持 send_message。")
-                return
+                continue
 
             for admin_id in admin_list:
-                try:
-                    # 构造私聊消息体
-                    message_data = {
-                        "action": "send_private_msg",
-                        "params": {
-                            "user_id": admin_id,
-                            "message": message
-                        }
+                # 构造私聊消息体
+                message_data = {
+                    "action": "send_private_msg",
+                    "params": {
+                        "user_id": admin_id,
+                        "message": message
                     }
-                    # 调用底层的、不会返回回执的 send_message 方法
-                    await adapter.send_message(message_data)
-                    self.logger.info(f"已向管理员 {admin_id} 发送通知。")
-                except Exception as e:
-                    self.logger.error(f"向管理员 {admin_id} 发送消息失败: {e}")
+                }
+                # 调用底层的、不会返回回执的 send_message 方法（经发送队列节流）
+                jobs.append(((platform, admin_id),
+                             partial(self.outbound.enqueue, platform, "raw", admin_id, message_data, adapter.send_message)))
+
+        report = await self.fan_out(jobs, concurrency)
+        for item in report:
+            if item["ok"]:
+                self.logger.info(f"已向管理员 {item['target'][1]} 发送通知。")
+            else:
+                self.logger.error(f"向管理员 {item['target'][1]} 发送消息失败: {item['error']}")
+        return report
+
+    async def broadcast(self, platform: str, targets: List[Any], content: str, is_group: bool = True,
+                        concurrency: int = 8, job_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        向大量群或用户推送同一条消息，不受撤回功能影响。
+        适配器状态只检查一次，目标去重，发送经过出站队列按适配器节流。
+        :param platform: 渠道
+        :param targets: 群号或用户ID列表
+        :param content: 内容
+        :param is_group: True 推送到群，False 推送给用户
+        :param concurrency: 同时在途的发送数
+        :param job_id: 提供时按任务记录进度（broadcast_progress 桶），中断或有失败时用同一 job_id 再次调用会跳过已送达的目标；
+                       全部送达后进度被清除，同一 job_id（例如每晚的广播）下次调用会重新发送给所有目标
+        :return: {"total", "duplicates", "invalid", "skipped", "sent", "failed", "failures": [(target, error)], "elapsed"}
+        """
+        started = time.monotonic()
+        valid = [str(t) for t in targets if t not in (None, "")]
+        unique = list(dict.fromkeys(valid))
+        stats = {"total": len(unique), "duplicates": len(valid) - len(unique), "invalid": len(targets) - len(valid),
+                 "skipped": 0, "sent": 0, "failed": 0, "failures": [], "elapsed": 0.0}
+
+        if not await self.is_adapter_enabled(platform):
+            self.logger.warning(f"适配器 {platform} 已禁用，无法广播消息")
+            stats["failed"] = len(unique)
+            stats["failures"] = [(t, "adapter disabled") for t in unique]
+            return stats
+        adapter = self.adapters.get(platform)
+        method_names = ("push_group_message", "send_group_message") if is_group else ("push_private_message", "send_private_message")
+        method = next((getattr(adapter, n) for n in method_names if adapter and hasattr(adapter, n)), None)
+        if method is None:
+            self.logger.error(f"广播失败：未找到平台 {platform} 的适配器或适配器不支持 {method_names[0]}")
+            stats["failed"] = len(unique)
+            stats["failures"] = [(t, "adapter unavailable") for t in unique]
+            return stats
+
+        done: List[str] = []
+        chunks = 0
+
+        async def _clear_progress(count: int):
+            for n in range(count):
+                await self.bucket_manager.delete(BROADCAST_PROGRESS_BUCKET, f"{job_id}:{n}")
+            await self.bucket_manager.delete(BROADCAST_PROGRESS_BUCKET, job_id)
+
+        if job_id:
+            progress = await self.bucket_manager.get(BROADCAST_PROGRESS_BUCKET, job_id, None) or {}
+            if progress.get("finished"):
+                # 上一轮已全部送达（清理时中断），本次作为新一轮从头发送
+                await _clear_progress(int(progress.get("chunks", 0) or 0))
+                progress = {}
+            finished = {*(progress.get("done") or [])}  # 旧格式：整个已送达列表存在任务头里
+            chunks = int(progress.get("chunks", 0) or 0)
+            for n in range(chunks):
+                finished.update(await self.bucket_manager.get(BROADCAST_PROGRESS_BUCKET, f"{job_id}:{n}", None) or [])
+            if progress.get("done"):
+                # 旧格式的已送达列表转存为第一段增量
+                await self.bucket_manager.set(BROADCAST_PROGRESS_BUCKET, f"{job_id}:{chunks}", list(progress["done"]))
+                chunks += 1
+            pending = [t for t in unique if t not in finished]
+            stats["skipped"] = len(unique) - len(pending)
+        else:
+            pending = unique
+
+        self.outbound.configure(await self.get_system_settings())
+        kind = "push_group" if is_group else "push_private"
+        flushed = 0
+        # 进度写入串行进行：任务头只在它记录的各段都写入之后才更新
+        save_lock = asyncio.Lock()
+
+        async def _save_progress(final: bool = False, force: bool = False):
+            nonlocal flushed, chunks
+            if not job_id or (not force and len(done) - flushed < BROADCAST_PROGRESS_EVERY):
+                return
+            async with save_lock:
+                delta = done[flushed:]
+                flushed = len(done)
+                if delta:
+                    await self.bucket_manager.set(BROADCAST_PROGRESS_BUCKET, f"{job_id}:{chunks}", delta)
+                    chunks += 1
+                if not delta and not force:
+                    return
+                await self.bucket_manager.set(BROADCAST_PROGRESS_BUCKET, job_id, {
+                    "platform": platform, "chunks": chunks, "finished": final, "updated_at": time.time()
+                })
+
+        async def _send(target):
+            await self.outbound.enqueue(platform, kind, target, content, partial(method, target))
+            done.append(target)
+            await _save_progress()
+
+        report = await self.fan_out([(t, partial(_send, t)) for t in pending], concurrency)
+        for item in report:
+            if item["ok"]:
+                stats["sent"] += 1
+            else:
+                stats["failed"] += 1
+                stats["failures"].append((item["target"], item["error"]))
+        await _save_progress(final=not stats["failed"], force=True)
+        if job_id and not stats["failed"]:
+            # 全部送达：清除进度，同一 job_id 下次调用是新的一轮
+            await _clear_progress(chunks)
+
+        stats["elapsed"] = round(time.monotonic() - started, 3)
+        self.logger.info(
+            f"广播完成 {platform} -> {'群' if is_group else '用户'} {stats['total']} 个目标："
+            f"成功 {stats['sent']}，失败 {stats['failed']}，跳过 {stats['skipped']}，重复 {stats['duplicates']}，"
+            f"无效 {stats['invalid']}，"
+            f"耗时 {stats['elapsed']} 秒"
+        )
+        return stats
 
     async def push_to_group(self, platform: str, group_id: str, content: str):
         """
@@ -740,24 +2466,30 @@ class Middleware:
         :param platform: 渠道
         :param group_id: 群号
         :param content: 内容
+        :return: 是否推送成功
         """
         if not await self.is_adapter_enabled(platform):
             self.logger.warning(f"适配器 {platform} 已禁用，无法推送群消息")
-            return
+            return False
 
         adapter = self.adapters.get(platform)
         if not adapter:
             self.logger.error(f"未找到平台 {platform} 的适配器")
-            return
+            return False
 
         if hasattr(adapter, 'push_group_message'):
             try:
-                await adapter.push_group_message(group_id, content)
+                self.outbound.configure(await self.get_system_settings())
+                await self.outbound.enqueue(platform, "push_group", group_id, content,
+                                            partial(adapter.push_group_message, group_id))
                 self.logger.info(f"已推送到 {platform} -> 群:{group_id}: {content}")
+                return True
             except Exception as e:
                 self.logger.error(f"推送消息到群 {group_id} 失败: {e}", exc_info=True)
+                return False
         else:
              self.logger.error(f"平台 {platform} 的适配器不支持 push_group_message")
+        return False
 
     async def push_to_user(self, platform: str, user_id: str, content: str):
         """
@@ -765,24 +2497,30 @@ class Middleware:
         :param platform: 渠道
         :param user_id: 用户ID
         :param content: 内容
+        :return: 是否推送成功
         """
         if not await self.is_adapter_enabled(platform):
             self.logger.warning(f"适配器 {platform} 已禁用，无法推送私聊消息")
-            return
+            return False
 
         adapter = self.adapters.get(platform)
         if not adapter:
             self.logger.error(f"未找到平台 {platform} 的适配器")
-            return
+            return False
 
         if hasattr(adapter, 'push_private_message'):
             try:
-                await adapter.push_private_message(user_id, content)
+                self.outbound.configure(await self.get_system_settings())
+                await self.outbound.enqueue(platform, "push_private", user_id, content,
+                                            partial(adapter.push_private_message, user_id))
                 self.logger.info(f"已推送到 {platform} -> 用户:{user_id}: {content}")
+                return True
             except Exception as e:
                 self.logger.error(f"推送消息到用户 {user_id} 失败: {e}", exc_info=True)
+                return False
         else:
              self.logger.error(f"平台 {platform} 的适配器不支持 push_private_message")
+        return False
     async def get_image(self,message,cqimg):
         platform = message.get("platform")
 
@@ -859,6 +2597,11 @@ class Middleware:
         :return: 无返回值。
         """
         await self.bucket_manager.set(bucket_name, key, value)
+        index = self._bucket_indexes.get(bucket_name)
+        if index is not None:
+            index.set(key, value)
+        if bucket_name == "system" and key in SYSTEM_SETTINGS_KEYS:
+            self.invalidate_system_settings()
 
     async def bucket_delete(self, bucket_name: str, key: str):
         """
@@ -868,6 +2611,11 @@ class Middleware:
         :return: 无返回值。
         """
         await self.bucket_manager.delete(bucket_name, key)
+        index = self._bucket_indexes.get(bucket_name)
+        if index is not None:
+            index.delete(key)
+        if bucket_name == "system" and key in SYSTEM_SETTINGS_KEYS:
+            self.invalidate_system_settings()
 
     async def bucket_keys(self, bucket_name: str) -> List[str]:
         """
@@ -884,15 +2632,68 @@ class Middleware:
         :return: 无返回值。
         """
         await self.bucket_manager.clear(bucket_name)
+        self._bucket_indexes.pop(bucket_name, None)
+        if bucket_name == "system":
+            self.invalidate_system_settings()
+
+    async def bucket_keys_by_value(self, bucket_name: str, value: Any) -> List[str]:
+        """
+        获取桶中值等于 value 的所有 key。
+        桶在 system.indexed_buckets 中时走值索引，否则全桶扫描。
+        :param bucket_name: 存储桶名称。
+        :param value: 要匹配的值。
+        :return: 匹配的 key 列表。
+        """
+        settings = await self.get_system_settings()
+        if bucket_name not in settings.indexed_buckets:
+            self._bucket_indexes.pop(bucket_name, None)
+            all_map = await self.bucket_manager.get_all(bucket_name) or {}
+            return [k for k, v in all_map.items() if v == value]
+
+        index = self._bucket_indexes.get(bucket_name)
+        if index is None or index.is_expired():
+            all_map = await self.bucket_manager.get_all(bucket_name) or {}
+            index = BucketValueIndex(bucket_name, all_map)
+            self._bucket_indexes[bucket_name] = index
+        return index.keys_for(value)
+
+    async def bucket_items_page(self, bucket_name: str, cursor: Optional[str] = None, limit: int = 100) -> Dict[str, Any]:
+        """
+        分页获取桶中的 key-value，避免一次性物化整个桶。
+        cursor 是上一页最后一个 key，各页在同一份排好序的 key 快照上续读，
+        遍历期间桶被修改也不会跳过或重复已有的 key（遍历开始后新增的 key 不在本轮中）。
+        :param bucket_name: 存储桶名称。
+        :param cursor: 上一页返回的 next，首次传 None（兼容传 0 或空串）。
+        :param limit: 每页数量。
+        :return: {"items": {key: value}, "next": 下一页 cursor，没有更多时为 None}
+        """
+        limit = max(1, int(limit or 100))
+        first_page = cursor is None or cursor == "" or cursor == 0
+        snapshot = self._bucket_page_snapshots.get(bucket_name)
+        if first_page or snapshot is None or time.monotonic() - snapshot[0] > BUCKET_PAGE_SNAPSHOT_TTL:
+            snapshot = (time.monotonic(), sorted(await self.bucket_manager.keys(bucket_name) or []))
+            self._bucket_page_snapshots[bucket_name] = snapshot
+        keys = snapshot[1]
+        start = 0 if first_page else bisect.bisect_right(keys, str(cursor))
+        page_keys = keys[start:start + limit]
+        items = {}
+        for key in page_keys:
+            value = await self.bucket_manager.get(bucket_name, key)
+            # 快照之后被删除的 key 跳过
+            if value is not None:
+                items[key] = value
+        if start + limit < len(keys):
+            next_cursor = page_keys[-1]
+        else:
+            next_cursor = None
+            self._bucket_page_snapshots.pop(bucket_name, None)
+        return {"items": items, "next": next_cursor}
 
     # 管理员专用功能
     async def is_admin(self, user_id: Any) -> bool:
         if user_id is None: return False
-        admin_list = await self.bucket_get("system", "admin_list", [])
-        lo_admins = admin_list
-        if "bot666666" not in lo_admins:
-            lo_admins.append("bot666666")
-        return str(user_id) in lo_admins
+        settings = await self.get_system_settings()
+        return settings.is_admin(user_id)
 
     async def add_admin(self, user_id: Any, operator_id: Any) -> bool:
         """
@@ -1442,6 +3243,8 @@ import os
 import json
 import requests
 import http.client
+import select
+import threading
 from urllib.parse import quote
 import asyncio
 
@@ -1473,42 +3276,153 @@ def get_service_response(path:str,data):
     else:
         return get_sock_service_response(path,data)
 
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """通过 UNIX 套接字通信的 HTTP 连接"""
+    def __init__(self, socket_path: str, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
+class _AtmConnectionPool:
+    """
+    线程安全的 HTTP keep-alive 连接池。
+    ATM 脚本一次运行可能调用几十次接口，复用连接避免每次调用都重新建连。
+    """
+    def __init__(self, factory, max_idle: int = 8):
+        self._factory = factory
+        self._max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+        self._stats = {"created": 0, "reused": 0, "requests": 0, "errors": 0, "discarded": 0, "in_use": 0}
+
+    def _acquire(self, fresh: bool = False):
+        """取一个连接；fresh=True 时总是新建"""
+        while True:
+            with self._lock:
+                if fresh or not self._idle:
+                    self._stats["in_use"] += 1
+                    self._stats["created"] += 1
+                    break
+                conn = self._idle.pop()
+                self._stats["in_use"] += 1
+                self._stats["reused"] += 1
+            if not self._is_stale(conn):
+                return conn, True
+            # 空闲期间已被服务端关闭的连接直接丢弃，不拿去发请求
+            self._release(conn, False)
+        return self._factory(), False
+
+    @staticmethod
+    def _is_stale(conn) -> bool:
+        """空闲的 keep-alive 连接上有可读事件（EOF 或多余数据）说明已不可用"""
+        sock = getattr(conn, "sock", None)
+        if sock is None:
+            return False
+        try:
+            return bool(select.select([sock], [], [], 0)[0])
+        except (OSError, ValueError):
+            return True
+
+    def _release(self, conn, reusable: bool):
+        with self._lock:
+            self._stats["in_use"] -= 1
+            if reusable and len(self._idle) < self._max_idle:
+                self._idle.append(conn)
+                return
+            self._stats["discarded"] += 1
+        conn.close()
+
+    def post_json(self, path: str, data):
+        """
+        发送 JSON POST 请求
+        :return: (status, reason, 响应文本)
+        """
+        body = json.dumps(data)
+        headers = {"Content-Type": "application/json"}
+        conn, reused = self._acquire()
+        try:
+            conn.request('POST', path, body, headers)
+        except (BrokenPipeError, ConnectionResetError, ConnectionAbortedError):
+            self._fail(conn)
+            if not reused:
+                raise
+            # 复用的连接在发送时已断开，请求未送达：只在新建连接上重试一次
+            conn, reused = self._acquire(fresh=True)
+            try:
+                conn.request('POST', path, body, headers)
+            except (http.client.HTTPException, OSError):
+                self._fail(conn)
+                raise
+        except (http.client.HTTPException, OSError):
+            self._fail(conn)
+            raise
+        try:
+            response = conn.getresponse()
+            response_data = response.read().decode()
+        except (http.client.HTTPException, OSError):
+            # 请求已发出，服务端可能已经执行（如 /sendText），不能重试
+            self._fail(conn)
+            raise
+        self._release(conn, not response.will_close)
+        with self._lock:
+            self._stats["requests"] += 1
+        return response.status, response.reason, response_data
+
+    def _fail(self, conn):
+        self._release(conn, False)
+        with self._lock:
+            self._stats["errors"] += 1
+
+    def stats(self) -> dict:
+        """连接池统计信息"""
+        with self._lock:
+            result = dict(self._stats)
+            result["idle"] = len(self._idle)
+        return result
+
+    def close(self):
+        """关闭所有空闲连接"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+_atm_http_pool = _AtmConnectionPool(lambda: http.client.HTTPConnection('127.0.0.1', 9999))
+_atm_sock_pool = _AtmConnectionPool(lambda: _UnixHTTPConnection('/tmp/autMan.sock'))
+
+
+def get_service_pool_stats():
+    """获取本地服务连接池的统计信息"""
+    return {"http": _atm_http_pool.stats(), "sock": _atm_sock_pool.stats()}
+
+
 # 本地服务的请求，返回请求的数据
 def get_http_service_response(path:str,data):
-    url = "http://127.0.0.1:9999/sock"+path
-    response = requests.post(
-        url=url, 
-        json=data,
-        headers={"Content-Type":"application/json"},
-    )
-    #printf("网络请求响应"+response.text)
-    if response.status_code==200:
+    status, reason, response_data = _atm_http_pool.post_json("/sock"+path, data)
+    #printf("网络请求响应"+response_data)
+    if status==200:
         # 将json字符串转换为json对象
-        json_obj=json.loads(response.text)
+        json_obj=json.loads(response_data)
         return json_obj
     else:
         raise Exception("请求失败")
     
 # 本地服务的请求，返回请求的数据
 def get_sock_service_response(path: str, data):
-    socket_path = '/tmp/autMan.sock'
-    request_path = '/sock' + path
-
-    conn = http.client.HTTPConnection('localhost')
-    conn.sock = http.client.socket.socket(http.client.socket.AF_UNIX, http.client.socket.SOCK_STREAM)
-    conn.sock.connect(socket_path)
+    status, reason, response_data = _atm_sock_pool.post_json('/sock' + path, data)
 
-    body = json.dumps(data)
-
-    conn.request('POST', request_path, body)
-    response = conn.getresponse()
-    response_data = response.read().decode()
-    conn.close()
-
-    if response.status == 200:
+    if status == 200:
         return json.loads(response_data)
     else:
-        raise Exception(f"请求失败: {response.reason}")
+        raise Exception(f"请求失败: {reason}")
 
 
 
@@ -1656,9 +3570,14 @@ class Sender:
     # 类的构造函数
     def __init__(self, senderID:int):
         self.senderID = senderID
+        # 本次运行内已读取/写入的桶数据，(bucket, key) -> value
+        self._bucket_cache = {}
         
         # 获取指定数据库指定key的值
     def bucketGet(self,bucket,key):
+        cache_key=(bucket,key)
+        if cache_key in self._bucket_cache:
+            return self._bucket_cache[cache_key]
         path="/bucketGet"
         data={
             "senderid":self.senderID,
@@ -1666,6 +3585,7 @@ class Sender:
             "key":key
         }
         response=get_service_response(path,data)
+        self._bucket_cache[cache_key]=response["data"]
         return response["data"]
 
     # 设置指定数据库指定key的值
@@ -1678,6 +3598,7 @@ class Sender:
             "value":value
         }
         response=get_service_response(path,data)
+        self._bucket_cache.pop((bucket,key),None)
         return response["code"]==200
 
     # 删除指定数据库指定key的值
@@ -1689,8 +3610,62 @@ class Sender:
             "key":key
         }
         response=get_service_response(path,data)
+        self._bucket_cache.pop((bucket,key),None)
         return response["code"]==200
 
+    # 批量获取指定数据库多个key的值，返回 {key: value}，一次调用完成
+    def bucketMultiGet(self,bucket,keys:list):
+        result={}
+        missing=[]
+        for key in keys:
+            cache_key=(bucket,key)
+            if cache_key in self._bucket_cache:
+                result[key]=self._bucket_cache[cache_key]
+            else:
+                missing.append(key)
+        if missing:
+            path="/bucketMultiGet"
+            data={
+                "senderid":self.senderID,
+                "bucket":bucket,
+                "keys":missing
+            }
+            try:
+                response=get_service_response(path,data)
+            except Exception:
+                response=None
+            if response and response.get("code")==200 and isinstance(response.get("data"),dict):
+                fetched=response["data"]
+                for key in missing:
+                    self._bucket_cache[(bucket,key)]=fetched.get(key)
+                    result[key]=fetched.get(key)
+            else:
+                # 服务端不支持批量接口时逐个获取
+                for key in missing:
+                    result[key]=self.bucketGet(bucket,key)
+        return result
+
+    # 批量设置指定数据库多个key的值，values 为 {key: value}，一次调用完成
+    def bucketMultiSet(self,bucket,values:dict):
+        path="/bucketMultiSet"
+        data={
+            "senderid":self.senderID,
+            "bucket":bucket,
+            "values":values
+        }
+        try:
+            response=get_service_response(path,data)
+        except Exception:
+            response=None
+        if response and response.get("code")==200:
+            ok=bool(response.get("data"))
+        else:
+            # 服务端不支持批量接口时逐个设置
+            ok=all([self.bucketSet(bucket,key,value) for key,value in values.items()])
+        for key in values:
+            self._bucket_cache.pop((bucket,key),None)
+        return ok
+
     # 获取指定数据库的所有值为value的keys
     def bucketKeys(self,bucket,value):
         path="/bucketKeys"
@@ -1722,6 +3697,29 @@ class Sender:
         }
         response=get_service_response(path,data)
         return response["data"]
+
+    # 分页获取指定数据库的key-value，返回 {"items": {...}, "next": 下一页cursor（上一页最后一个key）或None}
+    def bucketAllPage(self,bucket,cursor=None,limit:int=100):
+        path="/bucketAllPage"
+        data={
+            "senderid":self.senderID,
+            "bucket":bucket,
+            "cursor":cursor,
+            "limit":limit,
+        }
+        response=get_service_response(path,data)
+        return response["data"]
+
+    # 逐条遍历指定数据库的key-value，按页拉取，适合很大的桶
+    def bucketAllIter(self,bucket,page_size:int=200):
+        page=self.bucketAllPage(bucket,None,page_size) or {}
+        while True:
+            for key,value in (page.get("items") or {}).items():
+                yield key,value
+            cursor=page.get("next")
+            if cursor is None:
+                break
+            page=self.bucketAllPage(bucket,cursor,page_size) or {}
       
     # 设置关键词继续向下匹配其它优先级低的插件
     def response(self,data):
@@ -1894,6 +3892,16 @@ class Sender:
 
 
 
+# 进程池模式下，工作进程通过该钩子把 ATM 接口调用转发回主进程
+_atm_remote_dispatch = None
+
+
+def set_atm_remote_dispatch(func):
+    """设置 ATM 接口的远程转发函数（仅在 ATM 工作进程中使用）"""
+    global _atm_remote_dispatch
+    _atm_remote_dispatch = func
+
+
 def _atm_get_context():
     try:
         from middleware.atm_context import get_current_context
@@ -1923,7 +3931,97 @@ def _atm_run_async(middleware, coro, default=None, timeout=30):
         return default
 
 
+# ATM 接口注册表：path -> handler(middleware, message, payload)，导入时一次性构建
+_atm_endpoints: Dict[str, Callable] = {}
+
+# 接口耗时直方图的桶上界（毫秒），最后一个桶为 +Inf
+ATM_LATENCY_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+_atm_endpoint_stats: Dict[str, Dict[str, Any]] = {}
+_atm_stats_lock = threading.Lock()
+
+
+def register_atm_endpoint(path: str, handler: Callable):
+    """
+    注册 ATM 兼容接口，插件可借此扩展自己的接口。
+    :param path: 接口路径，例如 "/myPluginCall"
+    :param handler: handler(middleware, message, payload)，返回 _atm_response(...) 结构
+    """
+    _atm_endpoints[str(path)] = handler
+
+
+def unregister_atm_endpoint(path: str):
+    """注销 ATM 兼容接口"""
+    _atm_endpoints.pop(str(path), None)
+
+
+def atm_endpoint(*paths):
+    """装饰器形式的 register_atm_endpoint，可同时注册多个路径"""
+    def decorator(handler):
+        for path in paths:
+            register_atm_endpoint(path, handler)
+        return handler
+    return decorator
+
+
+def _atm_record_call(path: str, elapsed: float, failed: bool):
+    elapsed_ms = elapsed * 1000
+    with _atm_stats_lock:
+        stats = _atm_endpoint_stats.get(path)
+        if stats is None:
+            stats = {"calls": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0,
+                     "histogram": [0] * (len(ATM_LATENCY_BUCKETS_MS) + 1)}
+            _atm_endpoint_stats[path] = stats
+        stats["calls"] += 1
+        if failed:
+            stats["errors"] += 1
+        stats["total_ms"] += elapsed_ms
+        if elapsed_ms > stats["max_ms"]:
+            stats["max_ms"] = elapsed_ms
+        for i, bound in enumerate(ATM_LATENCY_BUCKETS_MS):
+            if elapsed_ms <= bound:
+                stats["histogram"][i] += 1
+                break
+        else:
+            stats["histogram"][-1] += 1
+
+
+def get_atm_endpoint_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    获取各 ATM 接口的调用次数与耗时直方图
+    :return: {path: {"calls", "errors", "total_ms", "avg_ms", "max_ms", "buckets_ms", "histogram"}}
+    """
+    with _atm_stats_lock:
+        result = {}
+        for path, stats in _atm_endpoint_stats.items():
+            one = dict(stats)
+            one["histogram"] = list(stats["histogram"])
+            one["avg_ms"] = stats["total_ms"] / stats["calls"] if stats["calls"] else 0.0
+            one["buckets_ms"] = list(ATM_LATENCY_BUCKETS_MS) + ["+Inf"]
+            result[path] = one
+    return result
+
+
+async def _atm_call_ok(coro):
+    await coro
+    return True
+
+
+async def _atm_set_many(middleware, bucket, items):
+    for key, value in items:
+        await middleware.bucket_set(bucket, key, value)
+    return True
+
+
+def _atm_scoped_key(message, key):
+    sender = str(message.get("user_id", "") or "")
+    return f"{sender}:{key}" if sender else key
+
+
 def _atm_framework_dispatch(path, data):
+    remote = _atm_remote_dispatch
+    if remote is not None:
+        return remote(path, data)
+
     ctx = _atm_get_context()
     if not ctx:
         return None
@@ -1934,144 +4032,269 @@ def _atm_framework_dispatch(path, data):
         return None
 
     p = str(path or "")
-    payload = data or {}
-
-    async def _atm_call_ok(coro):
-        await coro
-        return True
+    handler = _atm_endpoints.get(p)
+    if handler is None:
+        return _atm_response(501, None, "not supported")
 
+    started = time.perf_counter()
+    failed = False
     try:
-        if p == "/getActiveImtypes":
-            adapter_status = middleware.bucket_manager.get_sync("system", "adapter_status", {})
-            active = [name for name in middleware.adapters.keys() if adapter_status.get(name, True)]
-            return _atm_response(data=active)
-
-        if p == "/push":
-            im_type = str(payload.get("imType", "") or "qq")
-            group_code = payload.get("groupCode")
-            user_id = payload.get("userID")
-            title = str(payload.get("title", "") or "")
-            content = str(payload.get("content", "") or "")
-            full = f"{title}\n{content}".strip()
-            if group_code not in (None, "", 0, "0"):
-                _atm_run_async(middleware, middleware.push_to_group(im_type, str(group_code), full), default=False)
-                return _atm_response(data=True)
-            if user_id not in (None, "", 0, "0"):
-                _atm_run_async(middleware, middleware.push_to_user(im_type, str(user_id), full), default=False)
-                return _atm_response(data=True)
-            return _atm_response(400, False, "missing target")
-
-        if p == "/get":
-            key = str(payload.get("key", "") or "")
-            return _atm_response(data=middleware.bucket_manager.get_sync("atm_global", key))
-        if p == "/set":
-            key = str(payload.get("key", "") or "")
-            value = payload.get("value")
-            ok = bool(_atm_run_async(middleware, _atm_call_ok(middleware.bucket_set("atm_global", key, value)), default=False))
-            return _atm_response(data=ok)
-        if p == "/delete":
-            key = str(payload.get("key", "") or "")
-            ok = bool(_atm_run_async(middleware, _atm_call_ok(middleware.bucket_delete("atm_global", key)), default=False))
-            return _atm_response(data=ok)
-
-        if p == "/bucketGet":
-            bucket = str(payload.get("bucket", "") or "")
-            key = str(payload.get("key", "") or "")
-            sender = str(message.get("user_id", "") or "")
-            scoped_key = f"{sender}:{key}" if sender else key
-            val = middleware.bucket_manager.get_sync(bucket, scoped_key, None)
-            if val is None:
-                val = middleware.bucket_manager.get_sync(bucket, key, None)
-            return _atm_response(data=val)
-        if p == "/bucketSet":
-            bucket = str(payload.get("bucket", "") or "")
-            key = str(payload.get("key", "") or "")
-            value = payload.get("value")
-            sender = str(message.get("user_id", "") or "")
-            scoped_key = f"{sender}:{key}" if sender else key
-            ok = bool(_atm_run_async(middleware, _atm_call_ok(middleware.bucket_set(bucket, scoped_key, value)), default=False))
-            return _atm_response(data=ok)
-        if p == "/bucketDel":
-            bucket = str(payload.get("bucket", "") or "")
-            key = str(payload.get("key", "") or "")
-            sender = str(message.get("user_id", "") or "")
-            scoped_key = f"{sender}:{key}" if sender else key
-            ok = bool(_atm_run_async(middleware, _atm_call_ok(middleware.bucket_delete(bucket, scoped_key)), default=False))
-            return _atm_response(data=ok)
-        if p == "/bucketAll":
-            bucket = str(payload.get("bucket", "") or "")
-            data_all = _atm_run_async(middleware, middleware.bucket_manager.get_all(bucket), default={}) or {}
-            return _atm_response(data=data_all)
-        if p == "/bucketAllKeys":
-            bucket = str(payload.get("bucket", "") or "")
-            keys = _atm_run_async(middleware, middleware.bucket_keys(bucket), default=[]) or []
-            return _atm_response(data=keys)
-        if p == "/bucketKeys":
-            bucket = str(payload.get("bucket", "") or "")
-            val = payload.get("value")
-            all_map = _atm_run_async(middleware, middleware.bucket_manager.get_all(bucket), default={}) or {}
-            matched = [k for k, v in all_map.items() if v == val]
-            return _atm_response(data=matched)
-
-        if p == "/notifyMasters":
-            content = str(payload.get("content", "") or "")
-            imtypes = payload.get("imtypes") or []
-            platforms = ",".join([str(x) for x in imtypes if str(x).strip()]) if isinstance(imtypes, list) and imtypes else "qq"
-            _atm_run_async(middleware, middleware.notify_admin(content, platforms=platforms), default=None)
-            return _atm_response(data=True)
-
-        if p == "/getImtype":
-            return _atm_response(data=str(message.get("platform", "") or ""))
-        if p == "/getUserID":
-            return _atm_response(data=str(message.get("user_id", "") or ""))
-        if p == "/getUserName":
-            return _atm_response(data=str(message.get("nickname", "") or message.get("user_name", "") or message.get("user_id", "") or ""))
-        if p == "/getUserAvatarUrl":
-            return _atm_response(data=str(message.get("avatar", "") or message.get("avatar_url", "") or ""))
-        if p == "/getChatID":
-            gid = message.get("group_id")
-            return _atm_response(data=str(gid if gid not in (None, "", 0, "0") else message.get("user_id", "")))
-        if p == "/getChatName":
-            return _atm_response(data=str(message.get("group_name", "") or ""))
-        if p == "/isAdmin":
-            uid = message.get("user_id")
-            is_admin = _atm_run_async(middleware, middleware.is_admin(uid), default=False)
-            return _atm_response(data=bool(is_admin))
-        if p == "/getMessage":
-            return _atm_response(data=str(message.get("content", "") or ""))
-        if p == "/getMessageID":
-            return _atm_response(data=message.get("message_id"))
-        if p == "/recallMessage":
-            msgid = payload.get("messageid")
-            recall_payload = {"platform": message.get("platform"), "message_id": msgid}
-            ok = _atm_run_async(middleware, middleware.recall_message(recall_payload), default=False)
-            return _atm_response(data=bool(ok))
-        if p in ("/sendText", "/response"):
-            text = str(payload.get("text", "") or payload.get("data", "") or "")
-            _atm_run_async(middleware, middleware.send_response(message, {"content": text}), default=None)
-            return _atm_response(data=True)
-        if p == "/sendImage":
-            image_url = str(payload.get("imageurl", "") or "")
-            _atm_run_async(middleware, middleware.reply_with_image(message, image_url), default=None)
-            return _atm_response(data=True)
-        if p == "/sendVoice":
-            voice_url = str(payload.get("voiceurl", "") or "")
-            cq = f"[CQ:record,file={voice_url}]"
-            _atm_run_async(middleware, middleware.send_response(message, {"content": cq}), default=None)
-            return _atm_response(data=True)
-        if p == "/sendVideo":
-            video_url = str(payload.get("videourl", "") or "")
-            _atm_run_async(middleware, middleware.reply_with_video(message, video_url), default=None)
-            return _atm_response(data=True)
-        if p in ("/listen", "/input"):
-            timeout = int(payload.get("timeout", 60000) or 60000)
-            content = _atm_run_async(middleware, middleware.wait_for_input(message, timeout), default=None)
-            return _atm_response(data=content)
+        return handler(middleware, message, data or {})
     except Exception as e:
+        failed = True
         try:
             middleware.logger.error(f"atm compat dispatch failed path={p}: {e}")
         except Exception:
             pass
         return _atm_response(500, None, str(e))
+    finally:
+        _atm_record_call(p, time.perf_counter() - started, failed)
+
+
+@atm_endpoint("/getActiveImtypes")
+def _atm_get_active_imtypes(middleware, message, payload):
+    adapter_status = middleware.bucket_manager.get_sync("system", "adapter_status", {})
+    active = [name for name in middleware.adapters.keys() if adapter_status.get(name, True)]
+    return _atm_response(data=active)
+
+
+@atm_endpoint("/push")
+def _atm_push(middleware, message, payload):
+    im_type = str(payload.get("imType", "") or "qq")
+    group_code = payload.get("groupCode")
+    user_id = payload.get("userID")
+    title = str(payload.get("title", "") or "")
+    content = str(payload.get("content", "") or "")
+    full = f"{title}\n{content}".strip()
+    if group_code not in (None, "", 0, "0"):
+        _atm_run_async(middleware, middleware.push_to_group(im_type, str(group_code), full), default=False)
+        return _atm_response(data=True)
+    if user_id not in (None, "", 0, "0"):
+        _atm_run_async(middleware, middleware.push_to_user(im_type, str(user_id), full), default=False)
+        return _atm_response(data=True)
+    return _atm_response(400, False, "missing target")
+
+
+@atm_endpoint("/get")
+def _atm_get(middleware, message, payload):
+    key = str(payload.get("key", "") or "")
+    return _atm_response(data=middleware.bucket_manager.get_sync("atm_global", key))
+
+
+@atm_endpoint("/set")
+def _atm_set(middleware, message, payload):
+    key = str(payload.get("key", "") or "")
+    value = payload.get("value")
+    ok = bool(_atm_run_async(middleware, _atm_call_ok(middleware.bucket_set("atm_global", key, value)), default=False))
+    return _atm_response(data=ok)
+
+
+@atm_endpoint("/delete")
+def _atm_delete(middleware, message, payload):
+    key = str(payload.get("key", "") or "")
+    ok = bool(_atm_run_async(middleware, _atm_call_ok(middleware.bucket_delete("atm_global", key)), default=False))
+    return _atm_response(data=ok)
+
+
+@atm_endpoint("/bucketGet")
+def _atm_bucket_get(middleware, message, payload):
+    bucket = str(payload.get("bucket", "") or "")
+    key = str(payload.get("key", "") or "")
+    val = middleware.bucket_manager.get_sync(bucket, _atm_scoped_key(message, key), None)
+    if val is None:
+        val = middleware.bucket_manager.get_sync(bucket, key, None)
+    return _atm_response(data=val)
+
+
+@atm_endpoint("/bucketSet")
+def _atm_bucket_set(middleware, message, payload):
+    bucket = str(payload.get("bucket", "") or "")
+    key = str(payload.get("key", "") or "")
+    value = payload.get("value")
+    scoped_key = _atm_scoped_key(message, key)
+    ok = bool(_atm_run_async(middleware, _atm_call_ok(middleware.bucket_set(bucket, scoped_key, value)), default=False))
+    return _atm_response(data=ok)
+
+
+@atm_endpoint("/bucketDel")
+def _atm_bucket_del(middleware, message, payload):
+    bucket = str(payload.get("bucket", "") or "")
+    key = str(payload.get("key", "") or "")
+    scoped_key = _atm_scoped_key(message, key)
+    ok = bool(_atm_run_async(middleware, _atm_call_ok(middleware.bucket_delete(bucket, scoped_key)), default=False))
+    return _atm_response(data=ok)
+
+
+@atm_endpoint("/bucketMultiGet")
+def _atm_bucket_multi_get(middleware, message, payload):
+    bucket = str(payload.get("bucket", "") or "")
+    keys = payload.get("keys") or []
+    values = {}
+    for key in keys:
+        key = str(key or "")
+        val = middleware.bucket_manager.get_sync(bucket, _atm_scoped_key(message, key), None)
+        if val is None:
+            val = middleware.bucket_manager.get_sync(bucket, key, None)
+        values[key] = val
+    return _atm_response(data=values)
+
+
+@atm_endpoint("/bucketMultiSet")
+def _atm_bucket_multi_set(middleware, message, payload):
+    bucket = str(payload.get("bucket", "") or "")
+    values = payload.get("values") or {}
+    items = [(_atm_scoped_key(message, str(key)), value) for key, value in values.items()]
+    ok = bool(_atm_run_async(middleware, _atm_set_many(middleware, bucket, items), default=False))
+    return _atm_response(data=ok)
+
+
+@atm_endpoint("/bucketAll")
+def _atm_bucket_all(middleware, message, payload):
+    bucket = str(payload.get("bucket", "") or "")
+    data_all = _atm_run_async(middleware, middleware.bucket_manager.get_all(bucket), default={}) or {}
+    return _atm_response(data=data_all)
+
+
+@atm_endpoint("/bucketAllKeys")
+def _atm_bucket_all_keys(middleware, message, payload):
+    bucket = str(payload.get("bucket", "") or "")
+    keys = _atm_run_async(middleware, middleware.bucket_keys(bucket), default=[]) or []
+    return _atm_response(data=keys)
+
+
+@atm_endpoint("/bucketAllPage")
+def _atm_bucket_all_page(middleware, message, payload):
+    bucket = str(payload.get("bucket", "") or "")
+    page = _atm_run_async(
+        middleware,
+        middleware.bucket_items_page(bucket, payload.get("cursor"), payload.get("limit", 100)),
+        default=None
+    ) or {"items": {}, "next": None}
+    return _atm_response(data=page)
+
+
+@atm_endpoint("/bucketKeys")
+def _atm_bucket_keys(middleware, message, payload):
+    bucket = str(payload.get("bucket", "") or "")
+    val = payload.get("value")
+    matched = _atm_run_async(middleware, middleware.bucket_keys_by_value(bucket, val), default=[]) or []
+    return _atm_response(data=matched)
+
 
-    return _atm_response(501, None, "not supported")
+@atm_endpoint("/notifyMasters")
+def _atm_notify_masters(middleware, message, payload):
+    content = str(payload.get("content", "") or "")
+    imtypes = payload.get("imtypes") or []
+    platforms = ",".join([str(x) for x in imtypes if str(x).strip()]) if isinstance(imtypes, list) and imtypes else "qq"
+    _atm_run_async(middleware, middleware.notify_admin(content, platforms=platforms), default=None)
+    return _atm_response(data=True)
+
+
+@atm_endpoint("/getImtype")
+def _atm_get_imtype(middleware, message, payload):
+    return _atm_response(data=str(message.get("platform", "") or ""))
+
+
+@atm_endpoint("/getUserID")
+def _atm_get_user_id(middleware, message, payload):
+    return _atm_response(data=str(message.get("user_id", "") or ""))
+
+
+@atm_endpoint("/getUserName")
+def _atm_get_user_name(middleware, message, payload):
+    return _atm_response(data=str(message.get("nickname", "") or message.get("user_name", "") or message.get("user_id", "") or ""))
+
+
+@atm_endpoint("/getUserAvatarUrl")
+def _atm_get_user_avatar_url(middleware, message, payload):
+    return _atm_response(data=str(message.get("avatar", "") or message.get("avatar_url", "") or ""))
+
+
+@atm_endpoint("/getChatID")
+def _atm_get_chat_id(middleware, message, payload):
+    gid = message.get("group_id")
+    return _atm_response(data=str(gid if gid not in (None, "", 0, "0") else message.get("user_id", "")))
+
+
+@atm_endpoint("/getChatName")
+def _atm_get_chat_name(middleware, message, payload):
+    return _atm_response(data=str(message.get("group_name", "") or ""))
+
+
+@atm_endpoint("/isAdmin")
+def _atm_is_admin(middleware, message, payload):
+    uid = message.get("user_id")
+    is_admin = _atm_run_async(middleware, middleware.is_admin(uid), default=False)
+    return _atm_response(data=bool(is_admin))
+
+
+@atm_endpoint("/getMessage")
+def _atm_get_message(middleware, message, payload):
+    return _atm_response(data=str(message.get("content", "") or ""))
+
+
+@atm_endpoint("/getMessageID")
+def _atm_get_message_id(middleware, message, payload):
+    return _atm_response(data=message.get("message_id"))
+
+
+@atm_endpoint("/recallMessage")
+def _atm_recall_message(middleware, message, payload):
+    msgid = payload.get("messageid")
+    recall_payload = {"platform": message.get("platform"), "message_id": msgid}
+    ok = _atm_run_async(middleware, middleware.recall_message(recall_payload), default=False)
+    return _atm_response(data=bool(ok))
+
+
+@atm_endpoint("/sendText", "/response")
+def _atm_send_text(middleware, message, payload):
+    text = str(payload.get("text", "") or payload.get("data", "") or "")
+    _atm_run_async(middleware, middleware.send_response(message, {"content": text}), default=None)
+    return _atm_response(data=True)
+
+
+@atm_endpoint("/sendImage")
+def _atm_send_image(middleware, message, payload):
+    image_url = str(payload.get("imageurl", "") or "")
+    _atm_run_async(middleware, middleware.reply_with_image(message, image_url), default=None)
+    return _atm_response(data=True)
+
+
+@atm_endpoint("/sendVoice")
+def _atm_send_voice(middleware, message, payload):
+    voice_url = str(payload.get("voiceurl", "") or "")
+    cq = f"[CQ:record,file={voice_url}]"
+    _atm_run_async(middleware, middleware.send_response(message, {"content": cq}), default=None)
+    return _atm_response(data=True)
+
+
+@atm_endpoint("/sendVideo")
+def _atm_send_video(middleware, message, payload):
+    video_url = str(payload.get("videourl", "") or "")
+    _atm_run_async(middleware, middleware.reply_with_video(message, video_url), default=None)
+    return _atm_response(data=True)
+
+
+@atm_endpoint("/listen", "/input")
+def _atm_listen(middleware, message, payload):
+    timeout = int(payload.get("timeout", 60000) or 60000)
+    for_group = bool(payload.get("forGroup", False))
+    reply = _atm_run_async(
+        middleware,
+        middleware.wait_for_input(message, timeout, for_group=for_group, return_message=True),
+        default=None,
+        timeout=timeout / 1000.0 + 5
+    )
+    if not reply:
+        return _atm_response(data=None)
+    # recallDuration（毫秒）大于 0 时，到期撤回用户的这条输入
+    try:
+        recall_ms = int(payload.get("recallDuration", 0) or 0)
+    except (TypeError, ValueError):
+        recall_ms = 0
+    if recall_ms > 0 and reply.get("message_id") and reply.get("platform"):
+        loop = middleware.main_loop
+        if loop is not None and loop.is_running():
+            loop.call_soon_threadsafe(middleware.recall_scheduler.schedule,
+                                      reply["platform"], reply["message_id"], recall_ms / 1000.0)
+    return _atm_response(data=reply.get("content"))
@@ -6,6 +6,7 @@ from containers.qinglong_client import QinglongClient
 from containers.qinglong import QinglongContainer
 from utils.logger import get_logger
 import asyncio
+from functools import partial
 from middleware.middleware import Middleware
 
 __description__ = "通过聊天指令与青龙面板交互，并接收通知,通知功能，底部看指令，使用指令ql notify开启通知，可以多用户渠道，ql filter title，添加白名单，例如青龙调用notify.py,notify.send(title,'内容')"
@@ -201,17 +202,21 @@ async def handle_webhook(title, content):
         logger.warning("收到青龙通知，但未配置任何通知目标。请在群组或私聊中使用 'ql notify' 开启通知。")
         return False
 
+    jobs = []
     for target in targets:
-        try:
-            # 构造消息内容
-            msg_content = f"【青龙通知】{title}\n{content}"
-            msg_content += f"\n\n此消息来自 {target['platform']} {target['target_id']}"
-            if '_group' in target['platform']:
-                await mw.push_to_group(target['platform'].replace("_group",""), target['target_id'], msg_content)
-            else:
-                await mw.push_to_user(target['platform'], target['target_id'], msg_content)
-        except Exception as e:
-            logger.error(f"发送通知到 {target} 失败: {e}")
+        # 构造消息内容
+        msg_content = f"【青龙通知】{title}\n{content}"
+        msg_content += f"\n\n此消息来自 {target['platform']} {target['target_id']}"
+        if '_group' in target['platform']:
+            send = partial(mw.push_to_group, target['platform'].replace("_group",""), target['target_id'], msg_content)
+        else:
+            send = partial(mw.push_to_user, target['platform'], target['target_id'], msg_content)
+        jobs.append((target, send))
+
+    # 所有通知目标并发推送
+    for result in await mw.fan_out(jobs):
+        if not result["ok"]:
+            logger.error(f"发送通知到 {result['target']} 失败: {result['error'] or '推送未成功'}")
     return True
 
 # 定义规则
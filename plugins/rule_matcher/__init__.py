@@ -0,0 +1,208 @@
+"""
+多模式规则匹配器。
+把一批规则编译为哈希表、前缀表与 Aho-Corasick 自动机，每条消息只运行预筛后的候选正则。
+本模块只依赖标准库，可供规则引擎使用，也可单独运行基准（benchmarks/rule_matcher_bench.py）。
+"""
+import re
+from collections import deque
+from typing import Any, Dict, List
+
+try:
+    from re import _parser as _sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse as _sre_parse
+
+
+class _AhoCorasick:
+    """Aho-Corasick 自动机：一次扫描文本找出所有出现的关键词，返回关键词对应的载荷"""
+    __slots__ = ("goto", "fail", "out")
+
+    def __init__(self, words: Dict[str, List[int]]):
+        goto: List[Dict[str, int]] = [{}]
+        out: List[List[int]] = [[]]
+        for word, payload in words.items():
+            node = 0
+            for ch in word:
+                nxt = goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[node][ch] = nxt
+                    goto.append({})
+                    out.append([])
+                node = nxt
+            out[node].extend(payload)
+
+        fail = [0] * len(goto)
+        pending = deque(goto[0].values())
+        while pending:
+            node = pending.popleft()
+            for ch, nxt in goto[node].items():
+                pending.append(nxt)
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                target = goto[f].get(ch, 0)
+                fail[nxt] = target if target != nxt else 0
+                if out[fail[nxt]]:
+                    out[nxt] = out[nxt] + out[fail[nxt]]
+        self.goto, self.fail, self.out = goto, fail, out
+
+    def search(self, text: str) -> set:
+        goto, fail, out = self.goto, self.fail, self.out
+        found = set()
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                found.update(out[node])
+        return found
+
+
+class RuleMatcher:
+    """
+    多模式规则匹配器，所有规则编译为一组匹配结构，每条消息只运行候选正则：
+    - exact / fullmatch（不含正则元字符）：哈希表
+    - keyword：Aho-Corasick 自动机，一次扫描命中全部关键词
+    - regex：提取必需的字面量前缀做预筛，^ 锚定的按前缀查表，未锚定的前缀放进自动机，
+      提取不到字面量（含 (?i)、分支等）的每次都运行
+    结果按优先级降序、同优先级按注册顺序排列。
+    规则对象只需有 name / pattern / rule_type / priority 属性；增删后在下一次 match 时整体重建一次。
+    """
+    EXACT_TYPES = ("exact", "fullmatch")
+
+    def __init__(self):
+        self._rules: Dict[str, Any] = {}
+        self._dirty = False
+        self._ordered: List[Any] = []
+        self._exact: Dict[str, List[int]] = {}
+        self._anchored: Dict[str, List[int]] = {}
+        self._anchored_lengths: List[int] = []
+        self._automaton = None
+        self._always: List[int] = []
+        self._regexes: Dict[int, Any] = {}
+        self.invalid: Dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._rules)
+
+    def add_rules(self, rules):
+        for rule in rules:
+            self._rules.pop(rule.name, None)
+            self._rules[rule.name] = rule
+        self._dirty = True
+
+    def remove_rules(self, names):
+        for name in names:
+            self._rules.pop(name, None)
+        self._dirty = True
+
+    def clear(self):
+        self._rules.clear()
+        self._dirty = True
+
+    @staticmethod
+    def literal_prefix(pattern: str):
+        """
+        返回 (前缀, 是否 ^ 锚定)。前缀是任何匹配都必须以之开头的字面量，提取不到时为空串。
+        """
+        try:
+            parsed = _sre_parse.parse(pattern)
+            state = getattr(parsed, "state", None) or parsed.pattern
+            flags = state.flags
+        except Exception:
+            return "", False
+        if flags & (re.IGNORECASE | re.VERBOSE):
+            return "", False
+        items = list(parsed)
+        anchored = False
+        if items and items[0][0] == _sre_parse.AT:
+            where = items[0][1]
+            if where == _sre_parse.AT_BEGINNING_STRING or (where == _sre_parse.AT_BEGINNING and not flags & re.MULTILINE):
+                anchored = True
+                items = items[1:]
+            else:
+                return "", False
+        chars = []
+        for op, arg in items:
+            if op != _sre_parse.LITERAL:
+                break
+            chars.append(chr(arg))
+        return "".join(chars), anchored
+
+    def _rebuild(self):
+        rules = list(self._rules.values())
+        # 稳定排序：优先级降序，同优先级保持注册顺序；下标即结果顺序
+        rules.sort(key=lambda r: -(getattr(r, "priority", 0) or 0))
+        exact: Dict[str, List[int]] = {}
+        anchored: Dict[str, List[int]] = {}
+        words: Dict[str, List[int]] = {}
+        always: List[int] = []
+        regexes: Dict[int, Any] = {}
+        invalid: Dict[str, str] = {}
+        for idx, rule in enumerate(rules):
+            pattern = str(getattr(rule, "pattern", "") or "")
+            rule_type = getattr(rule, "rule_type", "regex") or "regex"
+            if rule_type == "keyword":
+                if pattern:
+                    words.setdefault(pattern, []).append(idx)
+                else:
+                    always.append(idx)
+                continue
+            if rule_type in self.EXACT_TYPES and re.escape(pattern) == pattern:
+                exact.setdefault(pattern, []).append(idx)
+                continue
+            try:
+                compiled = re.compile(pattern)
+            except re.error as e:
+                invalid[rule.name] = str(e)
+                continue
+            regexes[idx] = compiled.fullmatch if rule_type in self.EXACT_TYPES else compiled.search
+            prefix, is_anchored = self.literal_prefix(pattern)
+            if not prefix:
+                always.append(idx)
+            elif is_anchored:
+                anchored.setdefault(prefix, []).append(idx)
+            else:
+                words.setdefault(prefix, []).append(idx)
+
+        self._ordered = rules
+        self._exact = exact
+        self._anchored = anchored
+        self._anchored_lengths = sorted({len(p) for p in anchored})
+        self._automaton = _AhoCorasick(words) if words else None
+        self._always = always
+        self._regexes = regexes
+        self.invalid = invalid
+        self._dirty = False
+
+    def candidates(self, text: str) -> set:
+        """预筛后的候选规则下标（关键词与 exact 已确定命中，正则仍需验证）"""
+        if self._dirty:
+            self._rebuild()
+        found = set(self._always)
+        hit = self._exact.get(text)
+        if hit:
+            found.update(hit)
+        for length in self._anchored_lengths:
+            if length > len(text):
+                break
+            hit = self._anchored.get(text[:length])
+            if hit:
+                found.update(hit)
+        if self._automaton is not None:
+            found |= self._automaton.search(text)
+        return found
+
+    def match(self, text: str) -> List[Any]:
+        """返回命中的规则（优先级降序）"""
+        text = text or ""
+        found = self.candidates(text)
+        matched = []
+        regexes, ordered = self._regexes, self._ordered
+        for idx in sorted(found):
+            check = regexes.get(idx)
+            if check is None or check(text):
+                matched.append(ordered[idx])
+        return matched